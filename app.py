@@ -1,4 +1,6 @@
 import copy
+from datetime import datetime
+import functools
 import json
 import os
 import logging
@@ -8,6 +10,10 @@ import asyncio
 import shutil
 import time
 import hashlib
+import math
+import base64
+import binascii
+from urllib.parse import urlparse
 from quart import (
     Blueprint,
     Quart,
@@ -18,30 +24,79 @@ from quart import (
     render_template,
     current_app,
 )
+from quart.json.provider import DefaultJSONProvider
 
 from openai import AsyncAzureOpenAI
-from azure.identity.aio import (
-    DefaultAzureCredential,
-    get_bearer_token_provider
+from azure.identity.aio import DefaultAzureCredential
+from backend.aoai.admission import AdmissionController, estimate_request_tokens
+from backend.aoai.client import CachedTokenProvider, create_pooled_http_client
+from backend.aoai.load_balancer import DeploymentBackend, DeploymentPool
+from backend.aoai.tools import (
+    AzureFunctionsToolExecutor,
+    AzureFunctionsToolLoader,
+    EMPTY_TOOL_REGISTRY
 )
 from backend.auth.auth_utils import get_authenticated_user_details
+from backend.concurrency import RequestCoalescer
+from backend.cache.ttl_cache import TTLCache
+from backend.cache.response_cache import (
+    FileResponseCacheStore,
+    InMemoryResponseCacheStore,
+    ResponseCache,
+    make_cache_key,
+    record_stream,
+    replay_stream,
+    restore_response,
+    strip_response_metadata
+)
+from backend.cache.semantic_cache import (
+    AzureOpenAIEmbedder,
+    HashingEmbedder,
+    IndexVersionFile,
+    SemanticResponseCache,
+    datasource_fingerprint
+)
 from backend.security.ms_defender_utils import get_msdefender_user_json
+from backend.history.context_window import ConversationHistoryWindow, SUMMARY_PREFIX
 from backend.history.cosmosdbservice import CosmosConversationClient
+from backend.history.sqliteservice import SQLiteConversationStore
+from backend.history.jobs import HistoryJobRegistry, InMemoryHistoryJobStore, SQLiteHistoryJobStore
+from backend.history.list_cache import (
+    ConversationListCache,
+    InMemoryConversationListStore,
+    ListCachingConversationClient,
+    SQLiteConversationListStore
+)
+from backend.history.pipeline import HistoryWriteStats, PipelinedWrite
+from backend.streaming import (
+    SSEStreamRegistry,
+    coalesce_stream,
+    format_as_sse,
+    hold_last_frame,
+    parse_last_event_id,
+    send_envelope_once,
+    stream_after
+)
 from backend.settings import (
     app_settings,
     MINIMUM_SUPPORTED_AZURE_OPENAI_PREVIEW_API_VERSION
 )
+from backend.tokens import get_context_window
 from backend.utils import (
     format_as_ndjson,
     format_stream_response,
     format_non_streaming_response,
     convert_to_pf_format,
     format_pf_non_streaming_response,
+    json_dumps,
+    json_loads,
+    RedactedJSON,
 )
 
 bp = Blueprint("routes", __name__, static_folder="static", template_folder="static")
 
 cosmos_db_ready = asyncio.Event()
+openai_client_lock = asyncio.Lock()
 
 # Setup enhanced logging for CosmosDB debugging
 DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
@@ -52,8 +107,31 @@ logging.basicConfig(
 logger = logging.getLogger("app")
 
 
+class FastJSONProvider(DefaultJSONProvider):
+    """Serves jsonify and request.get_json with the fast JSON functions."""
+
+    def dumps(self, obj, **kwargs):
+        # output is always compact; indented output (debug mode) uses the default
+        kwargs.pop("separators", None)
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+
+        return json_dumps(obj, default=self.default)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+
+        return json_loads(s)
+
+
+def json_body_response(body: str, status_code: int = 200):
+    return current_app.response_class(body, status=status_code, mimetype="application/json")
+
+
 def create_app():
     app = Quart(__name__)
+    app.json = FastJSONProvider(app)
     app.register_blueprint(bp)
     app.config["TEMPLATES_AUTO_RELOAD"] = True
     
@@ -61,7 +139,10 @@ def create_app():
     logger.info(f"Debug mode: {DEBUG}")
     logger.info(f"Chat history enabled: {app_settings.chat_history is not None}")
     
-    if app_settings.chat_history:
+    if app_settings.chat_history and app_settings.chat_history.backend == "sqlite":
+        logger.info(f"SQLite chat history database: {app_settings.chat_history.sqlite_path}")
+        logger.info(f"Feedback enabled: {app_settings.chat_history.enable_feedback}")
+    elif app_settings.chat_history:
         logger.info(f"CosmosDB account: {app_settings.chat_history.account}")
         logger.info(f"CosmosDB database: {app_settings.chat_history.database}")
         logger.info(f"CosmosDB container: {app_settings.chat_history.conversations_container}")
@@ -71,9 +152,35 @@ def create_app():
     
     @app.before_serving
     async def init():
+        app.azure_openai_client = None
+        app.azure_openai_token_provider = None
+        app.azure_functions_tool_loader = await init_azure_functions_tool_loader()
+        app.azure_functions_tool_executor = init_azure_functions_tool_executor()
+        app.history_window = init_history_window()
+        app.response_cache = init_response_cache()
+        app.index_version_file = init_index_version_file()
+        app.semantic_cache = init_semantic_cache()
+        app.request_coalescer = init_request_coalescer()
+        app.admission_controller = init_admission_controller()
+        app.frontend_settings_response = init_frontend_settings_response()
+        try:
+            logger.info("Initializing Azure OpenAI client...")
+            (
+                app.azure_openai_client,
+                app.azure_openai_token_provider
+            ) = await init_openai_client()
+        except Exception as e:
+            # requests will retry the initialization and surface the error
+            logger.error(f"Failed to initialize Azure OpenAI client: {str(e)}")
+        (
+            app.azure_openai_pool,
+            app.azure_openai_pool_token_provider
+        ) = await init_openai_deployment_pool()
+
         try:
             logger.info("Initializing CosmosDB client...")
             app.cosmos_conversation_client = await init_cosmosdb_client()
+            app.history_list_cache = getattr(app.cosmos_conversation_client, "list_cache", None)
             if app.cosmos_conversation_client:
                 logger.info("CosmosDB client initialized successfully")
                 cosmos_db_ready.set()
@@ -141,14 +248,41 @@ def create_app():
     @app.after_serving
     async def cleanup():
         logger.info("Application shutdown - cleaning up resources...")
+
+        if getattr(app, "azure_functions_tool_loader", None):
+            await app.azure_functions_tool_loader.close()
+        if getattr(app, "azure_functions_tool_executor", None):
+            await app.azure_functions_tool_executor.close()
+        if app_settings.datasource:
+            await app_settings.datasource.close()
+        if getattr(app, "response_cache", None):
+            await app.response_cache.close()
+        if getattr(app, "history_jobs", None):
+            await app.history_jobs.close()
+
+        # Close the shared Azure OpenAI client and its credential
+        if getattr(app, "azure_openai_client", None):
+            try:
+                logger.info("Closing Azure OpenAI client...")
+                await app.azure_openai_client.close()
+            except Exception as e:
+                logger.error(f"Error closing Azure OpenAI client: {str(e)}")
+        if getattr(app, "azure_openai_token_provider", None):
+            try:
+                await app.azure_openai_token_provider.close()
+            except Exception as e:
+                logger.error(f"Error closing Azure OpenAI credential: {str(e)}")
+        if getattr(app, "azure_openai_pool", None):
+            await app.azure_openai_pool.close()
+        if getattr(app, "azure_openai_pool_token_provider", None):
+            await app.azure_openai_pool_token_provider.close()
         
         # Close CosmosDB client if it exists
         if hasattr(app, 'cosmos_conversation_client') and app.cosmos_conversation_client:
             try:
                 logger.info("Closing CosmosDB client connection...")
-                if hasattr(app.cosmos_conversation_client, 'cosmosdb_client'):
-                    await app.cosmos_conversation_client.cosmosdb_client.close()
-                    logger.info("CosmosDB client closed successfully")
+                await app.cosmos_conversation_client.close()
+                logger.info("CosmosDB client closed successfully")
             except Exception as e:
                 logger.error(f"Error closing CosmosDB client: {str(e)}")
         
@@ -251,6 +385,11 @@ async def serve_site_pdfs(path):
 # Debug settings
 USER_AGENT = "GitHubSampleWebApp/AsyncAzureOpenAI/1.0.0"
 
+PROVISIONAL_TITLE_MAX_LENGTH = 50
+
+# Tasks that outlive the request that started them
+background_tasks = set()
+
 
 # Frontend Settings via Environment Variables
 frontend_settings = {
@@ -277,12 +416,10 @@ frontend_settings = {
 MS_DEFENDER_ENABLED = os.environ.get("MS_DEFENDER_ENABLED", "true").lower() == "true"
 
 
-azure_openai_tools = []
-azure_openai_available_tools = []
-
 # Initialize Azure OpenAI Client
 async def init_openai_client():
     azure_openai_client = None
+    ad_token_provider = None
     
     try:
         # API version check
@@ -311,14 +448,14 @@ async def init_openai_client():
 
         # Authentication
         aoai_api_key = app_settings.azure_openai.key
-        ad_token_provider = None
         if not aoai_api_key:
             logging.debug("No AZURE_OPENAI_KEY found, using Azure Entra ID auth")
-            async with DefaultAzureCredential() as credential:
-                ad_token_provider = get_bearer_token_provider(
-                    credential,
-                    "https://cognitiveservices.azure.com/.default"
-                )
+            # The credential stays open for the lifetime of the client so
+            # tokens are cached and refreshed instead of re-acquired per request
+            ad_token_provider = CachedTokenProvider(
+                DefaultAzureCredential(),
+                "https://cognitiveservices.azure.com/.default"
+            )
 
         # Deployment
         deployment = app_settings.azure_openai.model
@@ -328,55 +465,410 @@ async def init_openai_client():
         # Default Headers
         default_headers = {"x-ms-useragent": USER_AGENT}
 
-        # Remote function calls
-        if app_settings.azure_openai.function_call_azure_functions_enabled:
-            azure_functions_tools_url = f"{app_settings.azure_openai.function_call_azure_functions_tools_base_url}?code={app_settings.azure_openai.function_call_azure_functions_tools_key}"
-            async with httpx.AsyncClient() as client:
-                response = await client.get(azure_functions_tools_url)
-            response_status_code = response.status_code
-            if response_status_code == httpx.codes.OK:
-                azure_openai_tools.extend(json.loads(response.text))
-                for tool in azure_openai_tools:
-                    azure_openai_available_tools.append(tool["function"]["name"])
-            else:
-                logging.error(f"An error occurred while getting OpenAI Function Call tools metadata: {response.status_code}")
-
-        
         azure_openai_client = AsyncAzureOpenAI(
             api_version=app_settings.azure_openai.preview_api_version,
             api_key=aoai_api_key,
             azure_ad_token_provider=ad_token_provider,
             default_headers=default_headers,
             azure_endpoint=endpoint,
+            http_client=create_pooled_http_client(
+                max_connections=app_settings.azure_openai.max_connections,
+                max_keepalive_connections=app_settings.azure_openai.max_keepalive_connections,
+                keepalive_expiry=app_settings.azure_openai.keepalive_expiry,
+            ),
         )
 
-        return azure_openai_client
+        return azure_openai_client, ad_token_provider
     except Exception as e:
-        logging.exception("Exception in Azure OpenAI initialization", e)
+        logging.exception("Exception in Azure OpenAI initialization")
+        if ad_token_provider:
+            await ad_token_provider.close()
         azure_openai_client = None
         raise e
 
-async def openai_remote_azure_function_call(function_name, function_args):
+
+async def get_openai_client():
+    # The client is normally created once in before_serving; if that failed
+    # (or the app is used without the serving hooks) initialize it on demand.
+    if getattr(current_app, "azure_openai_client", None):
+        return current_app.azure_openai_client
+
+    async with openai_client_lock:
+        if not getattr(current_app, "azure_openai_client", None):
+            (
+                current_app.azure_openai_client,
+                current_app.azure_openai_token_provider
+            ) = await init_openai_client()
+
+    return current_app.azure_openai_client
+
+async def init_openai_deployment_pool():
+    deployments = app_settings.azure_openai.deployments
+    if not deployments:
+        return None, None
+
+    ad_token_provider = None
+    if any(not deployment.key for deployment in deployments):
+        ad_token_provider = CachedTokenProvider(
+            DefaultAzureCredential(),
+            "https://cognitiveservices.azure.com/.default"
+        )
+
+    backends = []
+    for deployment in deployments:
+        client = AsyncAzureOpenAI(
+            api_version=app_settings.azure_openai.preview_api_version,
+            api_key=deployment.key,
+            azure_ad_token_provider=None if deployment.key else ad_token_provider,
+            default_headers={"x-ms-useragent": USER_AGENT},
+            azure_endpoint=deployment.endpoint,
+            # the pool fails over to another deployment instead of retrying
+            max_retries=0,
+            http_client=create_pooled_http_client(
+                max_connections=app_settings.azure_openai.max_connections,
+                max_keepalive_connections=app_settings.azure_openai.max_keepalive_connections,
+                keepalive_expiry=app_settings.azure_openai.keepalive_expiry,
+            ),
+        )
+        backends.append(
+            DeploymentBackend(
+                deployment.name or f"{urlparse(deployment.endpoint).hostname}/{deployment.deployment}",
+                client,
+                deployment.deployment,
+                weight=deployment.weight,
+                priority=deployment.priority,
+            )
+        )
+
+    logging.info(f"Routing chat completions across {len(backends)} Azure OpenAI deployments")
+    deployment_pool = DeploymentPool(
+        backends,
+        failure_threshold=app_settings.azure_openai.deployment_failure_threshold,
+        circuit_open_seconds=app_settings.azure_openai.deployment_circuit_open_seconds,
+        default_cooldown_seconds=app_settings.azure_openai.deployment_default_cooldown_seconds,
+    )
+    return deployment_pool, ad_token_provider
+
+
+async def get_openai_deployment_pool():
+    if not app_settings.azure_openai.deployments:
+        return None
+
+    if getattr(current_app, "azure_openai_pool", None):
+        return current_app.azure_openai_pool
+
+    async with openai_client_lock:
+        if not getattr(current_app, "azure_openai_pool", None):
+            (
+                current_app.azure_openai_pool,
+                current_app.azure_openai_pool_token_provider
+            ) = await init_openai_deployment_pool()
+
+    return current_app.azure_openai_pool
+
+
+async def init_azure_functions_tool_loader():
+    if not app_settings.azure_openai.function_call_azure_functions_enabled:
+        return None
+
+    azure_functions_tools_url = f"{app_settings.azure_openai.function_call_azure_functions_tools_base_url}?code={app_settings.azure_openai.function_call_azure_functions_tools_key}"
+    tool_loader = AzureFunctionsToolLoader(
+        azure_functions_tools_url,
+        refresh_interval_seconds=app_settings.azure_openai.function_call_azure_functions_tools_refresh_interval,
+    )
+    await tool_loader.load()
+    tool_loader.start_refresh()
+    return tool_loader
+
+
+def get_tool_registry():
+    tool_loader = getattr(current_app, "azure_functions_tool_loader", None)
+    if not tool_loader:
+        return EMPTY_TOOL_REGISTRY
+
+    return tool_loader.registry
+
+
+def init_azure_functions_tool_executor():
+    if not app_settings.azure_openai.function_call_azure_functions_enabled:
+        return None
+
+    azure_functions_tool_url = f"{app_settings.azure_openai.function_call_azure_functions_tool_base_url}?code={app_settings.azure_openai.function_call_azure_functions_tool_key}"
+    return AzureFunctionsToolExecutor(
+        azure_functions_tool_url,
+        timeout_seconds=app_settings.azure_openai.function_call_azure_functions_tool_timeout,
+        max_concurrency=app_settings.azure_openai.function_call_azure_functions_max_concurrency,
+    )
+
+
+async def openai_remote_azure_function_calls(tool_calls):
+    # tool_calls is a list of (function_name, function_args) pairs; results
+    # are returned in the same order.
     if app_settings.azure_openai.function_call_azure_functions_enabled is not True:
+        return [None] * len(tool_calls)
+
+    if not getattr(current_app, "azure_functions_tool_executor", None):
+        current_app.azure_functions_tool_executor = init_azure_functions_tool_executor()
+
+    return await current_app.azure_functions_tool_executor.call_many(tool_calls)
+
+def init_history_window():
+    history_window_settings = app_settings.history_window
+    if not history_window_settings.enabled:
+        return None
+
+    model_name = app_settings.azure_openai.model_name or app_settings.azure_openai.model
+    max_prompt_tokens = history_window_settings.max_prompt_tokens
+    if not max_prompt_tokens:
+        max_prompt_tokens = max(
+            get_context_window(model_name)
+            - app_settings.azure_openai.max_tokens
+            - history_window_settings.reserved_tokens,
+            1
+        )
+
+    return ConversationHistoryWindow(
+        max_prompt_tokens=max_prompt_tokens,
+        max_turns=history_window_settings.max_turns,
+        citation_turns=history_window_settings.citation_turns if history_window_settings.drop_older_citations else None,
+        summarizer=summarize_conversation_history if history_window_settings.summarize else None,
+        model_name=model_name,
+    )
+
+
+def get_history_window():
+    if not hasattr(current_app, "history_window"):
+        current_app.history_window = init_history_window()
+
+    return current_app.history_window
+
+
+def init_response_cache():
+    response_cache_settings = app_settings.response_cache
+    if not response_cache_settings.enabled:
+        return None
+
+    if response_cache_settings.backend == "file":
+        store = FileResponseCacheStore(
+            response_cache_settings.directory,
+            max_size=response_cache_settings.max_size,
+            ttl_seconds=response_cache_settings.ttl_seconds
+        )
+    else:
+        store = InMemoryResponseCacheStore(
+            max_size=response_cache_settings.max_size,
+            ttl_seconds=response_cache_settings.ttl_seconds
+        )
+
+    return ResponseCache(store, per_user=response_cache_settings.scope == "user")
+
+
+def init_index_version_file():
+    semantic_cache_settings = app_settings.semantic_cache
+    if not semantic_cache_settings.index_version_file:
+        return None
+    if not (semantic_cache_settings.enabled or app_settings.response_cache.enabled):
+        return None
+
+    index_version_file = IndexVersionFile(
+        semantic_cache_settings.index_version_file,
+        check_interval_seconds=semantic_cache_settings.index_version_check_seconds
+    )
+    # the caches this worker builds start out in step with the file
+    current_app.cache_index_state = index_version_file.read()
+    return index_version_file
+
+
+def get_index_version_file():
+    if not hasattr(current_app, "index_version_file"):
+        current_app.index_version_file = init_index_version_file()
+
+    return current_app.index_version_file
+
+
+def get_index_version():
+    # The shared file wins over the setting once the admin route wrote it
+    index_version_file = get_index_version_file()
+    if index_version_file:
+        state = index_version_file.read()
+        if state and state["index_version"]:
+            return state["index_version"]
+
+    return app_settings.semantic_cache.index_version
+
+
+def get_datasource_fingerprint(index_version: str = None):
+    datasource_config = None
+    if app_settings.datasource:
+        datasource_config = app_settings.datasource.construct_payload_configuration()
+
+    return datasource_fingerprint(datasource_config, index_version)
+
+
+def init_semantic_cache():
+    semantic_cache_settings = app_settings.semantic_cache
+    if not semantic_cache_settings.enabled:
+        return None
+
+    if semantic_cache_settings.embedder == "hashing":
+        embedder = HashingEmbedder()
+    else:
+        embedder = AzureOpenAIEmbedder(
+            get_openai_client,
+            semantic_cache_settings.embedding_deployment or app_settings.azure_openai.embedding_name
+        )
+
+    return SemanticResponseCache(
+        embedder,
+        similarity_threshold=semantic_cache_settings.similarity_threshold,
+        max_size=semantic_cache_settings.max_size,
+        ttl_seconds=semantic_cache_settings.ttl_seconds,
+        per_user=semantic_cache_settings.scope == "user",
+        fingerprint=get_datasource_fingerprint(get_index_version())
+    )
+
+
+async def sync_cache_index_version():
+    # Another worker may have invalidated the caches through the admin route
+    index_version_file = get_index_version_file()
+    if not index_version_file:
         return
 
-    azure_functions_tool_url = f"{app_settings.azure_openai.function_call_azure_functions_tool_base_url}?code={app_settings.azure_openai.function_call_azure_functions_tool_key}"
-    headers = {'content-type': 'application/json'}
-    body = {
-        "tool_name": function_name,
-        "tool_arguments": json.loads(function_args)
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(azure_functions_tool_url, data=json.dumps(body), headers=headers)
-    response.raise_for_status()
+    state = index_version_file.read()
+    if state == getattr(current_app, "cache_index_state", None):
+        return
+
+    current_app.cache_index_state = state
+    semantic_cache = getattr(current_app, "semantic_cache", None)
+    if semantic_cache and not semantic_cache.update_fingerprint(get_datasource_fingerprint(get_index_version())):
+        semantic_cache.invalidate()
+
+    response_cache = getattr(current_app, "response_cache", None)
+    if response_cache:
+        await response_cache.clear()
+
+
+def get_response_cache():
+    # Answers produced with function calling depend on live tool results
+    if app_settings.azure_openai.function_call_azure_functions_enabled:
+        return None
+
+    if not hasattr(current_app, "response_cache"):
+        current_app.response_cache = init_response_cache()
+
+    return current_app.response_cache
+
+
+def get_semantic_cache():
+    if app_settings.azure_openai.function_call_azure_functions_enabled:
+        return None
+
+    if not hasattr(current_app, "semantic_cache"):
+        current_app.semantic_cache = init_semantic_cache()
+
+    return current_app.semantic_cache
+
+
+def get_request_coalescer():
+    # Function calling mutates the request while it runs, so those requests
+    # are never shared
+    if app_settings.azure_openai.function_call_azure_functions_enabled:
+        return None
+
+    if not hasattr(current_app, "request_coalescer"):
+        current_app.request_coalescer = init_request_coalescer()
+
+    return current_app.request_coalescer
+
+
+def init_request_coalescer():
+    if not app_settings.request_coalescing.enabled:
+        return None
+
+    return RequestCoalescer()
+
+
+def get_request_coalescing_key(model_args, request_headers, stream):
+    user_id = ""
+    if app_settings.request_coalescing.scope == "user":
+        user_id = get_authenticated_user_details(request_headers)["user_principal_id"]
+
+    return make_cache_key(model_args, f"{'stream' if stream else 'complete'}:{user_id}")
+
+
+def init_admission_controller():
+    admission_settings = app_settings.admission
+    if not admission_settings.enabled:
+        return None
+
+    return AdmissionController(
+        tokens_per_minute=admission_settings.tokens_per_minute,
+        requests_per_minute=admission_settings.requests_per_minute,
+        user_tokens_per_minute=admission_settings.user_tokens_per_minute,
+        user_requests_per_minute=admission_settings.user_requests_per_minute,
+        max_queue_size=admission_settings.max_queue_size,
+        max_wait_seconds=admission_settings.max_wait_seconds,
+    )
+
+
+def get_admission_controller():
+    if not hasattr(current_app, "admission_controller"):
+        current_app.admission_controller = init_admission_controller()
+
+    return current_app.admission_controller
+
+
+def response_caching_enabled():
+    return bool(get_response_cache() or get_semantic_cache())
+
+
+async def get_cached_response(model_args, request_headers, stream):
+    user_id = get_authenticated_user_details(request_headers)["user_principal_id"]
+    await sync_cache_index_version()
+
+    response_cache = get_response_cache()
+    if response_cache:
+        cached_response = await response_cache.get(response_cache.key_for(model_args, user_id, stream))
+        if cached_response is not None:
+            return cached_response
+
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        try:
+            return await semantic_cache.get(model_args, user_id, stream)
+        except Exception as e:
+            logging.warning(f"Semantic cache lookup failed: {e}")
+
+    return None
+
+
+async def set_cached_response(model_args, request_headers, stream, value):
+    user_id = get_authenticated_user_details(request_headers)["user_principal_id"]
+    await sync_cache_index_version()
+
+    response_cache = get_response_cache()
+    if response_cache:
+        await response_cache.set(response_cache.key_for(model_args, user_id, stream), value)
+
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        try:
+            await semantic_cache.set(model_args, value, user_id, stream)
+        except Exception as e:
+            logging.warning(f"Semantic cache update failed: {e}")
 
-    return response.text
 
 async def init_cosmosdb_client():
     cosmos_conversation_client = None
     logger.info("=== CosmosDB Client Initialization ===")
     
-    if app_settings.chat_history:
+    if app_settings.chat_history and app_settings.chat_history.backend == "sqlite":
+        logger.info(f"Using SQLite chat history store at {app_settings.chat_history.sqlite_path}")
+        cosmos_conversation_client = SQLiteConversationStore(
+            app_settings.chat_history.sqlite_path,
+            enable_message_feedback=app_settings.chat_history.enable_feedback,
+        )
+    elif app_settings.chat_history:
         logger.info(f"CosmosDB settings found: account={app_settings.chat_history.account}, database={app_settings.chat_history.database}, container={app_settings.chat_history.conversations_container}")
         
         try:
@@ -435,6 +927,7 @@ async def init_cosmosdb_client():
                 database_name=app_settings.chat_history.database,
                 container_name=app_settings.chat_history.conversations_container,
                 enable_message_feedback=app_settings.chat_history.enable_feedback,
+                delete_concurrency=app_settings.chat_history.delete_concurrency,
             )
             
             # Test the connection to verify it's working
@@ -469,11 +962,36 @@ async def init_cosmosdb_client():
     else:
         logger.warning("CosmosDB not configured - no chat_history settings found")
 
+    if cosmos_conversation_client and app_settings.history_list_cache.enabled:
+        cosmos_conversation_client = ListCachingConversationClient(
+            cosmos_conversation_client, init_history_list_cache()
+        )
+
     return cosmos_conversation_client
 
 
-def prepare_model_args(request_body, request_headers):
+def init_history_list_cache():
+    list_cache_settings = app_settings.history_list_cache
+    if list_cache_settings.backend == "sqlite":
+        store = SQLiteConversationListStore(
+            list_cache_settings.path,
+            ttl_seconds=list_cache_settings.ttl_seconds
+        )
+    else:
+        store = InMemoryConversationListStore(
+            max_size=list_cache_settings.max_size,
+            ttl_seconds=list_cache_settings.ttl_seconds
+        )
+
+    return ConversationListCache(store, page_size=app_settings.chat_history.list_page_size)
+
+
+async def prepare_model_args(request_body, request_headers):
     request_messages = request_body.get("messages", [])
+    history_window = get_history_window()
+    if history_window:
+        request_messages = await history_window.trim(request_messages)
+
     messages = []
     if not app_settings.datasource:
         messages = [
@@ -528,53 +1046,21 @@ def prepare_model_args(request_body, request_headers):
 
     if len(messages) > 0:
         if messages[-1]["role"] == "user":
-            if app_settings.azure_openai.function_call_azure_functions_enabled and len(azure_openai_tools) > 0:
-                model_args["tools"] = azure_openai_tools
+            tool_registry = get_tool_registry()
+            if app_settings.azure_openai.function_call_azure_functions_enabled and len(tool_registry) > 0:
+                model_args["tools"] = list(tool_registry.tools)
 
             if app_settings.datasource:
+                data_source_filter = await app_settings.datasource.get_request_filter(request)
                 model_args["extra_body"] = {
                     "data_sources": [
                         app_settings.datasource.construct_payload_configuration(
-                            request=request
+                            filter=data_source_filter
                         )
                     ]
                 }
 
-    model_args_clean = copy.deepcopy(model_args)
-    if model_args_clean.get("extra_body"):
-        secret_params = [
-            "key",
-            "connection_string",
-            "embedding_key",
-            "encoded_api_key",
-            "api_key",
-        ]
-        for secret_param in secret_params:
-            if model_args_clean["extra_body"]["data_sources"][0]["parameters"].get(
-                secret_param
-            ):
-                model_args_clean["extra_body"]["data_sources"][0]["parameters"][
-                    secret_param
-                ] = "*****"
-        authentication = model_args_clean["extra_body"]["data_sources"][0][
-            "parameters"
-        ].get("authentication", {})
-        for field in authentication:
-            if field in secret_params:
-                model_args_clean["extra_body"]["data_sources"][0]["parameters"][
-                    "authentication"
-                ][field] = "*****"
-        embeddingDependency = model_args_clean["extra_body"]["data_sources"][0][
-            "parameters"
-        ].get("embedding_dependency", {})
-        if "authentication" in embeddingDependency:
-            for field in embeddingDependency["authentication"]:
-                if field in secret_params:
-                    model_args_clean["extra_body"]["data_sources"][0]["parameters"][
-                        "embedding_dependency"
-                    ]["authentication"][field] = "*****"
-
-    logging.debug(f"REQUEST BODY: {json.dumps(model_args_clean, indent=4)}")
+    logging.debug("REQUEST BODY: %s", RedactedJSON(model_args))
 
     return model_args
 
@@ -617,13 +1103,17 @@ async def process_function_call(response):
     messages = []
 
     if response_message.tool_calls:
-        for tool_call in response_message.tool_calls:
-            # Check if function exists
-            if tool_call.function.name not in azure_openai_available_tools:
-                continue
-            
-            function_response = await openai_remote_azure_function_call(tool_call.function.name, tool_call.function.arguments)
+        tool_registry = get_tool_registry()
+        # Check if function exists
+        tool_calls = [
+            tool_call for tool_call in response_message.tool_calls
+            if tool_call.function.name in tool_registry
+        ]
+        function_responses = await openai_remote_azure_function_calls(
+            [(tool_call.function.name, tool_call.function.arguments) for tool_call in tool_calls]
+        )
 
+        for tool_call, function_response in zip(tool_calls, function_responses):
             # adding assistant response to messages
             messages.append(
                 {
@@ -649,7 +1139,7 @@ async def process_function_call(response):
     
     return None
 
-async def send_chat_request(request_body, request_headers):
+async def prepare_chat_request(request_body, request_headers):
     filtered_messages = []
     messages = request_body.get("messages", [])
     for message in messages:
@@ -657,11 +1147,34 @@ async def send_chat_request(request_body, request_headers):
             filtered_messages.append(message)
             
     request_body['messages'] = filtered_messages
-    model_args = prepare_model_args(request_body, request_headers)
+    return await prepare_model_args(request_body, request_headers)
+
+
+async def send_chat_request(request_body, request_headers, model_args=None):
+    if model_args is None:
+        model_args = await prepare_chat_request(request_body, request_headers)
+
+    admission_controller = get_admission_controller()
+    if admission_controller:
+        await admission_controller.acquire(
+            get_authenticated_user_details(request_headers)["user_principal_id"],
+            estimate_request_tokens(
+                model_args,
+                app_settings.azure_openai.model_name or app_settings.azure_openai.model
+            )
+        )
 
     try:
-        azure_openai_client = await init_openai_client()
-        raw_response = await azure_openai_client.chat.completions.with_raw_response.create(**model_args)
+        deployment_pool = await get_openai_deployment_pool()
+        if deployment_pool:
+            raw_response = await deployment_pool.call(
+                lambda backend: backend.client.chat.completions.with_raw_response.create(
+                    **{**model_args, "model": backend.deployment}
+                )
+            )
+        else:
+            azure_openai_client = await get_openai_client()
+            raw_response = await azure_openai_client.chat.completions.with_raw_response.create(**model_args)
         response = raw_response.parse()
         apim_request_id = raw_response.headers.get("apim-request-id") 
     except Exception as e:
@@ -682,9 +1195,32 @@ async def complete_chat_request(request_body, request_headers):
             app_settings.promptflow.citations_field_name
         )
     else:
-        response, apim_request_id = await send_chat_request(request_body, request_headers)
         history_metadata = request_body.get("history_metadata", {})
+        model_args = await prepare_chat_request(request_body, request_headers)
+        caching_enabled = response_caching_enabled()
+        if caching_enabled:
+            cached_response = await get_cached_response(model_args, request_headers, stream=False)
+            if cached_response is not None:
+                return restore_response(cached_response, str(uuid.uuid4()), history_metadata)
+
+        is_leader = True
+        request_coalescer = get_request_coalescer()
+        if request_coalescer:
+            (response, apim_request_id), is_leader = await request_coalescer.run(
+                get_request_coalescing_key(model_args, request_headers, stream=False),
+                send_chat_request,
+                request_body,
+                request_headers,
+                model_args
+            )
+        else:
+            response, apim_request_id = await send_chat_request(request_body, request_headers, model_args)
+
         non_streaming_response = format_non_streaming_response(response, history_metadata, apim_request_id)
+        if not is_leader and non_streaming_response:
+            non_streaming_response["id"] = str(uuid.uuid4())
+        if caching_enabled and is_leader and non_streaming_response:
+            await set_cached_response(model_args, request_headers, False, strip_response_metadata(non_streaming_response))
 
         if app_settings.azure_openai.function_call_azure_functions_enabled:
             function_response = await process_function_call(response)  # Add await here
@@ -737,9 +1273,11 @@ async def process_function_call_stream(completionChunk, function_call_stream_sta
             function_call_stream_state.current_tool_call["tool_arguments"] = function_call_stream_state.tool_arguments_stream
             function_call_stream_state.tool_calls.append(function_call_stream_state.current_tool_call)
             
-            for tool_call in function_call_stream_state.tool_calls:
-                tool_response = await openai_remote_azure_function_call(tool_call["tool_name"], tool_call["tool_arguments"])
+            tool_responses = await openai_remote_azure_function_calls(
+                [(tool_call["tool_name"], tool_call["tool_arguments"]) for tool_call in function_call_stream_state.tool_calls]
+            )
 
+            for tool_call, tool_response in zip(function_call_stream_state.tool_calls, tool_responses):
                 function_call_stream_state.function_messages.append({
                     "role": "assistant",
                     "function_call": {
@@ -763,8 +1301,42 @@ async def process_function_call_stream(completionChunk, function_call_stream_sta
 
 
 async def stream_chat_request(request_body, request_headers):
-    response, apim_request_id = await send_chat_request(request_body, request_headers)
     history_metadata = request_body.get("history_metadata", {})
+    model_args = await prepare_chat_request(request_body, request_headers)
+    caching_enabled = response_caching_enabled()
+    if caching_enabled:
+        cached_frames = await get_cached_response(model_args, request_headers, stream=True)
+        if cached_frames is not None:
+            return replay_stream(cached_frames, history_metadata)
+
+    request_coalescer = get_request_coalescer()
+    if request_coalescer:
+        stream, is_leader = await request_coalescer.stream(
+            get_request_coalescing_key(model_args, request_headers, stream=True),
+            open_chat_stream,
+            request_body,
+            request_headers,
+            model_args,
+            caching_enabled
+        )
+        return stream if is_leader else follow_stream(stream, history_metadata)
+
+    return await open_chat_stream(request_body, request_headers, model_args, caching_enabled)
+
+
+async def follow_stream(stream, history_metadata):
+    # Frames of a coalesced stream belong to the leading request; each
+    # follower gets its own message id and history metadata.
+    response_id = str(uuid.uuid4())
+    async for frame in stream:
+        if frame:
+            frame = {**frame, "id": response_id, "history_metadata": history_metadata}
+        yield frame
+
+
+async def open_chat_stream(request_body, request_headers, model_args, caching_enabled):
+    history_metadata = request_body.get("history_metadata", {})
+    response, apim_request_id = await send_chat_request(request_body, request_headers, model_args)
     
     async def generate(apim_request_id, history_metadata):
         if app_settings.azure_openai.function_call_azure_functions_enabled:
@@ -790,29 +1362,94 @@ async def stream_chat_request(request_body, request_headers):
             async for completionChunk in response:
                 yield format_stream_response(completionChunk, history_metadata, apim_request_id)
 
-    return generate(apim_request_id=apim_request_id, history_metadata=history_metadata)
+    stream = generate(apim_request_id=apim_request_id, history_metadata=history_metadata)
+    if caching_enabled:
+        async def cache_frames(frames):
+            await set_cached_response(model_args, request_headers, True, frames)
 
+        return record_stream(stream, cache_frames)
 
-async def conversation_internal(request_body, request_headers):
+    return stream
+
+
+async def conversation_internal(request_body, request_headers, title_task=None, history_write=None):
     try:
         if app_settings.azure_openai.stream and not app_settings.base_settings.use_promptflow:
             result = await stream_chat_request(request_body, request_headers)
+            if history_write:
+                result = stream_after(history_write.wait, result)
+            if app_settings.streaming.coalesce:
+                result = coalesce_stream(
+                    result,
+                    max_delay_seconds=app_settings.streaming.coalesce_max_delay_ms / 1000,
+                    max_chars=app_settings.streaming.coalesce_max_chars
+                )
+            if title_task:
+                # the frontend reads the title from the last frame
+                async def add_title(frame):
+                    return with_title(frame, await wait_for_title(title_task))
+
+                result = hold_last_frame(result, add_title)
+            if app_settings.streaming.envelope == "once":
+                result = send_envelope_once(result)
+            if "text/event-stream" in request_headers.get("Accept", ""):
+                user_id = get_authenticated_user_details(request_headers)["user_principal_id"]
+                stream_id = get_sse_stream_registry().start(result, owner=user_id)
+                return await make_sse_response(stream_id, user_id)
             response = await make_response(format_as_ndjson(result))
             response.timeout = None
             response.mimetype = "application/json-lines"
             return response
         else:
             result = await complete_chat_request(request_body, request_headers)
+            if history_write:
+                await history_write.wait()
+            if title_task:
+                result = with_title(result, await wait_for_title(title_task))
             return jsonify(result)
 
     except Exception as ex:
         logging.exception(ex)
-        if hasattr(ex, "status_code"):
+        if hasattr(ex, "retry_after"):
+            return jsonify({"error": str(ex)}), ex.status_code, {"Retry-After": str(max(math.ceil(ex.retry_after), 1))}
+        elif hasattr(ex, "status_code"):
             return jsonify({"error": str(ex)}), ex.status_code
         else:
             return jsonify({"error": str(ex)}), 500
 
 
+def get_sse_stream_registry():
+    if not getattr(current_app, "sse_stream_registry", None):
+        current_app.sse_stream_registry = SSEStreamRegistry(
+            max_streams=app_settings.streaming.sse_max_streams,
+            ttl_seconds=app_settings.streaming.sse_replay_ttl_seconds
+        )
+
+    return current_app.sse_stream_registry
+
+
+async def make_sse_response(stream_id, user_id, start=0):
+    broadcast = get_sse_stream_registry().get(stream_id, user_id)
+    if not broadcast:
+        return jsonify({"error": "Stream not found or expired"}), 404
+
+    response = await make_response(
+        format_as_sse(
+            broadcast,
+            stream_id,
+            start=start,
+            heartbeat_seconds=app_settings.streaming.sse_heartbeat_seconds,
+            retry_ms=app_settings.streaming.sse_retry_ms
+        )
+    )
+    response.timeout = None
+    response.mimetype = "text/event-stream"
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["X-Stream-Id"] = stream_id
+    return response
+
+
 @bp.route("/conversation", methods=["POST"])
 async def conversation():
     if not request.is_json:
@@ -822,43 +1459,144 @@ async def conversation():
     return await conversation_internal(request_json, request.headers)
 
 
+@bp.route("/conversation/stream/<stream_id>", methods=["GET"])
+async def resume_conversation_stream(stream_id):
+    user_id = get_authenticated_user_details(request.headers)["user_principal_id"]
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return await make_sse_response(stream_id, user_id, start=parse_last_event_id(last_event_id, stream_id))
+
+
+def admin_required(route):
+    """Restricts a route to the principals listed in ADMIN_PRINCIPAL_IDS.
+
+    Admin routes answer 404 unless ADMIN_ENABLED is set, so a deployment
+    that never configures them does not expose them at all.
+    """
+    @functools.wraps(route)
+    async def wrapper(*args, **kwargs):
+        if not app_settings.admin.enabled:
+            return jsonify({"error": "Not found"}), 404
+
+        user_id = get_authenticated_user_details(request.headers)["user_principal_id"]
+        if not app_settings.admin.is_admin(user_id):
+            logger.warning(f"Rejected admin request to {request.path} from principal {user_id}")
+            return jsonify({"error": "Forbidden"}), 403
+
+        return await route(*args, **kwargs)
+
+    return wrapper
+
+
+@bp.route("/admin/tools/reload", methods=["POST"])
+@admin_required
+async def reload_tools():
+    tool_loader = getattr(current_app, "azure_functions_tool_loader", None)
+    if not tool_loader:
+        return jsonify({"error": "Azure Functions function calling is not enabled"}), 404
+
+    tool_registry = await tool_loader.load()
+    return jsonify(
+        {
+            "tools": sorted(tool_registry.names),
+            "loaded_at": tool_loader.loaded_at,
+        }
+    ), 200
+
+
+@bp.route("/admin/cache/invalidate", methods=["POST"])
+@admin_required
+async def invalidate_response_caches():
+    request_json = await request.get_json(silent=True) or {}
+    index_version = request_json.get("index_version")
+    index_version_file = get_index_version_file()
+    if index_version and not index_version_file:
+        return jsonify({"error": "SEMANTIC_CACHE_INDEX_VERSION_FILE must be set to change the index version at runtime"}), 400
+
+    response_cache = getattr(current_app, "response_cache", None)
+    semantic_cache = getattr(current_app, "semantic_cache", None)
+    if index_version_file:
+        # a new generation makes every worker drop its caches on its next lookup
+        await asyncio.to_thread(index_version_file.write, str(index_version) if index_version else None)
+        await sync_cache_index_version()
+    else:
+        if response_cache:
+            await response_cache.clear()
+        if semantic_cache:
+            semantic_cache.invalidate()
+
+    return jsonify({
+        "invalidated": bool(response_cache or semantic_cache),
+        "all_workers": bool(index_version_file),
+    }), 200
+
+
+@bp.route("/debug/metrics", methods=["GET"])
+@admin_required
+async def debug_metrics():
+    metrics = {}
+    for name in ("response_cache", "semantic_cache", "request_coalescer", "azure_openai_pool", "admission_controller", "sse_stream_registry", "history_write_stats", "history_jobs", "history_list_cache"):
+        component = getattr(current_app, name, None)
+        metrics[name] = component.stats() if component else None
+
+    return jsonify(metrics), 200
+
+
+def encode_frontend_settings(settings: dict):
+    """Returns the /frontend_settings response body and its strong ETag."""
+    try:
+        body = json_dumps(settings)
+    except Exception as json_error:
+        logger.error(f"Error serializing frontend settings to JSON: {str(json_error)}")
+        # Try to identify the problematic field
+        for key, value in settings.items():
+            try:
+                json_dumps({key: value})
+            except Exception as e:
+                logger.error(f"Field '{key}' has invalid value: {repr(value)}")
+
+        # Fall back to a sanitized version of the problematic fields
+        settings = copy.deepcopy(settings)
+        if 'ui' in settings:
+            for key in ['title', 'chat_title', 'chat_description']:
+                if key in settings['ui']:
+                    settings['ui'][key] = str(settings['ui'][key])
+
+        logger.info("Serving sanitized frontend settings")
+        body = json_dumps(settings)
+
+    body = body.encode("utf-8")
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+def init_frontend_settings_response():
+    logger.info(f"Feedback enabled: {frontend_settings.get('feedback_enabled', False)}")
+    logger.info(f"Chat history button shown: {frontend_settings.get('ui', {}).get('show_chat_history_button', False)}")
+    if DEBUG:
+        logger.debug(f"Complete frontend settings: {json.dumps(frontend_settings, indent=2)}")
+
+    return encode_frontend_settings(frontend_settings)
+
+
+def get_frontend_settings_response():
+    if not hasattr(current_app, "frontend_settings_response"):
+        current_app.frontend_settings_response = init_frontend_settings_response()
+
+    return current_app.frontend_settings_response
+
+
 @bp.route("/frontend_settings", methods=["GET"])
 def get_frontend_settings():
     try:
-        logger.info("=== Frontend Settings Request ===")
-        logger.info(f"Feedback enabled: {frontend_settings.get('feedback_enabled', False)}")
-        logger.info(f"Chat history button shown: {frontend_settings.get('ui', {}).get('show_chat_history_button', False)}")
-        
-        # Test that the settings are properly serializable
-        try:
-            serialized = json.dumps(frontend_settings)
-            # Try to verify it can be parsed back without issues
-            json.loads(serialized)
-            logger.info("Frontend settings successfully serialized to JSON")
-        except Exception as json_error:
-            logger.error(f"Error serializing frontend settings to JSON: {str(json_error)}")
-            # Try to identify the problematic field
-            for key, value in frontend_settings.items():
-                try:
-                    json.dumps({key: value})
-                except Exception as e:
-                    logger.error(f"Field '{key}' has invalid value: {repr(value)}")
-            
-            # Return a sanitized version with the problematic fields removed
-            sanitized_settings = copy.deepcopy(frontend_settings)
-            if 'ui' in sanitized_settings:
-                for key in ['title', 'chat_title', 'chat_description']:
-                    if key in sanitized_settings['ui']:
-                        sanitized_settings['ui'][key] = str(sanitized_settings['ui'][key])
-            
-            logger.info("Returning sanitized frontend settings")
-            return jsonify(sanitized_settings), 200
-        
-        # Dump all frontend settings for debugging
-        if DEBUG:
-            logger.debug(f"Complete frontend settings: {json.dumps(frontend_settings, indent=2)}")
-        
-        return jsonify(frontend_settings), 200
+        body, etag = get_frontend_settings_response()
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(b"", status=304)
+        else:
+            response = current_app.response_class(body, mimetype="application/json")
+
+        response.set_etag(etag)
+        # settings only change on restart, so clients revalidate instead of refetching
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         logger.exception("Exception in /frontend_settings")
         return jsonify({"error": str(e)}), 500
@@ -880,41 +1618,42 @@ async def add_conversation():
         if not current_app.cosmos_conversation_client:
             raise Exception("CosmosDB is not configured or not working")
 
+        ## Format the incoming message object in the "chat/completions" messages format
+        ## then write it to the conversation history in cosmos
+        messages = request_json["messages"]
+        if len(messages) == 0 or messages[-1]["role"] != "user":
+            raise Exception("No user message found")
+
         # check for the conversation_id, if the conversation is not set, we will create a new one
         history_metadata = {}
+        title = None
+        title_task = None
         if not conversation_id:
-            title = await generate_title(request_json["messages"])
-            conversation_dict = await current_app.cosmos_conversation_client.create_conversation(
-                user_id=user_id, title=title
-            )
-            conversation_id = conversation_dict["id"]
+            conversation_id = str(uuid.uuid4())
+            title = provisional_title(messages)
             history_metadata["title"] = title
-            history_metadata["date"] = conversation_dict["createdAt"]
+            history_metadata["date"] = datetime.utcnow().isoformat()
 
-        ## Format the incoming message object in the "chat/completions" messages format
-        ## then write it to the conversation history in cosmos
-        messages = request_json["messages"]
-        if len(messages) > 0 and messages[-1]["role"] == "user":
-            createdMessageValue = await current_app.cosmos_conversation_client.create_message(
-                uuid=str(uuid.uuid4()),
-                conversation_id=conversation_id,
-                user_id=user_id,
-                input_message=messages[-1],
+        # saved while the completion is requested; the answer is only sent once it succeeded
+        history_write = PipelinedWrite(
+            save_user_message(
+                current_app.cosmos_conversation_client, user_id, conversation_id, messages[-1], title
+            ),
+            stats=get_history_write_stats(),
+            name="user message write"
+        )
+        if title is not None:
+            title_task = start_title_generation(
+                user_id, conversation_id, messages, title, after=history_write.task
             )
-            if createdMessageValue == "Conversation not found":
-                raise Exception(
-                    "Conversation not found for the given conversation ID: "
-                    + conversation_id
-                    + "."
-                )
-        else:
-            raise Exception("No user message found")
 
         # Submit request to Chat Completions for response
         request_body = await request.get_json()
         history_metadata["conversation_id"] = conversation_id
         request_body["history_metadata"] = history_metadata
-        return await conversation_internal(request_body, request.headers)
+        return await conversation_internal(
+            request_body, request.headers, title_task=title_task, history_write=history_write
+        )
 
     except Exception as e:
         logging.exception("Exception in /history/generate")
@@ -944,20 +1683,15 @@ async def update_conversation():
         ## then write it to the conversation history in cosmos
         messages = request_json["messages"]
         if len(messages) > 0 and messages[-1]["role"] == "assistant":
+            new_messages = []
             if len(messages) > 1 and messages[-2].get("role", None) == "tool":
-                # write the tool message first
-                await current_app.cosmos_conversation_client.create_message(
-                    uuid=str(uuid.uuid4()),
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    input_message=messages[-2],
-                )
-            # write the assistant message
-            await current_app.cosmos_conversation_client.create_message(
-                uuid=messages[-1]["id"],
+                # the tool message goes first
+                new_messages.append((str(uuid.uuid4()), messages[-2]))
+            new_messages.append((messages[-1]["id"], messages[-1]))
+            await current_app.cosmos_conversation_client.create_messages(
                 conversation_id=conversation_id,
                 user_id=user_id,
-                input_message=messages[-1],
+                input_messages=new_messages,
             )
         else:
             raise Exception("No bot messages found")
@@ -994,25 +1728,11 @@ async def update_message():
         try:
             # First get the conversation and surrounding messages to log context
             # Find which conversation this message belongs to
-            conversation_query = f"SELECT c.conversationId FROM c WHERE c.id = '{message_id}' AND c.type = 'message'"
             conversation_id = None
-            
-            try:
-                # Try direct item read first with the message ID as partition key
-                message = await current_app.cosmos_conversation_client.container_client.read_item(
-                    item=message_id, 
-                    partition_key=message_id
-                )
+            message = await current_app.cosmos_conversation_client.get_message(user_id, message_id)
+            if message:
                 conversation_id = message.get("conversationId")
-                logger.info(f"Found conversation ID {conversation_id} from direct item read")
-            except Exception as e:
-                logger.info(f"Direct read failed, using query: {str(e)}")
-                # Fall back to query if direct read fails
-                async for item in current_app.cosmos_conversation_client.container_client.query_items(
-                    query=conversation_query
-                ):
-                    conversation_id = item.get("conversationId")
-                    break
+                logger.info(f"Found conversation ID {conversation_id} for message {message_id}")
                 
             if conversation_id:
                 # Get related messages
@@ -1075,20 +1795,13 @@ async def update_message():
                 # Try to verify if the message exists but with a different partition key
                 try:
                     logger.info(f"Checking if message exists with different partition key")
-                    from azure.cosmos import exceptions
                     
                     try:
-                        # Try a direct query to find the message by ID only
-                        query = f"SELECT * FROM c WHERE c.id = '{message_id}'"
-                        messages = []
-                        # Simplified query without options parameters
-                        async for item in current_app.cosmos_conversation_client.container_client.query_items(
-                            query=query
-                        ):
-                            messages.append(item)
+                        # Try a direct lookup to find the message by ID only
+                        found_message = await current_app.cosmos_conversation_client.find_item(message_id)
                         
-                        if messages:
-                            found_user_id = messages[0].get("userId", "unknown")
+                        if found_message:
+                            found_user_id = found_message.get("userId", "unknown")
                             logger.info(f"Message found but with different user ID: {found_user_id}")
                             return jsonify({
                                 "error": f"Message found but belongs to different user (found: {found_user_id}, requesting: {user_id})"
@@ -1173,16 +1886,63 @@ async def list_conversations():
     if not current_app.cosmos_conversation_client:
         raise Exception("CosmosDB is not configured or not working")
 
+    page_size = app_settings.chat_history.list_page_size
+    try:
+        offset = int(offset)
+        continuation_token = decode_continuation_token(request.args.get("continuation_token"))
+    except ValueError:
+        return jsonify({"error": "Invalid offset or continuation_token"}), 400
+
+    ## offsets from the frontend continue where an earlier page of this user ended
+    list_cursors = get_history_list_cursors()
+    if not continuation_token and offset:
+        continuation_token = list_cursors.get((user_id, offset))
+
     ## get the conversations from cosmos
-    conversations = await current_app.cosmos_conversation_client.get_conversations(
-        user_id, offset=offset, limit=25
-    )
+    if continuation_token or not offset:
+        try:
+            conversations, next_token = await current_app.cosmos_conversation_client.get_conversation_page(
+                user_id, page_size, continuation_token=continuation_token
+            )
+        except ValueError:
+            # the store rejects tokens it did not issue, or that no longer apply
+            return jsonify({"error": "Invalid continuation_token"}), 400
+    else:
+        # no cursor for this offset, e.g. it was served by another worker
+        conversations = await current_app.cosmos_conversation_client.get_conversations(
+            user_id, offset=offset, limit=page_size
+        )
+        next_token = None
     if not isinstance(conversations, list):
         return jsonify({"error": f"No conversations for {user_id} were found"}), 404
 
     ## return the conversation ids
+    headers = {}
+    if next_token:
+        list_cursors.set((user_id, offset + len(conversations)), next_token)
+        headers["X-Continuation-Token"] = encode_continuation_token(next_token)
+
+    return jsonify(conversations), 200, headers
+
+
+def encode_continuation_token(continuation_token: str) -> str:
+    return base64.urlsafe_b64encode(continuation_token.encode("utf-8")).decode("ascii")
+
+
+def decode_continuation_token(value: str):
+    if not value:
+        return None
+    try:
+        return base64.urlsafe_b64decode(value.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError("Invalid continuation token") from e
+
 
-    return jsonify(conversations), 200
+def get_history_list_cursors():
+    if not hasattr(current_app, "history_list_cursors"):
+        current_app.history_list_cursors = TTLCache(max_size=10000, ttl_seconds=600)
+
+    return current_app.history_list_cursors
 
 
 def sanitize_json_content(content):
@@ -1294,31 +2054,23 @@ async def get_conversation():
                     "feedback": ""
                 })
         
-        # Test serializing the response to make sure it's valid JSON
+        # Serialize once; the per-message checks below only run if that fails
         try:
-            response_data = {"conversation_id": conversation_id, "messages": messages}
-            
-            # Test if the response can be properly JSON serialized
-            response_str = json.dumps(response_data)
-            
-            # Test parsing it back to ensure it's valid
-            json.loads(response_str)
-            
-            logger.info(f"Successfully validated response JSON for {len(messages)} messages")
-            return jsonify(response_data), 200
+            body = json_dumps({"conversation_id": conversation_id, "messages": messages})
+            return json_body_response(body)
         except Exception as json_e:
             logger.error(f"Error serializing response to JSON: {str(json_e)}")
             
             # Try to identify problematic messages
             for i, msg in enumerate(messages):
                 try:
-                    json.dumps(msg)
+                    json_dumps(msg)
                 except Exception as e:
                     logger.error(f"Message at index {i} is not JSON serializable: {str(e)}")
                     # Try to find which field is problematic
                     for k, v in msg.items():
                         try:
-                            json.dumps({k: v})
+                            json_dumps({k: v})
                         except:
                             logger.error(f"Field '{k}' has invalid value: {repr(v)}")
             
@@ -1326,7 +2078,7 @@ async def get_conversation():
             safe_messages = []
             for msg in messages:
                 try:
-                    json.dumps(msg)
+                    json_dumps(msg)
                     safe_messages.append(msg)
                 except:
                     pass
@@ -1355,11 +2107,18 @@ async def rename_conversation():
     if not current_app.cosmos_conversation_client:
         raise Exception("CosmosDB is not configured or not working")
 
-    ## get the conversation from cosmos
-    conversation = await current_app.cosmos_conversation_client.get_conversation(
-        user_id, conversation_id
+    title = request_json.get("title", None)
+    if not title:
+        return jsonify({"error": "title is required"}), 400
+
+    ## update the title in place; with If-Match only if the conversation is unchanged
+    etag = request.headers.get("If-Match")
+    updated_conversation = await current_app.cosmos_conversation_client.patch_conversation(
+        user_id, conversation_id, {"title": title}, etag=etag
     )
-    if not conversation:
+    if not updated_conversation:
+        if etag and await current_app.cosmos_conversation_client.get_conversation(user_id, conversation_id):
+            return jsonify({"error": f"Conversation {conversation_id} was changed by another request."}), 412
         return (
             jsonify(
                 {
@@ -1369,16 +2128,8 @@ async def rename_conversation():
             404,
         )
 
-    ## update the title
-    title = request_json.get("title", None)
-    if not title:
-        return jsonify({"error": "title is required"}), 400
-    conversation["title"] = title
-    updated_conversation = await current_app.cosmos_conversation_client.upsert_conversation(
-        conversation
-    )
-
-    return jsonify(updated_conversation), 200
+    headers = {"ETag": updated_conversation["_etag"]} if "_etag" in updated_conversation else {}
+    return jsonify(updated_conversation), 200, headers
 
 
 @bp.route("/history/delete_all", methods=["DELETE"])
@@ -1394,23 +2145,19 @@ async def delete_all_conversations():
         if not current_app.cosmos_conversation_client:
             raise Exception("CosmosDB is not configured or not working")
 
-        conversations = await current_app.cosmos_conversation_client.get_conversations(
-            user_id, offset=0, limit=None
-        )
-        if not conversations:
-            return jsonify({"error": f"No conversations for {user_id} were found"}), 404
-
-        # delete each conversation
-        for conversation in conversations:
-            ## delete the conversation messages from cosmos first
-            deleted_messages = await current_app.cosmos_conversation_client.delete_messages(
-                conversation["id"], user_id
+        cosmos_conversation_client = current_app.cosmos_conversation_client
+        if "respond-async" in request.headers.get("Prefer", ""):
+            job = await get_history_job_registry().start(
+                "delete_all",
+                user_id,
+                lambda job: delete_user_history(cosmos_conversation_client, user_id, job)
             )
+            return jsonify(job.to_dict()), 202, {"Location": f"/history/delete_all/{job.id}"}
+
+        deleted = await delete_user_history(cosmos_conversation_client, user_id)
+        if not deleted:
+            return jsonify({"error": f"No conversations for {user_id} were found"}), 404
 
-            ## Now delete the conversation
-            deleted_conversation = await current_app.cosmos_conversation_client.delete_conversation(
-                user_id, conversation["id"]
-            )
         return (
             jsonify(
                 {
@@ -1425,6 +2172,55 @@ async def delete_all_conversations():
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route("/history/delete_all/<job_id>", methods=["GET"])
+async def get_delete_all_job(job_id):
+    authenticated_user = get_authenticated_user_details(request_headers=request.headers)
+    user_id = authenticated_user["user_principal_id"]
+
+    job = await get_history_job_registry().get(job_id, user_id)
+    if not job:
+        return jsonify({"error": f"Job {job_id} was not found. It either does not exist or has expired."}), 404
+
+    return jsonify(job.to_dict()), 200
+
+
+async def delete_user_history(cosmos_conversation_client, user_id, job=None) -> int:
+    """Deletes all conversations and messages of a user and returns the number of conversations."""
+    conversation_ids, message_ids = await cosmos_conversation_client.get_history_item_ids(user_id)
+    on_deleted = None
+    if job:
+        job.total = len(conversation_ids) + len(message_ids)
+        on_deleted = job.record
+
+    ## delete the messages first, so a failure leaves the conversations to retry with
+    await cosmos_conversation_client.delete_items(user_id, message_ids, on_deleted)
+    await cosmos_conversation_client.delete_items(user_id, conversation_ids, on_deleted)
+    return len(conversation_ids)
+
+
+def init_history_job_registry():
+    history_jobs_settings = app_settings.history_jobs
+    if history_jobs_settings.backend == "sqlite":
+        store = SQLiteHistoryJobStore(
+            history_jobs_settings.path,
+            ttl_seconds=history_jobs_settings.ttl_seconds
+        )
+    else:
+        store = InMemoryHistoryJobStore(
+            max_jobs=history_jobs_settings.max_jobs,
+            ttl_seconds=history_jobs_settings.ttl_seconds
+        )
+
+    return HistoryJobRegistry(store)
+
+
+def get_history_job_registry():
+    if not hasattr(current_app, "history_jobs"):
+        current_app.history_jobs = init_history_job_registry()
+
+    return current_app.history_jobs
+
+
 @bp.route("/history/clear", methods=["POST"])
 async def clear_messages():
     await cosmos_db_ready.wait()
@@ -1486,15 +2282,7 @@ async def ensure_cosmos():
                 sanitized_err = err.replace('\n', ' ').replace('\r', ' ')
                 logger.info(f"Original error: {repr(err)}")
                 logger.info(f"Sanitized error: {repr(sanitized_err)}")
-                
-                # Validate the error can be properly serialized to JSON
-                try:
-                    test_json = json.dumps({"error": sanitized_err})
-                    json.loads(test_json)  # Verify it can be parsed back
-                    return jsonify({"error": sanitized_err}), 422
-                except Exception as json_e:
-                    logger.error(f"Error response contains invalid JSON characters: {str(json_e)}")
-                    return jsonify({"error": "Database connection error - see logs for details"}), 422
+                return jsonify({"error": sanitized_err}), 422
             
             return jsonify({"error": "CosmosDB is not configured or not working"}), 500
 
@@ -1504,35 +2292,26 @@ async def ensure_cosmos():
         logger.exception("Exception in /history/ensure")
         cosmos_exception = str(e)
         
-        # Try to sanitize the exception message before serializing
-        try:
-            sanitized_error = cosmos_exception.replace('\n', ' ').replace('\r', ' ')
-            logger.info(f"Original exception: {repr(cosmos_exception)}")
-            logger.info(f"Sanitized exception: {repr(sanitized_error)}")
-            
-            # Test if the sanitized message can be properly serialized
-            test_json = json.dumps({"error": sanitized_error})
-            json.loads(test_json)  # Verify it can be parsed back
-            
-            if "Invalid credentials" in sanitized_error:
-                return jsonify({"error": sanitized_error}), 401
-            elif "Invalid CosmosDB database name" in sanitized_error:
-                return jsonify(
-                    {
-                        "error": f"{sanitized_error} {app_settings.chat_history.database} for account {app_settings.chat_history.account}"
-                    }
-                ), 422
-            elif "Invalid CosmosDB container name" in sanitized_error:
-                return jsonify(
-                    {
-                        "error": f"{sanitized_error}: {app_settings.chat_history.conversations_container}"
-                    }
-                ), 422
-            else:
-                return jsonify({"error": sanitized_error}), 500
-        except Exception as json_e:
-            logger.error(f"Error serializing exception to JSON: {str(json_e)}")
-            return jsonify({"error": "Database error - see logs for details"}), 500
+        sanitized_error = cosmos_exception.replace('\n', ' ').replace('\r', ' ')
+        logger.info(f"Original exception: {repr(cosmos_exception)}")
+        logger.info(f"Sanitized exception: {repr(sanitized_error)}")
+
+        if "Invalid credentials" in sanitized_error:
+            return jsonify({"error": sanitized_error}), 401
+        elif "Invalid CosmosDB database name" in sanitized_error:
+            return jsonify(
+                {
+                    "error": f"{sanitized_error} {app_settings.chat_history.database} for account {app_settings.chat_history.account}"
+                }
+            ), 422
+        elif "Invalid CosmosDB container name" in sanitized_error:
+            return jsonify(
+                {
+                    "error": f"{sanitized_error}: {app_settings.chat_history.conversations_container}"
+                }
+            ), 422
+        else:
+            return jsonify({"error": sanitized_error}), 500
 
 
 async def generate_title(conversation_messages) -> str:
@@ -1546,7 +2325,7 @@ async def generate_title(conversation_messages) -> str:
     messages.append({"role": "user", "content": title_prompt})
 
     try:
-        azure_openai_client = await init_openai_client()
+        azure_openai_client = await get_openai_client()
         response = await azure_openai_client.chat.completions.create(
             model=app_settings.azure_openai.model, messages=messages, temperature=1, max_tokens=64
         )
@@ -1558,12 +2337,128 @@ async def generate_title(conversation_messages) -> str:
         return messages[-2]["content"]
 
 
+def provisional_title(conversation_messages) -> str:
+    content = conversation_messages[-1]["content"] if conversation_messages else ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+    title = " ".join(str(content).split())
+    if len(title) > PROVISIONAL_TITLE_MAX_LENGTH:
+        title = title[:PROVISIONAL_TITLE_MAX_LENGTH - 3].rstrip() + "..."
+    return title or "New conversation"
+
+
+async def save_user_message(cosmos_conversation_client, user_id, conversation_id, message, title=None):
+    """Saves the user message, creating the conversation first when a title is given."""
+    if title is not None:
+        await cosmos_conversation_client.create_conversation(
+            user_id=user_id, title=title, conversation_id=conversation_id
+        )
+
+    try:
+        createdMessageValue = await cosmos_conversation_client.create_message(
+            uuid=str(uuid.uuid4()),
+            conversation_id=conversation_id,
+            user_id=user_id,
+            input_message=message,
+        )
+        if createdMessageValue == "Conversation not found":
+            raise Exception(
+                "Conversation not found for the given conversation ID: "
+                + conversation_id
+                + "."
+            )
+    except Exception:
+        if title is not None:
+            # don't leave an empty conversation behind
+            try:
+                await cosmos_conversation_client.delete_conversation(user_id, conversation_id)
+            except Exception:
+                logging.exception("Exception while removing the unsaved conversation")
+        raise
+
+
+def get_history_write_stats():
+    if not hasattr(current_app, "history_write_stats"):
+        current_app.history_write_stats = HistoryWriteStats()
+
+    return current_app.history_write_stats
+
+
+def start_title_generation(user_id, conversation_id, conversation_messages, current_title, after=None) -> asyncio.Task:
+    cosmos_conversation_client = current_app.cosmos_conversation_client
+
+    async def generate_and_save():
+        title = await generate_title(conversation_messages)
+        if after is not None:
+            # the message write also updates the conversation
+            try:
+                await asyncio.shield(after)
+            except Exception:
+                return title
+        try:
+            # unless the user renamed the conversation in the meantime
+            await cosmos_conversation_client.patch_conversation(
+                user_id, conversation_id, {"title": title}, expected={"title": current_title}
+            )
+        except Exception:
+            logging.exception("Exception while saving the generated title")
+        return title
+
+    task = asyncio.create_task(generate_and_save())
+    # keep a reference until done, the request may finish first
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def wait_for_title(title_task):
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(title_task),
+            timeout=app_settings.chat_history.title_wait_seconds
+        )
+    except asyncio.TimeoutError:
+        logging.info("Generated title not ready, it will be saved in the background")
+    except Exception:
+        logging.exception("Exception while generating title")
+    return None
+
+
+def with_title(response: dict, title: str) -> dict:
+    history_metadata = response.get("history_metadata")
+    if not title or history_metadata is None:
+        return response
+
+    return {**response, "history_metadata": {**history_metadata, "title": title}}
+
+
+async def summarize_conversation_history(previous_summary, conversation_messages) -> str:
+    summary_prompt = "Summarize the conversation so far in a few sentences, keeping names, facts and decisions the user may refer back to. Do not include any other commentary."
+
+    messages = []
+    if previous_summary:
+        messages.append({"role": "assistant", "content": SUMMARY_PREFIX + previous_summary})
+    messages.extend(conversation_messages)
+    messages.append({"role": "user", "content": summary_prompt})
+
+    azure_openai_client = await get_openai_client()
+    response = await azure_openai_client.chat.completions.create(
+        model=app_settings.azure_openai.model,
+        messages=messages,
+        temperature=0,
+        max_tokens=app_settings.history_window.summary_max_tokens
+    )
+
+    return response.choices[0].message.content
+
+
 @bp.route("/debug/cosmos", methods=["GET"])
 async def debug_cosmos():
     """
     Debug endpoint to check CosmosDB connection and database structure.
     """
-    if not app_settings.chat_history:
+    if not app_settings.chat_history or app_settings.chat_history.backend != "cosmos":
         logger.error("CosmosDB not configured - no chat_history settings found")
         return jsonify({
             "error": "CosmosDB not configured", 
@@ -1658,7 +2553,7 @@ async def debug_cosmos_create():
     """
     Debug endpoint to attempt to create the CosmosDB database and container if they don't exist.
     """
-    if not app_settings.chat_history:
+    if not app_settings.chat_history or app_settings.chat_history.backend != "cosmos":
         logger.error("CosmosDB not configured - no chat_history settings found")
         return jsonify({
             "error": "CosmosDB not configured", 
@@ -1778,7 +2673,7 @@ async def debug_cosmos_permissions():
     """
     Debug endpoint to test specific permissions to the CosmosDB database and container.
     """
-    if not app_settings.chat_history:
+    if not app_settings.chat_history or app_settings.chat_history.backend != "cosmos":
         logger.error("CosmosDB not configured - no chat_history settings found")
         return jsonify({
             "error": "CosmosDB not configured", 
@@ -1993,30 +2888,8 @@ async def debug_feedback():
             logger.error("CosmosDB client is not initialized")
             return jsonify({"error": "CosmosDB is not configured or not working"}), 500
         
-        # Query for all messages with feedback
-        feedback_query = """
-        SELECT c.id, c.feedback, c.content, c.role, c.conversationId, c.createdAt, c.updatedAt 
-        FROM c 
-        WHERE c.userId = @userId 
-        AND c.type = 'message' 
-        AND IS_DEFINED(c.feedback) 
-        AND c.feedback <> ''
-        ORDER BY c.updatedAt DESC
-        """
-        
-        parameters = [
-            {
-                'name': '@userId',
-                'value': user_id
-            }
-        ]
-        
         feedback_items = []
-        # Simplified query without query_options or partition_key
-        async for item in current_app.cosmos_conversation_client.container_client.query_items(
-            query=feedback_query,
-            parameters=parameters
-        ):
+        for item in await current_app.cosmos_conversation_client.get_feedback_messages(user_id):
             # Truncate content to avoid overwhelming the response
             if 'content' in item and item['content']:
                 item['content'] = item['content'][:100] + "..." if len(item['content']) > 100 else item['content']
@@ -2030,44 +2903,13 @@ async def debug_feedback():
             conversation_id = item.get('conversationId')
             if conversation_id:
                 # Find the most recent user message before this assistant message
-                user_query_search = """
-                SELECT TOP 1 c.content 
-                FROM c 
-                WHERE c.conversationId = @conversationId 
-                AND c.userId = @userId 
-                AND c.type = 'message' 
-                AND c.role = 'user' 
-                AND c.createdAt < @createdAt 
-                ORDER BY c.createdAt DESC
-                """
-                
-                query_params = [
-                    {
-                        'name': '@conversationId',
-                        'value': conversation_id
-                    },
-                    {
-                        'name': '@userId',
-                        'value': user_id
-                    },
-                    {
-                        'name': '@createdAt',
-                        'value': item.get('createdAt')
-                    }
-                ]
-                
-                user_queries = []
-                # Simplified query without query_options or partition_key
-                async for query_item in current_app.cosmos_conversation_client.container_client.query_items(
-                    query=user_query_search,
-                    parameters=query_params
-                ):
-                    if 'content' in query_item:
-                        content = query_item['content']
-                        user_queries.append(content[:100] + "..." if len(content) > 100 else content)
+                user_query = await current_app.cosmos_conversation_client.get_previous_user_message(
+                    user_id, conversation_id, item.get('createdAt')
+                )
                 
-                if user_queries:
-                    item['user_query'] = user_queries[0]
+                if user_query and 'content' in user_query:
+                    content = user_query['content']
+                    item['user_query'] = content[:100] + "..." if len(content) > 100 else content
                 else:
                     item['user_query'] = "No associated user query found"
         
@@ -2099,42 +2941,19 @@ async def similar_questions():
             logger.error("CosmosDB client is not initialized")
             return jsonify({"error": "Database connection not available"}), 500
             
-        cosmos_client = current_app.cosmos_conversation_client
-        logger.info(f"CosmosDB client obtained, container: {cosmos_client.container_name}")
-
-        # Get all user questions from Cosmos DB
-        questions = []
+        # Find similar questions (simple case-insensitive substring match for now)
         try:
-            logger.info("Executing query to find user messages...")
-            # Remove the problematic parameter
-            async for item in cosmos_client.container_client.query_items(
-                query="SELECT c.id, c.content FROM c WHERE c.type='message' AND c.role='user'"
-            ):
-                questions.append(item)
-            
-            logger.info(f"Found {len(questions)} total user questions")
+            logger.info("Searching user messages for similar questions...")
+            # Return up to 3 similar questions (1-3, not always 3)
+            similar = await current_app.cosmos_conversation_client.find_user_messages(query, 3)
         except Exception as query_error:
-            logger.error(f"Error querying CosmosDB: {str(query_error)}")
+            logger.error(f"Error querying chat history: {str(query_error)}")
             return jsonify({"error": f"Database query error: {str(query_error)}"}), 500
 
-        # Find similar questions (simple substring match for now)
-        try:
-            def is_similar(q):
-                if not q.get('content'):
-                    return False
-                return query.lower() in q['content'].lower()
-                
-            similar = [q for q in questions if is_similar(q)]
-            logger.info(f"Found {len(similar)} similar questions matching query")
-            
-            # Return up to 3 similar questions (1-3, not always 3)
-            result = [{"id": q["id"], "text": q["content"]} for q in similar[:3]]
-            logger.info(f"Returning {len(result)} follow-up questions: {result}")
-            
-            return jsonify(result)
-        except Exception as proc_error:
-            logger.error(f"Error processing results: {str(proc_error)}")
-            return jsonify({"error": f"Error processing results: {str(proc_error)}"}), 500
+        result = [{"id": q["id"], "text": q["content"]} for q in similar]
+        logger.info(f"Returning {len(result)} follow-up questions: {result}")
+        
+        return jsonify(result)
             
     except Exception as e:
         logger.exception(f"Unhandled exception in similar_questions: {str(e)}")
@@ -2160,15 +2979,9 @@ async def get_answer_by_id(message_id):
         
         # Try to get the message directly
         try:
-            # First try to query for the message
-            query = f"SELECT * FROM c WHERE c.id = '{message_id}'"
-            message = None
-            
-            async for item in cosmos_client.container_client.query_items(query=query):
-                message = item
-                break
+            message = await cosmos_client.find_item(message_id)
                 
-            if not message:
+            if not message or message.get("type") != "message":
                 logger.error(f"Message with ID {message_id} not found")
                 return jsonify({"error": "Message not found"}), 404
                 
@@ -2181,18 +2994,9 @@ async def get_answer_by_id(message_id):
                     return jsonify({"error": "No conversation ID associated with message"}), 404
                     
                 # Find the assistant response that follows this user message
-                query = f"""
-                SELECT * FROM c 
-                WHERE c.conversationId = '{conversation_id}' 
-                AND c.role = 'assistant' 
-                AND c.createdAt > '{message.get("createdAt")}'
-                ORDER BY c.createdAt
-                """
-                
-                assistant_message = None
-                async for item in cosmos_client.container_client.query_items(query=query):
-                    assistant_message = item
-                    break
+                assistant_message = await cosmos_client.get_next_assistant_message(
+                    message.get("userId"), conversation_id, message.get("createdAt")
+                )
                     
                 if assistant_message:
                     return jsonify({"answer": assistant_message.get("content", ""), "id": assistant_message.get("id")})
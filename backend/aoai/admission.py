@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+from backend.cache.ttl_cache import TTLCache
+from backend.tokens import count_messages_tokens
+
+
+def estimate_request_tokens(model_args: dict, model_name: str = None) -> int:
+    """
+    Estimates what a request counts against the tokens-per-minute quota.
+    Azure OpenAI charges the prompt plus max_tokens when admitting a
+    request, so the same upper bound is used here.
+    """
+    return (
+        count_messages_tokens(model_args.get("messages", []), model_name) +
+        (model_args.get("max_tokens") or 0)
+    )
+
+
+class TokenBucket():
+    """
+    Refills continuously at rate_per_minute up to capacity (one minute's
+    worth by default). The level may go negative when a reservation is
+    larger than what is left; later callers then wait for the debt to clear.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def time_until_available(self, amount: float) -> float:
+        self._refill()
+        # a request larger than the bucket only has to wait for a full bucket
+        missing = min(amount, self.capacity) - self._level
+        return max(missing / self.rate_per_second, 0)
+
+    def consume(self, amount: float):
+        self._refill()
+        self._level -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self._level = min(self.capacity, self._level + amount)
+
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.status_code = 429
+        self.retry_after = retry_after
+
+
+class _Limits():
+    def __init__(self, tokens_per_minute: float = None, requests_per_minute: float = None):
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+
+    def time_until_available(self, tokens: int) -> float:
+        waits = [0.0]
+        if self.tokens:
+            waits.append(self.tokens.time_until_available(tokens))
+        if self.requests:
+            waits.append(self.requests.time_until_available(1))
+        return max(waits)
+
+    def consume(self, tokens: int):
+        if self.tokens:
+            self.tokens.consume(tokens)
+        if self.requests:
+            self.requests.consume(1)
+
+    def refund(self, tokens: int):
+        if self.tokens:
+            self.tokens.refund(tokens)
+        if self.requests:
+            self.requests.refund(1)
+
+
+class AdmissionController():
+    """
+    Token-bucket admission control in front of Azure OpenAI. A request first
+    waits for its user's fair share (per-user tokens and requests per
+    minute), then queues in arrival order for the shared budget. Requests
+    that would wait longer than max_wait_seconds, or find the queue full,
+    are rejected with the time after which a retry can succeed.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: float = None,
+        requests_per_minute: float = None,
+        user_tokens_per_minute: float = None,
+        user_requests_per_minute: float = None,
+        max_queue_size: int = 100,
+        max_wait_seconds: float = 10,
+        max_users: int = 10000
+    ):
+        self.limits = _Limits(tokens_per_minute, requests_per_minute)
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self.user_requests_per_minute = user_requests_per_minute
+        self.max_queue_size = max_queue_size
+        self.max_wait_seconds = max_wait_seconds
+        # idle users' buckets are full again after a minute, so dropping them is harmless
+        self._user_limits = TTLCache(max_size=max_users, ttl_seconds=120)
+        self._queue_lock = asyncio.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds_seen = 0.0
+
+    def _get_user_limits(self, user_id):
+        if not (self.user_tokens_per_minute or self.user_requests_per_minute):
+            return None
+
+        user_limits = self._user_limits.get(user_id)
+        if user_limits is None:
+            user_limits = _Limits(self.user_tokens_per_minute, self.user_requests_per_minute)
+        # refresh the entry on every use so active users keep their bucket
+        self._user_limits.set(user_id, user_limits)
+        return user_limits
+
+    async def _wait_for(self, limits: _Limits, tokens: int, deadline: float):
+        while True:
+            wait = limits.time_until_available(tokens)
+            if wait <= 0:
+                return
+
+            if time.monotonic() + wait > deadline:
+                raise AdmissionRejectedError("Rate limit exceeded, retry later", wait)
+
+            await asyncio.sleep(wait)
+
+    async def acquire(self, user_id, tokens: int):
+        if self.queue_depth >= self.max_queue_size:
+            self.rejected += 1
+            raise AdmissionRejectedError(
+                "Too many requests are waiting, retry later",
+                self.limits.time_until_available(tokens) or 1
+            )
+
+        started_at = time.monotonic()
+        deadline = started_at + self.max_wait_seconds
+        user_limits = self._get_user_limits(user_id)
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            if user_limits:
+                await self._wait_for(user_limits, tokens, deadline)
+                user_limits.consume(tokens)
+
+            try:
+                async with self._queue_lock:
+                    await self._wait_for(self.limits, tokens, deadline)
+                    self.limits.consume(tokens)
+            except BaseException:
+                if user_limits:
+                    user_limits.refund(tokens)
+                raise
+        except AdmissionRejectedError:
+            self.rejected += 1
+            raise
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - started_at
+        self.admitted += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds_seen = max(self.max_wait_seconds_seen, waited)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_wait_seconds": self.total_wait_seconds / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait_seconds_seen,
+        }
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+
+class CachedTokenProvider():
+    """
+    Async bearer token provider for AsyncAzureOpenAI that reuses the current
+    Entra ID token until it is close to expiry, so requests do not pay for a
+    credential round trip each time.
+    """
+
+    def __init__(self, credential, scope: str, refresh_margin_seconds: int = 300):
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._token = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._token is not None and
+            self._token.expires_on - self.refresh_margin_seconds > time.time()
+        )
+
+    async def __call__(self) -> str:
+        if self._is_fresh():
+            return self._token.token
+
+        async with self._lock:
+            # another caller may have refreshed the token while we waited
+            if not self._is_fresh():
+                logging.debug(f"Refreshing Entra ID token for scope {self.scope}")
+                self._token = await self.credential.get_token(self.scope)
+
+        return self._token.token
+
+    async def close(self):
+        await self.credential.close()
+
+
+def create_pooled_http_client(
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+) -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+    )
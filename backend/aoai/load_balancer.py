@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+from openai import APIConnectionError, APIStatusError
+
+# Status codes that mean "this deployment cannot serve the request right
+# now" rather than "the request is wrong", so another deployment is tried.
+THROTTLED_STATUS_CODES = frozenset({429, 503})
+FAILOVER_STATUS_CODES = frozenset({408, 500, 502, 504})
+
+
+def get_retry_after(headers, default: float) -> float:
+    """Reads the cooldown from retry-after-ms / retry-after response headers."""
+    if not headers:
+        return default
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+
+    return default
+
+
+class DeploymentBackend():
+    """
+    One Azure OpenAI deployment in the pool, with its client, routing
+    weight and priority tier, plus the health state used for routing.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, client, deployment: str, weight: float = 1.0, priority: int = 0):
+        self.name = name
+        self.client = client
+        self.deployment = deployment
+        self.weight = weight
+        self.priority = priority
+        self.outstanding = 0
+        self.cooldown_until = 0.0
+        self.circuit_state = self.CLOSED
+        self.circuit_open_until = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.average_latency = None
+
+    def is_available(self, now: float) -> bool:
+        if self.cooldown_until > now:
+            return False
+
+        if self.circuit_state == self.OPEN:
+            return self.circuit_open_until <= now
+
+        if self.circuit_state == self.HALF_OPEN:
+            # only one trial request while half open
+            return self.outstanding == 0
+
+        return True
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "deployment": self.deployment,
+            "priority": self.priority,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "circuit_state": self.circuit_state,
+            "cooldown_seconds": max(self.cooldown_until - now, 0),
+            "average_latency_seconds": self.average_latency,
+        }
+
+
+class NoDeploymentAvailableError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("All Azure OpenAI deployments are throttled or unavailable")
+        self.status_code = 429
+        self.retry_after = retry_after
+
+
+class DeploymentPool():
+    """
+    Routes calls across Azure OpenAI deployments. The lowest priority tier
+    with an available deployment is used; within a tier the deployment with
+    the fewest outstanding requests relative to its weight wins.
+
+    A 429/503 puts the deployment in cooldown for its Retry-After and the
+    call fails over to the next deployment. Repeated server or connection
+    errors open the deployment's circuit for circuit_open_seconds, after
+    which a single trial request decides whether it closes again.
+    """
+
+    def __init__(
+        self,
+        backends: list,
+        failure_threshold: int = 3,
+        circuit_open_seconds: float = 30,
+        default_cooldown_seconds: float = 10,
+        latency_smoothing: float = 0.2
+    ):
+        self.backends = backends
+        self.failure_threshold = failure_threshold
+        self.circuit_open_seconds = circuit_open_seconds
+        self.default_cooldown_seconds = default_cooldown_seconds
+        self.latency_smoothing = latency_smoothing
+
+    def select(self, exclude=()):
+        now = time.monotonic()
+        candidates = [
+            backend for backend in self.backends
+            if backend not in exclude and backend.is_available(now)
+        ]
+        if not candidates:
+            return None
+
+        top_priority = min(backend.priority for backend in candidates)
+        return min(
+            (backend for backend in candidates if backend.priority == top_priority),
+            key=lambda backend: (backend.load(), backend.requests)
+        )
+
+    def _next_available_in(self) -> float:
+        now = time.monotonic()
+        waits = [
+            max(backend.cooldown_until, backend.circuit_open_until if backend.circuit_state == DeploymentBackend.OPEN else 0) - now
+            for backend in self.backends
+        ]
+        return max(min(waits), 0) if waits else self.default_cooldown_seconds
+
+    async def call(self, operation):
+        """
+        Awaits operation(backend) on the selected deployment, failing over on
+        throttling and server errors. Client errors are raised immediately.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend = self.select(exclude=tried)
+            if backend is None:
+                if last_error is None or getattr(last_error, "status_code", None) in THROTTLED_STATUS_CODES:
+                    raise NoDeploymentAvailableError(self._next_available_in()) from last_error
+                raise last_error
+
+            tried.append(backend)
+            if backend.circuit_state == DeploymentBackend.OPEN:
+                backend.circuit_state = DeploymentBackend.HALF_OPEN
+
+            backend.outstanding += 1
+            backend.requests += 1
+            started_at = time.monotonic()
+            try:
+                result = await operation(backend)
+            except APIStatusError as e:
+                if e.status_code in THROTTLED_STATUS_CODES:
+                    self._record_throttled(backend, e)
+                elif e.status_code in FAILOVER_STATUS_CODES:
+                    self._record_failure(backend, e)
+                else:
+                    raise
+                last_error = e
+                continue
+            except (APIConnectionError, asyncio.TimeoutError) as e:
+                self._record_failure(backend, e)
+                last_error = e
+                continue
+            finally:
+                backend.outstanding -= 1
+
+            self._record_success(backend, time.monotonic() - started_at)
+            return result
+
+    def _record_success(self, backend, latency: float):
+        backend.successes += 1
+        backend.consecutive_failures = 0
+        backend.circuit_state = DeploymentBackend.CLOSED
+        if backend.average_latency is None:
+            backend.average_latency = latency
+        else:
+            backend.average_latency += self.latency_smoothing * (latency - backend.average_latency)
+
+    def _record_throttled(self, backend, error):
+        backend.throttled += 1
+        if backend.circuit_state == DeploymentBackend.HALF_OPEN:
+            backend.circuit_state = DeploymentBackend.CLOSED
+        cooldown = get_retry_after(error.response.headers, self.default_cooldown_seconds)
+        backend.cooldown_until = time.monotonic() + cooldown
+        logging.warning(f"Azure OpenAI deployment {backend.name} throttled ({error.status_code}), cooling down for {cooldown:.1f}s")
+
+    def _record_failure(self, backend, error):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if (
+            backend.circuit_state == DeploymentBackend.HALF_OPEN or
+            backend.consecutive_failures >= self.failure_threshold
+        ):
+            backend.circuit_state = DeploymentBackend.OPEN
+            backend.circuit_open_until = time.monotonic() + self.circuit_open_seconds
+            logging.warning(f"Opening circuit for Azure OpenAI deployment {backend.name} after error: {error}")
+
+    def stats(self) -> dict:
+        return {backend.name: backend.stats() for backend in self.backends}
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.client.close()
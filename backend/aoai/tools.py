@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+
+
+class ToolRegistry():
+    """
+    Immutable snapshot of the Azure Functions tool definitions. A refresh
+    builds a new registry and swaps it in, so in-flight requests keep a
+    consistent view of the tools they were started with.
+    """
+
+    def __init__(self, tools=()):
+        self.tools = tuple(tools)
+        self.names = frozenset(tool["function"]["name"] for tool in self.tools)
+
+    def __contains__(self, name) -> bool:
+        return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+
+EMPTY_TOOL_REGISTRY = ToolRegistry()
+
+
+class AzureFunctionsToolLoader():
+    """
+    Loads tool metadata from the Azure Functions "tools" endpoint once at
+    startup and optionally refreshes it in the background every
+    refresh_interval_seconds.
+    """
+
+    def __init__(self, tools_url: str, refresh_interval_seconds: float = 0):
+        self.tools_url = tools_url
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.registry = EMPTY_TOOL_REGISTRY
+        self.loaded_at = None
+        self._refresh_task = None
+        self._load_lock = asyncio.Lock()
+
+    async def load(self) -> ToolRegistry:
+        # Concurrent reloads (e.g. admin endpoint during a scheduled refresh)
+        # are serialized so only one fetch hits the tools endpoint at a time.
+        async with self._load_lock:
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(self.tools_url)
+                if response.status_code == httpx.codes.OK:
+                    self.registry = ToolRegistry(json.loads(response.text))
+                    self.loaded_at = time.time()
+                    logging.info(f"Loaded {len(self.registry)} Azure Functions tools")
+                else:
+                    logging.error(f"An error occurred while getting OpenAI Function Call tools metadata: {response.status_code}")
+            except Exception as e:
+                # keep serving the last known good registry
+                logging.exception(f"Exception while loading OpenAI Function Call tools metadata: {e}")
+
+        return self.registry
+
+    def start_refresh(self):
+        if self.refresh_interval_seconds and self.refresh_interval_seconds > 0 and not self._refresh_task:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval_seconds)
+            await self.load()
+
+    async def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+
+class AzureFunctionsToolExecutor():
+    """
+    Invokes the Azure Functions "tool" endpoint over a shared, pooled HTTP
+    client. Tool calls from one model turn run concurrently, bounded by
+    max_concurrency, and each call is limited to timeout_seconds.
+    """
+
+    def __init__(
+        self,
+        tool_url: str,
+        timeout_seconds: float = 30.0,
+        max_concurrency: int = 4,
+        http_client: httpx.AsyncClient = None
+    ):
+        self.tool_url = tool_url
+        self.timeout_seconds = timeout_seconds
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency
+            )
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def call(self, function_name: str, function_arguments: str) -> str:
+        body = {
+            "tool_name": function_name,
+            "tool_arguments": json.loads(function_arguments)
+        }
+        async with self._semaphore:
+            async with asyncio.timeout(self.timeout_seconds):
+                response = await self.http_client.post(
+                    self.tool_url,
+                    json=body,
+                    timeout=self.timeout_seconds
+                )
+        response.raise_for_status()
+
+        return response.text
+
+    async def _call_or_error(self, function_name: str, function_arguments: str) -> str:
+        # A failing tool should not fail the whole turn; the model is given
+        # the error as the tool result instead.
+        try:
+            return await self.call(function_name, function_arguments)
+        except TimeoutError:
+            logging.error(f"Tool call {function_name} timed out after {self.timeout_seconds}s")
+            return json.dumps({"error": f"Tool {function_name} timed out"})
+        except Exception as e:
+            logging.exception(f"Exception in tool call {function_name}: {e}")
+            return json.dumps({"error": f"Tool {function_name} failed: {str(e)}"})
+
+    async def call_many(self, tool_calls) -> list:
+        """
+        Run (function_name, function_arguments) pairs concurrently and
+        return the results in the same order as tool_calls.
+        """
+        return await asyncio.gather(
+            *(self._call_or_error(name, arguments) for name, arguments in tool_calls)
+        )
+
+    async def close(self):
+        await self.http_client.aclose()
@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from backend.cache.ttl_cache import TTLCache
+
+# Model arguments that identify the caller rather than the question and would
+# otherwise make every key unique.
+IGNORED_MODEL_ARGS = frozenset({"user", "stream"})
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_content(content):
+    if isinstance(content, str):
+        return _WHITESPACE.sub(" ", content).strip()
+
+    return content
+
+
+def normalize_model_args(model_args: dict) -> dict:
+    normalized = {
+        key: value for key, value in model_args.items()
+        if key not in IGNORED_MODEL_ARGS
+    }
+    normalized["messages"] = [
+        {**message, "content": normalize_content(message.get("content"))}
+        for message in model_args.get("messages", [])
+    ]
+    return normalized
+
+
+def make_cache_key(model_args: dict, scope: str = None) -> str:
+    """
+    Hashes the normalized model arguments, which include the messages and the
+    datasource configuration (and with it any per-user security filter).
+    """
+    payload = json.dumps(
+        {"scope": scope, "model_args": normalize_model_args(model_args)},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCacheStore(ABC):
+    @abstractmethod
+    async def get(self, key: str):
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value):
+        pass
+
+    async def clear(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemoryResponseCacheStore(ResponseCacheStore):
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600):
+        self._cache = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+
+    async def get(self, key: str):
+        return self._cache.get(key)
+
+    async def set(self, key: str, value):
+        self._cache.set(key, value)
+
+    async def clear(self):
+        self._cache.clear()
+
+
+class FileResponseCacheStore(ResponseCacheStore):
+    """
+    Stores one JSON file per entry so cached responses survive restarts and
+    can be shared by workers on the same host. Reads touch the file so the
+    least recently used entries are the ones evicted.
+    """
+
+    def __init__(self, directory: str, max_size: int = 1024, ttl_seconds: float = 3600):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if entry.get("expires_at", 0) <= time.time():
+            self._remove(path)
+            return None
+
+        os.utime(path)
+        return entry.get("value")
+
+    def _write(self, key: str, value):
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump({"expires_at": time.time() + self.ttl_seconds, "value": value}, cache_file)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+
+        if len(entries) <= self.max_size:
+            return
+
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_size]:
+            self._remove(path)
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                self._remove(entry.path)
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value):
+        await asyncio.to_thread(self._write, key, value)
+
+    async def clear(self):
+        await asyncio.to_thread(self._clear)
+
+
+class ResponseCache():
+    """
+    Exact-match cache of chat responses. Streamed responses are stored as the
+    list of formatted frames and replayed as a synthetic stream; complete
+    responses are stored as the formatted response.
+    """
+
+    def __init__(self, store: ResponseCacheStore, per_user: bool = True):
+        self.store = store
+        self.per_user = per_user
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, model_args: dict, user_id: str = None, stream: bool = True) -> str:
+        scope = f"{'stream' if stream else 'complete'}:{user_id if self.per_user else ''}"
+        return make_cache_key(model_args, scope)
+
+    async def get(self, key: str):
+        try:
+            value = await self.store.get(key)
+        except Exception as e:
+            logging.warning(f"Response cache read failed: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    async def set(self, key: str, value):
+        try:
+            await self.store.set(key, value)
+        except Exception as e:
+            logging.warning(f"Response cache write failed: {e}")
+
+    async def clear(self):
+        await self.store.clear()
+
+    async def close(self):
+        await self.store.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def strip_response_metadata(response: dict) -> dict:
+    return {
+        key: value for key, value in response.items()
+        if key not in ("history_metadata", "apim-request-id")
+    }
+
+
+def restore_response(response: dict, response_id: str, history_metadata: dict) -> dict:
+    """
+    Rebuilds a cached response for the current request. Each replay gets a
+    fresh id because clients store the id as the id of the answer message.
+    """
+    if not response:
+        return response
+
+    return {
+        **response,
+        "id": response_id,
+        "created": int(time.time()),
+        "history_metadata": history_metadata,
+        "apim-request-id": None,
+    }
+
+
+async def replay_stream(frames: list, history_metadata: dict):
+    response_id = str(uuid.uuid4())
+    for frame in frames:
+        yield restore_response(frame, response_id, history_metadata)
+
+
+async def record_stream(stream, on_complete):
+    """
+    Passes the stream through, collecting the frames, and calls on_complete
+    only if the stream finished without error.
+    """
+    frames = []
+    async for frame in stream:
+        if frame:
+            frames.append(strip_response_metadata(frame))
+        yield frame
+
+    await on_complete(frames)
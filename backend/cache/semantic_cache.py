@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from backend.cache.response_cache import normalize_content, normalize_model_args
+from backend.cache.ttl_cache import TTLCache
+
+_WORDS = re.compile(r"\w+")
+
+
+class HashingEmbedder():
+    """
+    Deterministic bag-of-words embedding using feature hashing. Needs no
+    model or network access, which makes it useful for tests and as an
+    offline stand-in; it only matches questions that share most words.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    async def __call__(self, text: str):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _WORDS.findall(text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+
+        return vector
+
+
+class AzureOpenAIEmbedder():
+    """Embeds text with an Azure OpenAI embedding deployment."""
+
+    def __init__(self, get_client, deployment: str):
+        self.get_client = get_client
+        self.deployment = deployment
+
+    async def __call__(self, text: str):
+        client = await self.get_client()
+        response = await client.embeddings.create(model=self.deployment, input=text)
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+
+class VectorIndex():
+    """
+    Fixed-capacity in-memory index of unit vectors searched by brute-force
+    cosine similarity. When full, the oldest entry is overwritten. Each
+    entry belongs to a partition and only entries of the queried partition
+    that have not expired can match.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        if np is None:
+            raise RuntimeError("numpy is required for the semantic response cache")
+
+        self.max_size = max_size
+        self._vectors = None
+        self._partitions = np.empty(max_size, dtype=object)
+        self._expires_at = np.zeros(max_size, dtype=np.float64)
+        self._values = [None] * max_size
+        self._next = 0
+        self._count = 0
+
+    def add(self, partition: str, vector, value, ttl_seconds: float):
+        vector = _unit(vector)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+        slot = self._next
+        self._vectors[slot] = vector
+        self._partitions[slot] = partition
+        self._expires_at[slot] = time.monotonic() + ttl_seconds
+        self._values[slot] = value
+        self._next = (slot + 1) % self.max_size
+        self._count = min(self._count + 1, self.max_size)
+
+    def search(self, partition: str, vector):
+        """Returns (similarity, value) of the nearest live entry, or (None, None)."""
+        if not self._count:
+            return None, None
+
+        scores = self._vectors[:self._count] @ _unit(vector)
+        live = (self._partitions[:self._count] == partition) & (self._expires_at[:self._count] > time.monotonic())
+        if not live.any():
+            return None, None
+
+        scores = np.where(live, scores, -np.inf)
+        best = int(np.argmax(scores))
+        return float(scores[best]), self._values[best]
+
+    def clear(self):
+        self._partitions[:] = None
+        self._values = [None] * self.max_size
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def datasource_fingerprint(datasource_config: dict, index_version: str = None) -> str:
+    payload = json.dumps([datasource_config, index_version], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexVersionFile():
+    """
+    Index version label and invalidation generation kept in a file, so every
+    worker on the host sees the changes made through the admin route. read()
+    checks the modification time at most once per check_interval_seconds and
+    only opens the file when it changed, so it is cheap enough per request.
+    A file holding just a label, e.g. written by a deployment script, is
+    read as that index version.
+    """
+
+    def __init__(self, path: str, check_interval_seconds: float = 1.0):
+        self.path = path
+        self.check_interval_seconds = check_interval_seconds
+        self._checked_at = None
+        self._mtime = None
+        self._state = None
+
+    def read(self):
+        """Returns {"index_version": ..., "generation": ...}, or None until the file is written."""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval_seconds:
+            return self._state
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._mtime = self._state = None
+            return None
+
+        if mtime != self._mtime:
+            with open(self.path, "r", encoding="utf-8") as version_file:
+                self._state = _parse_index_version_state(version_file.read())
+            self._mtime = mtime
+
+        return self._state
+
+    def write(self, index_version: str = None):
+        """Starts a new generation, keeping the current index version unless one is given."""
+        if index_version is None:
+            self._checked_at = None
+            index_version = (self.read() or {}).get("index_version")
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        state = {"index_version": index_version, "generation": uuid.uuid4().hex}
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as version_file:
+            json.dump(state, version_file)
+        os.replace(temp_path, self.path)
+
+        # the writer sees its own change without waiting for the next check
+        self._state, self._mtime, self._checked_at = state, os.stat(self.path).st_mtime_ns, time.monotonic()
+        return state
+
+
+def _parse_index_version_state(text: str):
+    text = text.strip()
+    if not text:
+        return None
+
+    try:
+        state = json.loads(text)
+    except ValueError:
+        state = None
+    if not isinstance(state, dict):
+        return {"index_version": text, "generation": None}
+
+    return {"index_version": state.get("index_version"), "generation": state.get("generation")}
+
+
+def split_question(model_args: dict):
+    """
+    Splits the request into the latest user question and everything the
+    answer also depends on: the rest of the conversation, the generation
+    parameters and the datasource configuration.
+    """
+    messages = model_args.get("messages", [])
+    if not messages or messages[-1].get("role") != "user":
+        return None, None
+
+    question = normalize_content(messages[-1].get("content"))
+    if not isinstance(question, str) or not question:
+        return None, None
+
+    context = normalize_model_args({**model_args, "messages": messages[:-1]})
+    return question, context
+
+
+class SemanticResponseCache():
+    """
+    Serves a cached answer when the latest user question is close enough to
+    a previously answered one asked in the same context (same preceding
+    conversation, parameters, datasource and scope).
+
+    All entries are dropped when the datasource fingerprint passed to
+    update_fingerprint changes, e.g. after the index has been rebuilt.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        similarity_threshold: float = 0.95,
+        max_size: int = 1024,
+        ttl_seconds: float = 3600,
+        per_user: bool = True,
+        fingerprint: str = None
+    ):
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.per_user = per_user
+        self.index = VectorIndex(max_size=max_size)
+        self._embeddings = TTLCache(max_size=256, ttl_seconds=60)
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _partition(self, context: dict, user_id: str, stream: bool) -> str:
+        scope = f"{'stream' if stream else 'complete'}:{user_id if self.per_user else ''}"
+        payload = json.dumps([scope, context], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def update_fingerprint(self, fingerprint: str) -> bool:
+        """Records the current datasource fingerprint; returns True if it changed."""
+        if fingerprint == self.fingerprint:
+            return False
+
+        self.fingerprint = fingerprint
+        self.invalidate()
+        return True
+
+    async def _embed(self, question: str):
+        # the embedding computed for a miss is reused when the answer is stored
+        vector = self._embeddings.get(question)
+        if vector is None:
+            vector = await self.embedder(question)
+            self._embeddings.set(question, vector)
+
+        return vector
+
+    async def get(self, model_args: dict, user_id: str = None, stream: bool = True):
+        question, context = split_question(model_args)
+        if question is None:
+            return None
+
+        similarity, value = self.index.search(
+            self._partition(context, user_id, stream),
+            await self._embed(question)
+        )
+        if similarity is None or similarity < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    async def set(self, model_args: dict, value, user_id: str = None, stream: bool = True):
+        question, context = split_question(model_args)
+        if question is None:
+            return
+
+        self.index.add(
+            self._partition(context, user_id, stream),
+            await self._embed(question),
+            value,
+            self.ttl_seconds
+        )
+
+    def invalidate(self):
+        self.index.clear()
+        self._embeddings.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.index),
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,171 @@
+import asyncio
+
+
+class StreamCancelledError(Exception):
+    """The shared source of a StreamBroadcast was cancelled before it was exhausted."""
+
+
+class SingleFlight():
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    coroutine and every caller that arrives while it is in flight awaits the
+    same result (or exception).
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+
+    async def run(self, key, coroutine_function, *args, **kwargs):
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(coroutine_function(*args, **kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        # shield so one cancelled waiter does not cancel the shared call
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._in_flight
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+
+class StreamBroadcast():
+    """
+    Reads one async iterator in a background task and buffers its items so
+    any number of subscribers can each iterate all of them, including
+    subscribers that join after the first items were produced. If every
+    subscriber leaves before the source is exhausted, the source is
+    cancelled unless cancel_without_subscribers is False; from then on the
+    broadcast is closing and must not be joined.
+    """
+
+    def __init__(self, source, cancel_without_subscribers: bool = True):
+        self._items = []
+        self._error = None
+        self._done = False
+        self._closing = False
+        self._subscribers = 0
+        self._cancel_without_subscribers = cancel_without_subscribers
+        self._item_added = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source):
+        try:
+            async for item in source:
+                self._items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            # subscribers see an upstream error, never a CancelledError of their own
+            self._error = StreamCancelledError("The shared upstream stream was cancelled")
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._notify()
+
+    def _notify(self):
+        self._item_added.set()
+        self._item_added = asyncio.Event()
+
+    def subscribe(self, start: int = 0):
+        """Iterates the items from index start on."""
+        self._subscribers += 1
+        return self._iterate(start)
+
+    async def _iterate(self, index: int):
+        try:
+            while True:
+                if index < len(self._items):
+                    yield self._items[index]
+                    index += 1
+                elif self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                else:
+                    await self._item_added.wait()
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0 and not self._done and self._cancel_without_subscribers:
+                self._closing = True
+                self._task.cancel()
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def closing(self) -> bool:
+        return self._closing
+
+    def add_done_callback(self, callback):
+        self._task.add_done_callback(lambda _: callback(self))
+
+
+class RequestCoalescer():
+    """
+    Lets identical concurrent requests share one upstream call. The first
+    caller for a key (the leader) runs the call; callers that arrive while
+    it is in flight receive the same result, or for streams a subscription
+    to the same buffered stream.
+    """
+
+    def __init__(self):
+        self._calls = SingleFlight()
+        self._stream_openers = SingleFlight()
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _count(self, is_leader: bool):
+        if is_leader:
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+    async def run(self, key, coroutine_function, *args, **kwargs):
+        """Returns (result, is_leader)."""
+        is_leader = key not in self._calls
+        self._count(is_leader)
+        return await self._calls.run(key, coroutine_function, *args, **kwargs), is_leader
+
+    async def stream(self, key, stream_factory, *args, **kwargs):
+        """
+        stream_factory is a coroutine function returning an async iterator.
+        Errors raised while opening the stream reach every caller. Returns
+        (iterator, is_leader).
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is not None and not broadcast.done and not broadcast.closing:
+            self._count(False)
+            return broadcast.subscribe(), False
+
+        is_leader = key not in self._stream_openers
+        self._count(is_leader)
+        broadcast = await self._stream_openers.run(key, self._open, key, stream_factory, *args, **kwargs)
+        return broadcast.subscribe(), is_leader
+
+    async def _open(self, key, stream_factory, *args, **kwargs):
+        broadcast = StreamBroadcast(await stream_factory(*args, **kwargs))
+        self._streams[key] = broadcast
+        broadcast.add_done_callback(lambda done: self._forget(key, done))
+        return broadcast
+
+    def _forget(self, key, broadcast):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def stats(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._streams),
+        }
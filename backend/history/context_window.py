@@ -0,0 +1,131 @@
+import hashlib
+import logging
+
+from backend.cache.ttl_cache import TTLCache
+from backend.tokens import count_message_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def split_turns(messages: list) -> list:
+    """Group messages into turns, each starting at a user message."""
+    turns = []
+    for message in messages:
+        if not message:
+            continue
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def drop_citations(turn: list) -> list:
+    return [
+        {k: v for k, v in message.items() if k != "context"} if "context" in message else message
+        for message in turn
+    ]
+
+
+def _turns_key(turns: list) -> str:
+    digest = hashlib.sha256()
+    for turn in turns:
+        for message in turn:
+            digest.update(f"{message.get('role')}\x00{message.get('content')}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ConversationHistoryWindow():
+    """
+    Trims the conversation history sent to the model so long chats stay
+    within a token budget. Applied to the raw request messages in order:
+
+    1. keep only the last max_turns turns (a turn starts at a user message)
+    2. drop citation context from all but the last citation_turns turns
+    3. drop the oldest turns until the rest fits in max_prompt_tokens
+    4. optionally replace the dropped turns with a rolling summary
+
+    The current (last) turn is always kept.
+    """
+
+    def __init__(
+        self,
+        max_prompt_tokens: int,
+        max_turns: int = None,
+        citation_turns: int = None,
+        summarizer=None,
+        model_name: str = None,
+        token_counter=None,
+        summary_cache_size: int = 1024,
+        summary_cache_ttl_seconds: float = 3600
+    ):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_turns = max_turns
+        self.citation_turns = citation_turns
+        self.summarizer = summarizer
+        self.model_name = model_name
+        self.token_counter = token_counter or (
+            lambda message: count_message_tokens(message, self.model_name)
+        )
+        self.summary_cache = TTLCache(
+            max_size=summary_cache_size,
+            ttl_seconds=summary_cache_ttl_seconds
+        )
+
+    async def trim(self, messages: list) -> list:
+        turns = split_turns(messages)
+        if not turns:
+            return messages
+
+        dropped = []
+        if self.max_turns and len(turns) > self.max_turns:
+            dropped = turns[:-self.max_turns]
+            turns = turns[-self.max_turns:]
+
+        if self.citation_turns is not None:
+            keep_from = max(len(turns) - self.citation_turns, 0)
+            turns = [
+                drop_citations(turn) if index < keep_from else turn
+                for index, turn in enumerate(turns)
+            ]
+
+        turn_tokens = [sum(self.token_counter(message) for message in turn) for turn in turns]
+        total_tokens = sum(turn_tokens)
+        while len(turns) > 1 and total_tokens > self.max_prompt_tokens:
+            dropped.append(turns.pop(0))
+            total_tokens -= turn_tokens.pop(0)
+
+        if dropped:
+            logging.debug(f"History window dropped {len(dropped)} turns, {total_tokens} tokens remain")
+
+        trimmed = [message for turn in turns for message in turn]
+        if dropped and self.summarizer:
+            summary = await self._summarize(dropped)
+            if summary:
+                trimmed.insert(0, {"role": "assistant", "content": SUMMARY_PREFIX + summary})
+
+        return trimmed
+
+    async def _summarize(self, dropped_turns: list) -> str:
+        key = _turns_key(dropped_turns)
+        summary = self.summary_cache.get(key)
+        if summary is not None:
+            return summary
+
+        # Rolling summary: if the previous request already summarized all
+        # but the newest dropped turn, only that turn needs summarizing.
+        previous_summary = self.summary_cache.get(_turns_key(dropped_turns[:-1]))
+        new_turns = dropped_turns[-1:] if previous_summary is not None else dropped_turns
+        new_messages = [
+            {"role": message.get("role"), "content": message.get("content")}
+            for turn in new_turns for message in turn
+            if message.get("role") in ("user", "assistant")
+        ]
+
+        try:
+            summary = await self.summarizer(previous_summary, new_messages)
+        except Exception as e:
+            logging.exception(f"Exception while summarizing conversation history: {e}")
+            return previous_summary
+
+        self.summary_cache.set(key, summary)
+        return summary
@@ -1,16 +1,51 @@
 import uuid
-from datetime import datetime
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import exceptions
-  
-class CosmosConversationClient():
+from azure.core import MatchConditions
+from backend.history.store import ConversationStore
+
+# Partition key paths whose value is known from the item id and user id,
+# which is what point reads need
+SUPPORTED_PARTITION_KEY_PATHS = ("/id", "/userId")
+
+# Fields of a conversation shown in the history list
+CONVERSATION_LIST_FIELDS = "c.id, c.title, c.createdAt, c.updatedAt"
+
+
+def decode_list_position(continuation_token):
+    """Parses a keyset continuation token of the conversation list; raises ValueError if it is malformed."""
+    if not continuation_token:
+        return None
+    try:
+        position = json.loads(continuation_token)
+    except ValueError as e:
+        raise ValueError("Invalid continuation token") from e
+
+    if (
+        not isinstance(position, dict)
+        or not isinstance(position.get('updatedAt'), str)
+        or not isinstance(position.get('ids'), list)
+        or not all(isinstance(item_id, str) for item_id in position['ids'])
+    ):
+        raise ValueError("Invalid continuation token")
+    return position
+
+
+class CosmosConversationClient(ConversationStore):
     
-    def __init__(self, cosmosdb_endpoint: str, credential: any, database_name: str, container_name: str, enable_message_feedback: bool = False):
+    def __init__(self, cosmosdb_endpoint: str, credential: any, database_name: str, container_name: str, enable_message_feedback: bool = False, delete_concurrency: int = 16):
         self.cosmosdb_endpoint = cosmosdb_endpoint
         self.credential = credential
         self.database_name = database_name
         self.container_name = container_name
         self.enable_message_feedback = enable_message_feedback
+        self.delete_concurrency = delete_concurrency
+        # containers created by /history/ensure; updated from the container in ensure()
+        self.partition_key_path = "/id"
         try:
             self.cosmosdb_client = CosmosClient(self.cosmosdb_endpoint, credential=credential)
         except exceptions.CosmosHttpResponseError as e:
@@ -28,13 +63,7 @@ class CosmosConversationClient():
             self.container_client = self.database_client.get_container_client(container_name)
         except exceptions.CosmosResourceNotFoundError:
             raise ValueError("Invalid CosmosDB container name") 
-        
 
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.close()
 
     async def close(self):
         if hasattr(self, 'cosmosdb_client') and self.cosmosdb_client:
@@ -56,12 +85,44 @@ class CosmosConversationClient():
             container_info = await self.container_client.read()
         except:
             return False, f"CosmosDB container {self.container_name} not found"
+
+        partition_key_path = container_info.get('partitionKey', {}).get('paths', [self.partition_key_path])[0]
+        if partition_key_path in SUPPORTED_PARTITION_KEY_PATHS:
+            self.partition_key_path = partition_key_path
+        else:
+            logging.warning(f"Unsupported partition key {partition_key_path} on container {self.container_name}, assuming {self.partition_key_path}")
             
         return True, "CosmosDB client initialized successfully"
 
-    async def create_conversation(self, user_id, title = ''):
+    def partition_key(self, item_id, user_id):
+        """Partition key value of the item with the given id owned by user_id."""
+        if self.partition_key_path == "/userId":
+            return user_id
+        return item_id
+
+    def user_query_options(self, user_id):
+        """Keeps a query over one user's items in their partition when the container allows it."""
+        if self.partition_key_path == "/userId":
+            return {'partition_key': user_id}
+        # with /id every item is its own partition, so the query has to fan out
+        return {}
+
+    async def read_item(self, item_id, user_id, item_type):
+        """Point read of an item, or None if it does not exist or belongs to someone else."""
+        try:
+            item = await self.container_client.read_item(
+                item=item_id, partition_key=self.partition_key(item_id, user_id)
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+        if item.get('userId') != user_id or item.get('type') != item_type:
+            return None
+        return item
+
+    async def create_conversation(self, user_id, title = '', conversation_id = None):
         conversation = {
-            'id': str(uuid.uuid4()),  
+            'id': conversation_id or str(uuid.uuid4()),  
             'type': 'conversation',
             'createdAt': datetime.utcnow().isoformat(),  
             'updatedAt': datetime.utcnow().isoformat(),  
@@ -82,12 +143,43 @@ class CosmosConversationClient():
         else:
             return False
 
+    async def patch_conversation(self, user_id, conversation_id, fields: dict, expected: dict = None, etag: str = None):
+        """
+        Sets fields of a conversation owned by user_id with a partial-document
+        patch, so concurrent updates of other fields are not overwritten.
+        expected holds field values the conversation must still have, and etag
+        the version it must still be at. Returns the updated conversation, or
+        None if it does not exist, belongs to someone else or has changed.
+        """
+        # json string literals are valid Cosmos SQL string literals
+        conditions = [f"c.userId = {json.dumps(user_id)}", "c.type = 'conversation'"]
+        for field, value in (expected or {}).items():
+            conditions.append(f"c.{field} = {json.dumps(value)}")
+
+        options = {}
+        if etag:
+            options = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+
+        try:
+            return await self.container_client.patch_item(
+                item=conversation_id,
+                partition_key=self.partition_key(conversation_id, user_id),
+                patch_operations=[
+                    {'op': 'set', 'path': f'/{field}', 'value': value} for field, value in fields.items()
+                ],
+                filter_predicate="FROM c WHERE " + " AND ".join(conditions),
+                **options
+            )
+        except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
+            return None
+
     async def delete_conversation(self, user_id, conversation_id):
         try:
-            # Use conversation_id as the partition key
-            conversation = await self.container_client.read_item(item=conversation_id, partition_key=conversation_id)        
+            conversation = await self.get_conversation(user_id, conversation_id)
             if conversation:
-                resp = await self.container_client.delete_item(item=conversation_id, partition_key=conversation_id)
+                resp = await self.container_client.delete_item(
+                    item=conversation_id, partition_key=self.partition_key(conversation_id, user_id)
+                )
                 return resp
             else:
                 return True
@@ -99,19 +191,49 @@ class CosmosConversationClient():
             return False
 
         
-    async def delete_messages(self, conversation_id, user_id):
-        ## get a list of all the messages in the conversation
-        messages = await self.get_messages(user_id, conversation_id)
-        response_list = []
-        if messages:
-            for message in messages:
+    async def delete_items(self, user_id, item_ids, on_deleted=None):
+        """
+        Deletes items of user_id with at most delete_concurrency requests in
+        flight. Items that are already gone count as deleted. on_deleted is
+        called with each item id and whether it was deleted. Returns the
+        deleted flags in item order.
+        """
+        semaphore = asyncio.Semaphore(self.delete_concurrency)
+
+        async def delete(item_id):
+            async with semaphore:
                 try:
-                    # Use message ID as the partition key
-                    resp = await self.container_client.delete_item(item=message['id'], partition_key=message['id'])
-                    response_list.append(resp)
+                    await self.container_client.delete_item(
+                        item=item_id, partition_key=self.partition_key(item_id, user_id)
+                    )
+                    deleted = True
+                except exceptions.CosmosResourceNotFoundError:
+                    deleted = True
                 except Exception as e:
-                    print(f"Error deleting message {message['id']}: {str(e)}")
-            return response_list
+                    print(f"Error deleting item {item_id}: {str(e)}")
+                    deleted = False
+
+            if on_deleted:
+                on_deleted(item_id, deleted)
+            return deleted
+
+        return await asyncio.gather(*[delete(item_id) for item_id in item_ids])
+
+    async def get_history_item_ids(self, user_id):
+        """Returns the ids of all conversations and of all messages of user_id."""
+        parameters = [
+            {
+                'name': '@userId',
+                'value': user_id
+            }
+        ]
+        query = "SELECT c.id, c.type FROM c WHERE c.userId = @userId AND (c.type = 'conversation' OR c.type = 'message')"
+        conversation_ids = []
+        message_ids = []
+        async for item in self.container_client.query_items(query=query, parameters=parameters, **self.user_query_options(user_id)):
+            (conversation_ids if item['type'] == 'conversation' else message_ids).append(item['id'])
+
+        return conversation_ids, message_ids
 
 
     async def get_conversations(self, user_id, limit, sort_order = 'DESC', offset = 0):
@@ -121,69 +243,159 @@ class CosmosConversationClient():
                 'value': user_id
             }
         ]
-        query = f"SELECT * FROM c where c.userId = @userId and c.type='conversation' order by c.updatedAt {sort_order}"
+        query = f"SELECT {CONVERSATION_LIST_FIELDS} FROM c where c.userId = @userId and c.type='conversation' order by c.updatedAt {sort_order}"
         if limit is not None:
             query += f" offset {offset} limit {limit}" 
         
         conversations = []
-        async for item in self.container_client.query_items(query=query, parameters=parameters):
+        async for item in self.container_client.query_items(query=query, parameters=parameters, **self.user_query_options(user_id)):
             conversations.append(item)
         
         return conversations
 
-    async def get_conversation(self, user_id, conversation_id):
+    async def get_conversation_page(self, user_id, page_size, continuation_token = None, sort_order = 'DESC'):
+        """
+        Returns up to page_size conversations with the fields the history list
+        shows, and the continuation token of the next page (None on the last
+        page). Unlike OFFSET, continuing a query does not re-read the rows of
+        the earlier pages.
+        """
+        if not self.user_query_options(user_id):
+            # the SDK cannot continue a cross-partition ORDER BY query
+            return await self._get_conversation_page_after(user_id, page_size, continuation_token, sort_order)
+
         parameters = [
             {
-                'name': '@conversationId',
-                'value': conversation_id
-            },
+                'name': '@userId',
+                'value': user_id
+            }
+        ]
+        query = f"SELECT {CONVERSATION_LIST_FIELDS} FROM c where c.userId = @userId and c.type='conversation' order by c.updatedAt {sort_order}"
+
+        conversations = []
+        while len(conversations) < page_size:
+            pages = self.container_client.query_items(
+                query=query,
+                parameters=parameters,
+                max_item_count=page_size - len(conversations),
+                **self.user_query_options(user_id)
+            ).by_page(continuation_token)
+            try:
+                page = await pages.__anext__()
+            except StopAsyncIteration:
+                continuation_token = None
+                break
+            except exceptions.CosmosHttpResponseError as e:
+                # a malformed token, or one from another query or container
+                if e.status_code == 400 and continuation_token:
+                    raise ValueError("Invalid continuation token") from e
+                raise
+
+            async for item in page:
+                conversations.append(item)
+            continuation_token = pages.continuation_token
+            if not continuation_token:
+                break
+
+        return conversations, continuation_token
+
+    async def _get_conversation_page_after(self, user_id, page_size, continuation_token, sort_order):
+        """
+        Keyset paging for queries that fan out across partitions. The token
+        holds the updatedAt of the last conversation returned and the ids
+        returned with that same updatedAt, so the next page starts right
+        after them and ties are neither skipped nor repeated.
+        """
+        position = decode_list_position(continuation_token)
+        parameters = [
             {
                 'name': '@userId',
                 'value': user_id
+            },
+            {
+                'name': '@top',
+                'value': page_size + 1
             }
         ]
-        query = f"SELECT * FROM c where c.id = @conversationId and c.type='conversation' and c.userId = @userId"
+        conditions = ["c.userId = @userId", "c.type='conversation'"]
+        if position:
+            comparison = '<=' if sort_order == 'DESC' else '>='
+            conditions.append(f"c.updatedAt {comparison} @updatedAt AND NOT ARRAY_CONTAINS(@seenIds, c.id)")
+            parameters += [
+                {
+                    'name': '@updatedAt',
+                    'value': position['updatedAt']
+                },
+                {
+                    'name': '@seenIds',
+                    'value': position['ids']
+                }
+            ]
+        query = f"SELECT TOP @top {CONVERSATION_LIST_FIELDS} FROM c WHERE {' AND '.join(conditions)} ORDER BY c.updatedAt {sort_order}"
+
         conversations = []
         async for item in self.container_client.query_items(query=query, parameters=parameters):
             conversations.append(item)
 
-        ## if no conversations are found, return None
-        if len(conversations) == 0:
-            return None
-        else:
-            return conversations[0]
+        # the extra conversation only tells whether there is a next page
+        if len(conversations) <= page_size:
+            return conversations, None
+
+        conversations = conversations[:page_size]
+        last_updated_at = conversations[-1]['updatedAt']
+        seen_ids = [conversation['id'] for conversation in conversations if conversation['updatedAt'] == last_updated_at]
+        if position and position['updatedAt'] == last_updated_at:
+            seen_ids = position['ids'] + seen_ids
+        return conversations, json.dumps({'updatedAt': last_updated_at, 'ids': seen_ids})
+
+    async def get_conversation(self, user_id, conversation_id):
+        return await self.read_item(conversation_id, user_id, 'conversation')
+
+    async def get_message(self, user_id, message_id):
+        return await self.read_item(message_id, user_id, 'message')
  
-    async def create_message(self, uuid, conversation_id, user_id, input_message: dict):
-        message = {
-            'id': uuid,
-            'type': 'message',
-            'userId' : user_id,
-            'createdAt': datetime.utcnow().isoformat(),
-            'updatedAt': datetime.utcnow().isoformat(),
-            'conversationId' : conversation_id,
-            'role': input_message['role'],
-            'content': input_message['content']
-        }
+    async def create_messages(self, conversation_id, user_id, input_messages: list):
+        """
+        Saves (id, message) pairs in order and moves the conversation's
+        updatedAt to the last one. The message writes and the updatedAt
+        patch run concurrently. Returns one result per message, or
+        "Conversation not found".
+        """
+        created_at = datetime.utcnow()
+        messages = []
+        for i, (message_id, input_message) in enumerate(input_messages):
+            # distinct timestamps keep the messages in order when read back
+            timestamp = (created_at + timedelta(microseconds=i)).isoformat()
+            message = {
+                'id': message_id,
+                'type': 'message',
+                'userId' : user_id,
+                'createdAt': timestamp,
+                'updatedAt': timestamp,
+                'conversationId' : conversation_id,
+                'role': input_message['role'],
+                'content': input_message['content']
+            }
 
-        if self.enable_message_feedback:
-            message['feedback'] = ''
-        
-        resp = await self.container_client.upsert_item(message)  
-        if resp:
-            ## update the parent conversations's updatedAt field with the current message's createdAt datetime value
-            conversation = await self.get_conversation(user_id, conversation_id)
-            if not conversation:
-                return "Conversation not found"
-            conversation['updatedAt'] = message['createdAt']
-            await self.upsert_conversation(conversation)
-            return resp
-        else:
-            return False
+            if self.enable_message_feedback:
+                message['feedback'] = ''
+            messages.append(message)
+
+        ## update the parent conversations's updatedAt field with the last message's createdAt datetime value
+        *responses, conversation = await asyncio.gather(
+            *[self.container_client.upsert_item(message) for message in messages],
+            self.patch_conversation(user_id, conversation_id, {'updatedAt': messages[-1]['createdAt']})
+        )
+        if not all(responses):
+            return [False] * len(messages)
+
+        if not conversation:
+            return "Conversation not found"
+        return responses
     
     async def update_message_feedback(self, user_id, message_id, feedback):
         try:
-            # Use message_id as the partition key instead of user_id
-            message = await self.container_client.read_item(item=message_id, partition_key=message_id)
+            message = await self.get_message(user_id, message_id)
             if message:
                 print(f"Found message {message_id} - role: {message.get('role')}, content length: {len(message.get('content', ''))}")
                 print(f"Setting feedback from '{message.get('feedback', '')}' to '{feedback}'")
@@ -195,12 +407,8 @@ class CosmosConversationClient():
                 print(f"Feedback updated successfully for message {message_id}")
                 return resp
             else:
-                print(f"Message {message_id} found but returned empty document")
+                print(f"Message not found: {message_id}")
                 return False
-        except exceptions.CosmosResourceNotFoundError as e:
-            # Log details for debugging
-            print(f"Message not found: {message_id}, error: {str(e)}")
-            return False
         except Exception as e:
             print(f"Error updating message feedback: {str(e)}")
             return False
@@ -218,8 +426,91 @@ class CosmosConversationClient():
         ]
         query = f"SELECT * FROM c WHERE c.conversationId = @conversationId AND c.type='message' AND c.userId = @userId ORDER BY c.createdAt ASC"
         messages = []
-        async for item in self.container_client.query_items(query=query, parameters=parameters):
+        async for item in self.container_client.query_items(query=query, parameters=parameters, **self.user_query_options(user_id)):
             messages.append(item)
 
         return messages
 
+    async def get_feedback_messages(self, user_id):
+        parameters = [
+            {
+                'name': '@userId',
+                'value': user_id
+            }
+        ]
+        query = (
+            "SELECT c.id, c.feedback, c.content, c.role, c.conversationId, c.createdAt, c.updatedAt FROM c "
+            "WHERE c.userId = @userId AND c.type = 'message' AND IS_DEFINED(c.feedback) AND c.feedback <> '' "
+            "ORDER BY c.updatedAt DESC"
+        )
+        messages = []
+        async for item in self.container_client.query_items(query=query, parameters=parameters, **self.user_query_options(user_id)):
+            messages.append(item)
+
+        return messages
+
+    async def _get_adjacent_message(self, user_id, conversation_id, role, comparison, created_at, sort_order):
+        parameters = [
+            {
+                'name': '@conversationId',
+                'value': conversation_id
+            },
+            {
+                'name': '@userId',
+                'value': user_id
+            },
+            {
+                'name': '@role',
+                'value': role
+            },
+            {
+                'name': '@createdAt',
+                'value': created_at
+            }
+        ]
+        query = (
+            "SELECT TOP 1 * FROM c WHERE c.conversationId = @conversationId AND c.userId = @userId "
+            f"AND c.type = 'message' AND c.role = @role AND c.createdAt {comparison} @createdAt "
+            f"ORDER BY c.createdAt {sort_order}"
+        )
+        async for item in self.container_client.query_items(query=query, parameters=parameters, **self.user_query_options(user_id)):
+            return item
+        return None
+
+    async def get_previous_user_message(self, user_id, conversation_id, created_at):
+        return await self._get_adjacent_message(user_id, conversation_id, 'user', '<', created_at, 'DESC')
+
+    async def get_next_assistant_message(self, user_id, conversation_id, created_at):
+        return await self._get_adjacent_message(user_id, conversation_id, 'assistant', '>', created_at, 'ASC')
+
+    async def find_item(self, item_id):
+        parameters = [
+            {
+                'name': '@id',
+                'value': item_id
+            }
+        ]
+        async for item in self.container_client.query_items(query="SELECT * FROM c WHERE c.id = @id", parameters=parameters):
+            return item
+        return None
+
+    async def find_user_messages(self, text, limit):
+        parameters = [
+            {
+                'name': '@text',
+                'value': text
+            },
+            {
+                'name': '@limit',
+                'value': limit
+            }
+        ]
+        query = (
+            "SELECT TOP @limit c.id, c.content FROM c "
+            "WHERE c.type = 'message' AND c.role = 'user' AND CONTAINS(c.content, @text, true)"
+        )
+        messages = []
+        async for item in self.container_client.query_items(query=query, parameters=parameters):
+            messages.append(item)
+
+        return messages
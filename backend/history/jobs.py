@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from backend.cache.ttl_cache import TTLCache
+
+# Fields of a job that are reported to pollers
+JOB_FIELDS = ("status", "total", "deleted", "failed", "error", "started_at", "finished_at")
+
+
+class HistoryJob():
+    """Progress of a long-running history operation, reported to pollers."""
+
+    def __init__(self, kind: str, owner: str = None, id: str = None):
+        self.id = id or str(uuid.uuid4())
+        self.kind = kind
+        self.owner = owner
+        self.status = "running"
+        self.total = None
+        self.deleted = 0
+        self.failed = 0
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def record(self, item_id, deleted: bool):
+        if deleted:
+            self.deleted += 1
+        else:
+            self.failed += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, owner: str = None) -> "HistoryJob":
+        job = cls(data["kind"], owner, id=data["job_id"])
+        for name in JOB_FIELDS:
+            setattr(job, name, data.get(name))
+        return job
+
+
+class HistoryJobStore(ABC):
+    """
+    Keeps the progress of history jobs where every worker that may be polled
+    for them can read it, together with the time each job was last saved.
+    """
+
+    @abstractmethod
+    async def claim(self, job: HistoryJob, stale_seconds: float):
+        """
+        Saves job unless its owner has a running job of the same kind that
+        was saved within stale_seconds; returns that job instead, else None.
+        """
+        pass
+
+    @abstractmethod
+    async def save(self, job: HistoryJob):
+        pass
+
+    @abstractmethod
+    async def get(self, job_id: str):
+        """Returns (job, saved_at); job is None when it does not exist or has expired."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemoryHistoryJobStore(HistoryJobStore):
+    """Keeps the jobs in the memory of one worker, for single-worker deployments and tests."""
+
+    def __init__(self, max_jobs: int = 1000, ttl_seconds: float = 3600):
+        self._jobs = TTLCache(max_size=max_jobs, ttl_seconds=ttl_seconds)
+        self._running = {}
+
+    async def claim(self, job: HistoryJob, stale_seconds: float):
+        running, saved_at = await self.get(self._running.get((job.kind, job.owner)))
+        if running is not None and running.status == "running" and time.time() - saved_at < stale_seconds:
+            return running
+
+        await self.save(job)
+        return None
+
+    async def save(self, job: HistoryJob):
+        # the retention period starts with the last save, when the job is done
+        self._jobs.set(job.id, (job.to_dict(), job.owner, time.time()))
+        if job.status == "running":
+            self._running[(job.kind, job.owner)] = job.id
+        elif self._running.get((job.kind, job.owner)) == job.id:
+            del self._running[(job.kind, job.owner)]
+
+    async def get(self, job_id: str):
+        entry = self._jobs.get(job_id) if job_id else None
+        if entry is None:
+            return None, None
+
+        data, owner, saved_at = entry
+        return HistoryJob.from_dict(data, owner), saved_at
+
+
+class SQLiteHistoryJobStore(HistoryJobStore):
+    """
+    Keeps the jobs in a SQLite database file so every worker on the host
+    can report the progress of a job another worker runs.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS history_jobs "
+                "(job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, owner TEXT, status TEXT NOT NULL, "
+                "document TEXT NOT NULL, saved_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS history_jobs_running ON history_jobs (kind, owner, status)")
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return _Closing(connection)
+
+    def _write(self, connection, job: HistoryJob):
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO history_jobs (job_id, kind, owner, status, document, saved_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.kind, job.owner, job.status, json.dumps(job.to_dict()), now, now + self.ttl_seconds)
+        )
+
+    def _claim(self, job: HistoryJob, stale_seconds: float):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT document, owner FROM history_jobs "
+                "WHERE kind = ? AND owner IS ? AND status = 'running' AND saved_at > ? "
+                "ORDER BY saved_at DESC LIMIT 1",
+                (job.kind, job.owner, time.time() - stale_seconds)
+            ).fetchone()
+            if row is not None:
+                connection.execute("ROLLBACK")
+                return HistoryJob.from_dict(json.loads(row[0]), row[1])
+
+            connection.execute("DELETE FROM history_jobs WHERE expires_at <= ?", (time.time(),))
+            self._write(connection, job)
+            connection.execute("COMMIT")
+            return None
+
+    def _save(self, job: HistoryJob):
+        with self._connect() as connection:
+            self._write(connection, job)
+
+    def _get(self, job_id: str):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT document, owner, saved_at, expires_at FROM history_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+
+        if row is None or row[3] <= time.time():
+            return None, None
+        return HistoryJob.from_dict(json.loads(row[0]), row[1]), row[2]
+
+    async def claim(self, job: HistoryJob, stale_seconds: float):
+        return await asyncio.to_thread(self._claim, job, stale_seconds)
+
+    async def save(self, job: HistoryJob):
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id: str):
+        return await asyncio.to_thread(self._get, job_id)
+
+
+class _Closing():
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        self.connection.close()
+
+
+class HistoryJobRegistry():
+    """
+    Runs history operations in background tasks and saves their progress to
+    store every progress_interval_seconds and when they finish, so a poll
+    served by any worker sharing the store sees it. A user has at most one
+    running job of each kind; starting another returns the running one. A
+    running job that was not saved for stale_seconds lost its worker, e.g.
+    to a restart, and is reported as interrupted.
+    """
+
+    def __init__(self, store: HistoryJobStore = None, progress_interval_seconds: float = 1.0, stale_seconds: float = 30.0):
+        self.store = store or InMemoryHistoryJobStore()
+        self.progress_interval_seconds = progress_interval_seconds
+        self.stale_seconds = stale_seconds
+        self._running = {}
+
+    async def start(self, kind: str, owner: str, operation) -> HistoryJob:
+        """Starts `await operation(job)` unless the owner already runs a job of this kind."""
+        job = HistoryJob(kind, owner)
+        running = await self.store.claim(job, self.stale_seconds)
+        if running is not None:
+            return self._running.get(running.id, running)
+
+        self._running[job.id] = job
+        job.task = asyncio.ensure_future(self._run(job, operation))
+        return job
+
+    async def _run(self, job: HistoryJob, operation):
+        progress = asyncio.ensure_future(self._save_progress(job))
+        try:
+            await operation(job)
+            job.status = "completed" if not job.failed else "completed_with_errors"
+        except asyncio.CancelledError:
+            job.status = "interrupted"
+            job.error = "The job was stopped before it finished"
+            raise
+        except Exception as e:
+            logging.exception(f"Exception in history job {job.id}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            progress.cancel()
+            job.finished_at = time.time()
+            self._running.pop(job.id, None)
+            await self._save(job)
+
+    async def _save_progress(self, job: HistoryJob):
+        while True:
+            await asyncio.sleep(self.progress_interval_seconds)
+            await self._save(job)
+
+    async def _save(self, job: HistoryJob):
+        try:
+            await self.store.save(job)
+        except Exception as e:
+            logging.warning(f"Saving the progress of history job {job.id} failed: {e}")
+
+    async def get(self, job_id: str, owner: str = None):
+        job = self._running.get(job_id)
+        if job is None:
+            job, saved_at = await self.store.get(job_id)
+            if job is not None and job.status == "running" and time.time() - saved_at >= self.stale_seconds:
+                job.status = "interrupted"
+                job.error = "The worker running the job stopped before it finished"
+
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    async def close(self):
+        """Stops the jobs of this worker, which records them as interrupted."""
+        tasks = [job.task for job in self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+        }
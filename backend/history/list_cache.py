@@ -0,0 +1,355 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+
+from backend.cache.ttl_cache import TTLCache
+
+# Fields of a conversation kept in the cached list
+LIST_FIELDS = ("id", "title", "createdAt", "updatedAt")
+
+
+class ConversationListStore(ABC):
+    """
+    Keeps one entry per user together with a version that every update
+    increments, so a list read from the database before a concurrent write
+    is not stored over the result of that write.
+    """
+
+    @abstractmethod
+    async def get(self, user_id: str):
+        """Returns (entry, version); entry is None when nothing is cached."""
+        pass
+
+    @abstractmethod
+    async def set(self, user_id: str, entry: dict, version: int) -> bool:
+        """Stores entry unless the user's version has moved past version."""
+        pass
+
+    @abstractmethod
+    async def update(self, user_id: str, change):
+        """Replaces the entry with change(entry), or drops it when that returns None."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemoryConversationListStore(ConversationListStore):
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60):
+        self._entries = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        # versions outlive the entries so a late set() is still rejected
+        self._versions = TTLCache(max_size=max_size, ttl_seconds=max(ttl_seconds, 300))
+
+    async def get(self, user_id: str):
+        return self._entries.get(user_id), self._versions.get(user_id, 0)
+
+    async def set(self, user_id: str, entry: dict, version: int) -> bool:
+        if self._versions.get(user_id, 0) != version:
+            return False
+
+        self._entries.set(user_id, entry)
+        return True
+
+    async def update(self, user_id: str, change):
+        self._versions.set(user_id, self._versions.get(user_id, 0) + 1)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+
+        entry = change(entry)
+        if entry is None:
+            self._entries.pop(user_id)
+        else:
+            self._entries.set(user_id, entry)
+
+
+class SQLiteConversationListStore(ConversationListStore):
+    """
+    Keeps the entries in a SQLite database file so all workers on the host
+    see the same lists and every worker's writes update them.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 60):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_lists "
+                "(user_id TEXT PRIMARY KEY, entry TEXT, version INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return _Closing(connection)
+
+    def _get(self, user_id: str):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT entry, version, expires_at FROM conversation_lists WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+        if row is None:
+            return None, 0
+
+        entry, version, expires_at = row
+        if entry is None or expires_at <= time.time():
+            return None, version
+        return json.loads(entry), version
+
+    def _set(self, user_id: str, entry: dict, version: int) -> bool:
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT version FROM conversation_lists WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if (row[0] if row else 0) != version:
+                connection.execute("ROLLBACK")
+                return False
+
+            connection.execute(
+                "INSERT OR REPLACE INTO conversation_lists (user_id, entry, version, expires_at) VALUES (?, ?, ?, ?)",
+                (user_id, json.dumps(entry), version, time.time() + self.ttl_seconds)
+            )
+            connection.execute("COMMIT")
+            return True
+
+    def _update(self, user_id: str, change):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT entry, version, expires_at FROM conversation_lists WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            entry, version, expires_at = row if row else (None, 0, 0)
+            if entry is not None and expires_at > time.time():
+                entry = change(json.loads(entry))
+            else:
+                entry = None
+
+            connection.execute(
+                "INSERT OR REPLACE INTO conversation_lists (user_id, entry, version, expires_at) VALUES (?, ?, ?, ?)",
+                (
+                    user_id,
+                    json.dumps(entry) if entry is not None else None,
+                    version + 1,
+                    # rows without an entry only keep the version
+                    expires_at if entry is not None else time.time() + self.ttl_seconds
+                )
+            )
+            connection.execute("COMMIT")
+
+    async def get(self, user_id: str):
+        return await asyncio.to_thread(self._get, user_id)
+
+    async def set(self, user_id: str, entry: dict, version: int) -> bool:
+        return await asyncio.to_thread(self._set, user_id, entry, version)
+
+    async def update(self, user_id: str, change):
+        await asyncio.to_thread(self._update, user_id, change)
+
+
+class _Closing():
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        self.connection.close()
+
+
+def _list_fields(conversation: dict) -> dict:
+    return {key: conversation[key] for key in LIST_FIELDS if key in conversation}
+
+
+class ConversationListCache():
+    """
+    Caches the first page of each user's conversation list together with
+    the continuation token of the second page. Writes update the cached page
+    in place; a change that would make it disagree with that token (a page
+    that grows past its size, shrinks, or gains a conversation from a later
+    page) drops it instead.
+    """
+
+    def __init__(self, store: ConversationListStore, page_size: int = 25):
+        self.store = store
+        self.page_size = page_size
+        self.hits = 0
+        self.misses = 0
+
+    async def get_page(self, user_id: str):
+        """Returns (conversations, continuation_token, version); conversations is None on a miss."""
+        try:
+            entry, version = await self.store.get(user_id)
+        except Exception as e:
+            logging.warning(f"Conversation list cache read failed: {e}")
+            return None, None, None
+
+        if entry is None:
+            self.misses += 1
+            return None, None, version
+
+        self.hits += 1
+        return entry["conversations"], entry["continuation_token"], version
+
+    async def set_page(self, user_id: str, conversations: list, continuation_token: str, version: int):
+        if version is None:
+            return
+
+        entry = {
+            "conversations": [_list_fields(conversation) for conversation in conversations],
+            "continuation_token": continuation_token,
+        }
+        try:
+            await self.store.set(user_id, entry, version)
+        except Exception as e:
+            logging.warning(f"Conversation list cache write failed: {e}")
+
+    async def _update(self, user_id: str, change):
+        try:
+            await self.store.update(user_id, change)
+        except Exception as e:
+            logging.warning(f"Conversation list cache update failed, dropping the entry: {e}")
+            try:
+                await self.store.update(user_id, lambda entry: None)
+            except Exception:
+                pass
+
+    async def add(self, user_id: str, conversation: dict):
+        def change(entry):
+            conversations = [_list_fields(conversation)] + [
+                item for item in entry["conversations"] if item["id"] != conversation["id"]
+            ]
+            if len(conversations) > self.page_size:
+                return None
+            return {**entry, "conversations": _sorted(conversations)}
+
+        await self._update(user_id, change)
+
+    async def update(self, user_id: str, conversation_id: str, fields: dict):
+        fields = _list_fields(fields)
+
+        def change(entry):
+            conversations = entry["conversations"]
+            if not any(item["id"] == conversation_id for item in conversations):
+                # a conversation from a later page moving to the top
+                if "updatedAt" in fields and entry["continuation_token"]:
+                    return None
+                return entry
+
+            conversations = [
+                {**item, **fields} if item["id"] == conversation_id else item
+                for item in conversations
+            ]
+            return {**entry, "conversations": _sorted(conversations)}
+
+        if fields:
+            await self._update(user_id, change)
+
+    async def remove(self, user_id: str, conversation_id: str):
+        def change(entry):
+            conversations = [item for item in entry["conversations"] if item["id"] != conversation_id]
+            if len(conversations) == len(entry["conversations"]):
+                return entry
+            if entry["continuation_token"]:
+                return None
+            return {**entry, "conversations": conversations}
+
+        await self._update(user_id, change)
+
+    async def invalidate(self, user_id: str):
+        await self._update(user_id, lambda entry: None)
+
+    async def close(self):
+        await self.store.close()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _sorted(conversations: list) -> list:
+    return sorted(conversations, key=lambda item: item.get("updatedAt") or "", reverse=True)
+
+
+class ListCachingConversationClient():
+    """
+    Wraps a conversation client so the first page of each user's list is
+    served from a ConversationListCache, and keeps that cache up to date on
+    every conversation write made through it. Everything else is passed
+    through to the wrapped client.
+    """
+
+    def __init__(self, client, list_cache: ConversationListCache):
+        self.client = client
+        self.list_cache = list_cache
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def get_conversation_page(self, user_id, page_size, continuation_token = None, sort_order = 'DESC'):
+        if continuation_token or sort_order != 'DESC' or page_size != self.list_cache.page_size:
+            return await self.client.get_conversation_page(user_id, page_size, continuation_token, sort_order)
+
+        conversations, next_token, version = await self.list_cache.get_page(user_id)
+        if conversations is not None:
+            return conversations, next_token
+
+        conversations, next_token = await self.client.get_conversation_page(user_id, page_size)
+        await self.list_cache.set_page(user_id, conversations, next_token, version)
+        return conversations, next_token
+
+    async def create_conversation(self, user_id, title = '', conversation_id = None):
+        resp = await self.client.create_conversation(user_id, title=title, conversation_id=conversation_id)
+        if resp:
+            await self.list_cache.add(user_id, resp)
+        return resp
+
+    async def upsert_conversation(self, conversation):
+        resp = await self.client.upsert_conversation(conversation)
+        if resp:
+            await self.list_cache.update(conversation['userId'], conversation['id'], resp)
+        return resp
+
+    async def patch_conversation(self, user_id, conversation_id, fields: dict, expected: dict = None, etag: str = None):
+        resp = await self.client.patch_conversation(user_id, conversation_id, fields, expected=expected, etag=etag)
+        if resp:
+            await self.list_cache.update(user_id, conversation_id, resp)
+        return resp
+
+    async def delete_conversation(self, user_id, conversation_id):
+        try:
+            return await self.client.delete_conversation(user_id, conversation_id)
+        finally:
+            await self.list_cache.remove(user_id, conversation_id)
+
+    async def delete_items(self, user_id, item_ids, on_deleted=None):
+        try:
+            return await self.client.delete_items(user_id, item_ids, on_deleted)
+        finally:
+            await self.list_cache.invalidate(user_id)
+
+    async def create_message(self, uuid, conversation_id, user_id, input_message: dict):
+        resp = await self.create_messages(conversation_id, user_id, [(uuid, input_message)])
+        if resp == "Conversation not found":
+            return resp
+        return resp[0]
+
+    async def create_messages(self, conversation_id, user_id, input_messages: list):
+        resp = await self.client.create_messages(conversation_id, user_id, input_messages)
+        if resp != "Conversation not found" and resp and resp[-1]:
+            await self.list_cache.update(user_id, conversation_id, {'updatedAt': resp[-1]['createdAt']})
+        return resp
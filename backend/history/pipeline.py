@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+
+# Writes that are still running; the request that started them may be gone
+_pending = set()
+
+
+class HistoryWriteStats():
+    """
+    Aggregates how long pipelined history writes took and how long the
+    response then had to wait for them. The difference is the write latency
+    hidden behind the chat completion.
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.failures = 0
+        self.write_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def record(self, write_seconds: float, wait_seconds: float, failed: bool = False):
+        self.writes += 1
+        self.failures += int(failed)
+        self.write_seconds += write_seconds
+        self.wait_seconds += wait_seconds
+
+    def stats(self) -> dict:
+        hidden_seconds = max(self.write_seconds - self.wait_seconds, 0.0)
+        return {
+            "writes": self.writes,
+            "failures": self.failures,
+            "avg_write_ms": round(self.write_seconds / self.writes * 1000, 1) if self.writes else 0.0,
+            "avg_wait_ms": round(self.wait_seconds / self.writes * 1000, 1) if self.writes else 0.0,
+            "hidden_ratio": round(hidden_seconds / self.write_seconds, 3) if self.write_seconds else 0.0,
+        }
+
+
+class PipelinedWrite():
+    """
+    Starts a history write in the background so it runs while the chat
+    completion is requested. wait() is called before the answer is sent;
+    it raises the write's exception and records the timings.
+    """
+
+    def __init__(self, coroutine, stats: HistoryWriteStats = None, name: str = "history write"):
+        self.stats = stats
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished = None
+        self.task = asyncio.ensure_future(self._run(coroutine))
+        _pending.add(self.task)
+        self.task.add_done_callback(self._done)
+
+    async def _run(self, coroutine):
+        try:
+            return await coroutine
+        except Exception:
+            logging.exception(f"Exception in pipelined {self.name}")
+            raise
+        finally:
+            self.finished = time.perf_counter()
+
+    def _done(self, task):
+        _pending.discard(task)
+        # the failure was logged in _run, and is raised again by wait()
+        if not task.cancelled():
+            task.exception()
+
+    async def wait(self):
+        waiting_since = time.perf_counter()
+        failed = True
+        try:
+            result = await asyncio.shield(self.task)
+            failed = False
+            return result
+        finally:
+            now = time.perf_counter()
+            write_seconds = (self.finished or now) - self.started
+            wait_seconds = now - waiting_since
+            logging.debug(
+                f"Pipelined {self.name} took {write_seconds * 1000:.0f} ms; the response was ready after "
+                f"{(waiting_since - self.started) * 1000:.0f} ms and waited {wait_seconds * 1000:.0f} ms for it"
+            )
+            if self.stats:
+                self.stats.record(write_seconds, wait_seconds, failed)
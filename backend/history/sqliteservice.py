@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from backend.history.store import ConversationStore
+from backend.utils import json_dumps, json_loads
+
+# Fields of a conversation shown in the history list
+CONVERSATION_LIST_FIELDS = ("id", "title", "createdAt", "updatedAt")
+
+# Ids per DELETE statement, below SQLite's limit on bound parameters
+DELETE_BATCH_SIZE = 500
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS items ("
+    "id TEXT PRIMARY KEY, type TEXT NOT NULL, user_id TEXT NOT NULL, conversation_id TEXT, role TEXT, "
+    "feedback TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL, document TEXT NOT NULL)",
+    # the history list, newest first, with the id as tie breaker for keyset paging
+    "CREATE INDEX IF NOT EXISTS items_user_updated ON items (user_id, type, updated_at, id)",
+    # the messages of a conversation in order
+    "CREATE INDEX IF NOT EXISTS items_conversation_created ON items (conversation_id, created_at)",
+)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Keeps chat history in a local SQLite database in WAL mode, for
+    development, tests and single-host deployments. Items are stored as the
+    same documents the Cosmos DB container holds, with the fields queries
+    filter on copied into indexed columns. Calls run in worker threads, each
+    on its own connection.
+    """
+
+    def __init__(self, path: str, enable_message_feedback: bool = False):
+        self.path = path
+        self.enable_message_feedback = enable_message_feedback
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            # WAL keeps the database consistent without syncing on every commit
+            connection.execute("PRAGMA synchronous=NORMAL")
+            yield connection
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            yield connection
+            connection.execute("COMMIT")
+
+    def _write(self, connection, item: dict) -> dict:
+        item = {**item, '_etag': f'"{uuid.uuid4()}"'}
+        connection.execute(
+            "INSERT OR REPLACE INTO items (id, type, user_id, conversation_id, role, feedback, created_at, updated_at, document) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                item['id'],
+                item['type'],
+                item['userId'],
+                item.get('conversationId'),
+                item.get('role'),
+                item.get('feedback'),
+                item['createdAt'],
+                item['updatedAt'],
+                json_dumps(item)
+            )
+        )
+        return item
+
+    def _read(self, connection, item_id, user_id, item_type):
+        row = connection.execute(
+            "SELECT document FROM items WHERE id = ? AND user_id = ? AND type = ?", (item_id, user_id, item_type)
+        ).fetchone()
+        return json_loads(row[0]) if row else None
+
+    def _query(self, query, parameters=()):
+        with self._connect() as connection:
+            return [json_loads(row[0]) for row in connection.execute(query, parameters)]
+
+    async def close(self):
+        pass
+
+    async def ensure(self):
+        try:
+            await asyncio.to_thread(self._query, "SELECT document FROM items LIMIT 0")
+        except sqlite3.Error as e:
+            return False, f"SQLite chat history database {self.path} could not be read: {e}"
+        return True, "SQLite chat history store initialized successfully"
+
+    async def create_conversation(self, user_id, title = '', conversation_id = None):
+        now = datetime.utcnow().isoformat()
+        return await self.upsert_conversation({
+            'id': conversation_id or str(uuid.uuid4()),
+            'type': 'conversation',
+            'createdAt': now,
+            'updatedAt': now,
+            'userId': user_id,
+            'title': title
+        })
+
+    async def upsert_conversation(self, conversation):
+        def upsert():
+            with self._transaction() as connection:
+                return self._write(connection, conversation)
+
+        return await asyncio.to_thread(upsert)
+
+    async def patch_conversation(self, user_id, conversation_id, fields: dict, expected: dict = None, etag: str = None):
+        def patch():
+            with self._transaction() as connection:
+                conversation = self._read(connection, conversation_id, user_id, 'conversation')
+                if conversation is None or (etag and conversation.get('_etag') != etag):
+                    return None
+                if any(conversation.get(field) != value for field, value in (expected or {}).items()):
+                    return None
+                return self._write(connection, {**conversation, **fields})
+
+        return await asyncio.to_thread(patch)
+
+    async def delete_conversation(self, user_id, conversation_id):
+        def delete():
+            with self._transaction() as connection:
+                connection.execute(
+                    "DELETE FROM items WHERE id = ? AND user_id = ? AND type = 'conversation'", (conversation_id, user_id)
+                )
+            return True
+
+        return await asyncio.to_thread(delete)
+
+    async def delete_items(self, user_id, item_ids, on_deleted=None):
+        item_ids = list(item_ids)
+
+        def delete():
+            with self._transaction() as connection:
+                for start in range(0, len(item_ids), DELETE_BATCH_SIZE):
+                    batch = item_ids[start:start + DELETE_BATCH_SIZE]
+                    connection.execute(
+                        f"DELETE FROM items WHERE user_id = ? AND id IN ({', '.join('?' * len(batch))})",
+                        (user_id, *batch)
+                    )
+
+        try:
+            await asyncio.to_thread(delete)
+            deleted = True
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting items: {e}")
+            deleted = False
+
+        if on_deleted:
+            for item_id in item_ids:
+                on_deleted(item_id, deleted)
+        return [deleted] * len(item_ids)
+
+    async def get_history_item_ids(self, user_id):
+        def get():
+            with self._connect() as connection:
+                return connection.execute(
+                    "SELECT id, type FROM items WHERE user_id = ? AND type IN ('conversation', 'message')", (user_id,)
+                ).fetchall()
+
+        conversation_ids = []
+        message_ids = []
+        for item_id, item_type in await asyncio.to_thread(get):
+            (conversation_ids if item_type == 'conversation' else message_ids).append(item_id)
+
+        return conversation_ids, message_ids
+
+    async def get_conversations(self, user_id, limit, sort_order = 'DESC', offset = 0):
+        sort_order = _sort_order(sort_order)
+        query = (
+            "SELECT document FROM items WHERE user_id = ? AND type = 'conversation' "
+            f"ORDER BY updated_at {sort_order}, id {sort_order} LIMIT ? OFFSET ?"
+        )
+        conversations = await asyncio.to_thread(
+            self._query, query, (user_id, -1 if limit is None else limit, offset if limit is not None else 0)
+        )
+        return [_list_fields(conversation) for conversation in conversations]
+
+    async def get_conversation_page(self, user_id, page_size, continuation_token = None, sort_order = 'DESC'):
+        """
+        Pages by the (updatedAt, id) of the last conversation returned, so
+        reading a page only touches its own rows of the index.
+        """
+        sort_order = _sort_order(sort_order)
+        conditions = "user_id = ? AND type = 'conversation'"
+        parameters = [user_id]
+        if continuation_token:
+            updated_at, conversation_id = _decode_page_token(continuation_token)
+            conditions += f" AND (updated_at, id) {'<' if sort_order == 'DESC' else '>'} (?, ?)"
+            parameters += [updated_at, conversation_id]
+
+        query = (
+            f"SELECT document FROM items WHERE {conditions} "
+            f"ORDER BY updated_at {sort_order}, id {sort_order} LIMIT ?"
+        )
+        conversations = await asyncio.to_thread(self._query, query, (*parameters, page_size + 1))
+
+        next_token = None
+        if len(conversations) > page_size:
+            conversations = conversations[:page_size]
+            next_token = json_dumps([conversations[-1]['updatedAt'], conversations[-1]['id']])
+        return [_list_fields(conversation) for conversation in conversations], next_token
+
+    async def get_conversation(self, user_id, conversation_id):
+        def get():
+            with self._connect() as connection:
+                return self._read(connection, conversation_id, user_id, 'conversation')
+
+        return await asyncio.to_thread(get)
+
+    async def get_message(self, user_id, message_id):
+        def get():
+            with self._connect() as connection:
+                return self._read(connection, message_id, user_id, 'message')
+
+        return await asyncio.to_thread(get)
+
+    async def create_messages(self, conversation_id, user_id, input_messages: list):
+        """
+        Saves the messages and the conversation's new updatedAt in one
+        transaction; nothing is saved when the conversation does not exist.
+        """
+        def create():
+            created_at = datetime.utcnow()
+            with self._transaction() as connection:
+                conversation = self._read(connection, conversation_id, user_id, 'conversation')
+                if conversation is None:
+                    return "Conversation not found"
+
+                messages = []
+                for i, (message_id, input_message) in enumerate(input_messages):
+                    # distinct timestamps keep the messages in order when read back
+                    timestamp = (created_at + timedelta(microseconds=i)).isoformat()
+                    message = {
+                        'id': message_id,
+                        'type': 'message',
+                        'userId': user_id,
+                        'createdAt': timestamp,
+                        'updatedAt': timestamp,
+                        'conversationId': conversation_id,
+                        'role': input_message['role'],
+                        'content': input_message['content']
+                    }
+                    if self.enable_message_feedback:
+                        message['feedback'] = ''
+                    messages.append(self._write(connection, message))
+
+                self._write(connection, {**conversation, 'updatedAt': messages[-1]['createdAt']})
+                return messages
+
+        return await asyncio.to_thread(create)
+
+    async def update_message_feedback(self, user_id, message_id, feedback):
+        def update():
+            with self._transaction() as connection:
+                message = self._read(connection, message_id, user_id, 'message')
+                if message is None:
+                    return False
+                return self._write(
+                    connection, {**message, 'feedback': feedback, 'updatedAt': datetime.utcnow().isoformat()}
+                )
+
+        return await asyncio.to_thread(update)
+
+    async def get_messages(self, user_id, conversation_id):
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT document FROM items WHERE conversation_id = ? AND user_id = ? AND type = 'message' ORDER BY created_at ASC",
+            (conversation_id, user_id)
+        )
+
+    async def get_feedback_messages(self, user_id):
+        messages = await asyncio.to_thread(
+            self._query,
+            "SELECT document FROM items WHERE user_id = ? AND type = 'message' AND feedback IS NOT NULL AND feedback <> '' "
+            "ORDER BY updated_at DESC",
+            (user_id,)
+        )
+        fields = ('id', 'feedback', 'content', 'role', 'conversationId', 'createdAt', 'updatedAt')
+        return [{key: message[key] for key in fields if key in message} for message in messages]
+
+    async def _get_adjacent_message(self, user_id, conversation_id, role, comparison, created_at, sort_order):
+        messages = await asyncio.to_thread(
+            self._query,
+            "SELECT document FROM items WHERE conversation_id = ? AND user_id = ? AND type = 'message' AND role = ? "
+            f"AND created_at {comparison} ? ORDER BY created_at {sort_order} LIMIT 1",
+            (conversation_id, user_id, role, created_at)
+        )
+        return messages[0] if messages else None
+
+    async def get_previous_user_message(self, user_id, conversation_id, created_at):
+        return await self._get_adjacent_message(user_id, conversation_id, 'user', '<', created_at, 'DESC')
+
+    async def get_next_assistant_message(self, user_id, conversation_id, created_at):
+        return await self._get_adjacent_message(user_id, conversation_id, 'assistant', '>', created_at, 'ASC')
+
+    async def find_item(self, item_id):
+        items = await asyncio.to_thread(self._query, "SELECT document FROM items WHERE id = ?", (item_id,))
+        return items[0] if items else None
+
+    async def find_user_messages(self, text, limit):
+        messages = await asyncio.to_thread(
+            self._query,
+            "SELECT document FROM items WHERE type = 'message' AND role = 'user' "
+            "AND instr(lower(json_extract(document, '$.content')), lower(?)) > 0 LIMIT ?",
+            (text, limit)
+        )
+        return [{'id': message['id'], 'content': message['content']} for message in messages]
+
+
+def _sort_order(sort_order: str) -> str:
+    return 'ASC' if sort_order.upper() == 'ASC' else 'DESC'
+
+
+def _list_fields(conversation: dict) -> dict:
+    return {key: conversation[key] for key in CONVERSATION_LIST_FIELDS if key in conversation}
+
+
+def _decode_page_token(continuation_token: str):
+    """Returns the (updatedAt, id) a page token continues after; raises ValueError if it is malformed."""
+    try:
+        position = json_loads(continuation_token)
+    except ValueError as e:
+        raise ValueError("Invalid continuation token") from e
+
+    if (
+        not isinstance(position, list)
+        or len(position) != 2
+        or not all(isinstance(value, str) for value in position)
+    ):
+        raise ValueError("Invalid continuation token")
+    return position
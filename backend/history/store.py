@@ -0,0 +1,136 @@
+from abc import ABC, abstractmethod
+
+
+class ConversationStore(ABC):
+    """
+    Storage of conversations and their messages for the /history routes.
+    Conversations and messages are dicts with the fields the Cosmos DB
+    documents have (id, type, userId, createdAt, updatedAt, plus title for
+    conversations and conversationId, role, content and feedback for
+    messages); timestamps are ISO 8601 strings in UTC.
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def ensure(self):
+        """Returns (success, message) after checking that the store can be used."""
+        pass
+
+    @abstractmethod
+    async def create_conversation(self, user_id, title = '', conversation_id = None):
+        pass
+
+    @abstractmethod
+    async def upsert_conversation(self, conversation):
+        pass
+
+    @abstractmethod
+    async def patch_conversation(self, user_id, conversation_id, fields: dict, expected: dict = None, etag: str = None):
+        """
+        Sets fields of a conversation owned by user_id, if it still has the
+        expected field values and is at the version etag. Returns the updated
+        conversation, or None.
+        """
+        pass
+
+    @abstractmethod
+    async def delete_conversation(self, user_id, conversation_id):
+        pass
+
+    @abstractmethod
+    async def delete_items(self, user_id, item_ids, on_deleted=None):
+        """
+        Deletes conversations and messages of user_id. Items that are already
+        gone count as deleted. on_deleted is called with each item id and
+        whether it was deleted. Returns the deleted flags in item order.
+        """
+        pass
+
+    async def delete_messages(self, conversation_id, user_id, on_deleted=None):
+        messages = await self.get_messages(user_id, conversation_id)
+        if messages:
+            return await self.delete_items(user_id, [message['id'] for message in messages], on_deleted)
+
+    @abstractmethod
+    async def get_history_item_ids(self, user_id):
+        """Returns the ids of all conversations and of all messages of user_id."""
+        pass
+
+    @abstractmethod
+    async def get_conversations(self, user_id, limit, sort_order = 'DESC', offset = 0):
+        pass
+
+    @abstractmethod
+    async def get_conversation_page(self, user_id, page_size, continuation_token = None, sort_order = 'DESC'):
+        """
+        Returns up to page_size conversations with the fields the history list
+        shows, and the continuation token of the next page (None on the last
+        page).
+        """
+        pass
+
+    @abstractmethod
+    async def get_conversation(self, user_id, conversation_id):
+        pass
+
+    @abstractmethod
+    async def get_message(self, user_id, message_id):
+        pass
+
+    async def create_message(self, uuid, conversation_id, user_id, input_message: dict):
+        resp = await self.create_messages(conversation_id, user_id, [(uuid, input_message)])
+        if resp == "Conversation not found":
+            return resp
+        return resp[0]
+
+    @abstractmethod
+    async def create_messages(self, conversation_id, user_id, input_messages: list):
+        """
+        Saves (id, message) pairs in order and moves the conversation's
+        updatedAt to the last one. Returns one result per message, or
+        "Conversation not found".
+        """
+        pass
+
+    @abstractmethod
+    async def update_message_feedback(self, user_id, message_id, feedback):
+        pass
+
+    @abstractmethod
+    async def get_messages(self, user_id, conversation_id):
+        """Returns the messages of a conversation, oldest first."""
+        pass
+
+    @abstractmethod
+    async def get_feedback_messages(self, user_id):
+        """Returns the messages of user_id that have feedback, most recently updated first."""
+        pass
+
+    @abstractmethod
+    async def get_previous_user_message(self, user_id, conversation_id, created_at):
+        """Returns the last user message of a conversation created before created_at, or None."""
+        pass
+
+    @abstractmethod
+    async def get_next_assistant_message(self, user_id, conversation_id, created_at):
+        """Returns the first assistant message of a conversation created after created_at, or None."""
+        pass
+
+    @abstractmethod
+    async def find_item(self, item_id):
+        """Returns the item with the given id whoever owns it, or None; for diagnostics and shared lookups."""
+        pass
+
+    @abstractmethod
+    async def find_user_messages(self, text, limit):
+        """Returns up to limit user messages of any user whose content contains text, ignoring case."""
+        pass
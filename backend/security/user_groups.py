@@ -0,0 +1,99 @@
+import base64
+import hashlib
+import json
+import logging
+
+import httpx
+
+from backend.cache.ttl_cache import TTLCache
+from backend.concurrency import SingleFlight
+
+GRAPH_TRANSITIVE_MEMBER_OF_URL = "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
+DEFAULT_GROUPS_CACHE_TTL_SECONDS = 300.0
+DEFAULT_GROUPS_CACHE_MAX_SIZE = 10000
+
+
+def get_token_subject(user_token: str) -> str:
+    # The token is only decoded (not validated) to read the subject, so it
+    # can be used for cache keys and logs but never for authorization.
+    try:
+        payload = user_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return claims.get("oid") or claims.get("sub") or ""
+    except Exception:
+        return ""
+
+
+class GraphUserGroupsClient():
+    """
+    Async Microsoft Graph client for a user's transitive group memberships.
+
+    Group ids are cached per user for cache_ttl_seconds and concurrent
+    lookups for the same user share a single Graph call. The cache key is
+    the token subject plus a hash of the token itself, so a token that
+    merely claims another user's subject cannot read that user's groups.
+    """
+
+    def __init__(
+        self,
+        cache_ttl_seconds: float = DEFAULT_GROUPS_CACHE_TTL_SECONDS,
+        cache_max_size: int = DEFAULT_GROUPS_CACHE_MAX_SIZE,
+        http_client: httpx.AsyncClient = None
+    ):
+        self.cache = TTLCache(max_size=cache_max_size, ttl_seconds=cache_ttl_seconds)
+        self.http_client = http_client
+        self._single_flight = SingleFlight()
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient()
+        return self.http_client
+
+    def _cache_key(self, user_token: str) -> str:
+        token_hash = hashlib.sha256(user_token.encode("utf-8")).hexdigest()
+        return f"{get_token_subject(user_token)}:{token_hash}"
+
+    async def iter_groups(self, user_token: str):
+        """Yield group objects page by page, following @odata.nextLink."""
+        headers = {"Authorization": "bearer " + user_token}
+        endpoint = GRAPH_TRANSITIVE_MEMBER_OF_URL
+        while endpoint:
+            response = await self._get_http_client().get(endpoint, headers=headers)
+            if response.status_code != 200:
+                raise ValueError(f"Error fetching user groups: {response.status_code} {response.text}")
+
+            page = response.json()
+            for group in page.get("value", []):
+                yield group
+
+            endpoint = page.get("@odata.nextLink")
+
+    async def _fetch_group_ids(self, user_token: str, cache_key: str) -> tuple:
+        group_ids = tuple([group["id"] async for group in self.iter_groups(user_token)])
+        self.cache.set(cache_key, group_ids)
+        return group_ids
+
+    async def get_group_ids(self, user_token: str) -> tuple:
+        cache_key = self._cache_key(user_token)
+        group_ids = self.cache.get(cache_key)
+        if group_ids is not None:
+            return group_ids
+
+        try:
+            return await self._single_flight.run(
+                cache_key,
+                self._fetch_group_ids,
+                user_token,
+                cache_key
+            )
+        except Exception as e:
+            # failures are not cached so the next request tries again
+            logging.error(f"Exception in fetchUserGroups: {e}")
+            return ()
+
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
@@ -19,6 +19,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Literal, Optional
 from typing_extensions import Self
 from quart import Request
+from backend.security.user_groups import GraphUserGroupsClient
 from backend.utils import parse_multi_columns, generateFilterString
 
 DOTENV_PATH = os.environ.get(
@@ -59,11 +60,74 @@ class _ChatHistorySettings(BaseSettings):
         env_ignore_empty=True
     )
 
-    database: str
-    account: str
+    backend: Literal["cosmos", "sqlite"] = Field(default="cosmos", validation_alias="CHAT_HISTORY_BACKEND")
+    sqlite_path: str = Field(default=".chat_history/history.sqlite3", validation_alias="CHAT_HISTORY_SQLITE_PATH")
+    database: Optional[str] = None
+    account: Optional[str] = None
     account_key: Optional[str] = None
-    conversations_container: str
+    conversations_container: Optional[str] = None
     enable_feedback: bool = False
+    title_wait_seconds: confloat(ge=0) = 10.0
+    delete_concurrency: conint(ge=1) = 16
+    list_page_size: conint(ge=1, le=100) = 25
+
+    @model_validator(mode="after")
+    def validate_cosmos_settings(self) -> Self:
+        if self.backend == "cosmos" and not (self.account and self.database and self.conversations_container):
+            raise ValueError(
+                "AZURE_COSMOSDB_ACCOUNT, AZURE_COSMOSDB_DATABASE and AZURE_COSMOSDB_CONVERSATIONS_CONTAINER "
+                "are required for the cosmos chat history backend"
+            )
+
+        return self
+
+
+class _HistoryListCacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="HISTORY_LIST_CACHE_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    backend: Literal["memory", "sqlite"] = "memory"
+    path: str = ".history_list_cache/lists.sqlite3"
+    max_size: conint(ge=1) = 10000
+    ttl_seconds: confloat(gt=0) = 60.0
+
+
+class _HistoryJobsSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="HISTORY_JOBS_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    backend: Literal["memory", "sqlite"] = "sqlite"
+    path: str = ".history_jobs/jobs.sqlite3"
+    max_jobs: conint(ge=1) = 1000
+    ttl_seconds: confloat(gt=0) = 3600.0
+
+
+class _AdminSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="ADMIN_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    principal_ids: Optional[str] = None
+
+    def is_admin(self, principal_id: Optional[str]) -> bool:
+        if not (self.enabled and self.principal_ids and principal_id):
+            return False
+
+        allowed = [value.strip() for value in parse_multi_columns(self.principal_ids)]
+        return principal_id in allowed
 
 
 class _PromptflowSettings(BaseSettings):
@@ -82,6 +146,107 @@ class _PromptflowSettings(BaseSettings):
     citations_field_name: str = "documents"
 
 
+class _HistoryWindowSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="HISTORY_WINDOW_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    max_turns: Optional[conint(ge=1)] = None
+    max_prompt_tokens: Optional[conint(ge=1)] = None
+    reserved_tokens: conint(ge=0) = 500
+    drop_older_citations: bool = True
+    citation_turns: conint(ge=0) = 1
+    summarize: bool = False
+    summary_max_tokens: conint(ge=1) = 256
+
+
+class _ResponseCacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="RESPONSE_CACHE_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    backend: Literal["memory", "file"] = "memory"
+    directory: str = ".response_cache"
+    max_size: conint(ge=1) = 1024
+    ttl_seconds: confloat(gt=0) = 3600.0
+    scope: Literal["user", "global"] = "user"
+
+
+class _SemanticCacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="SEMANTIC_CACHE_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    embedder: Literal["azure_openai", "hashing"] = "azure_openai"
+    embedding_deployment: Optional[str] = None
+    similarity_threshold: confloat(ge=0.0, le=1.0) = 0.95
+    max_size: conint(ge=1) = 1024
+    ttl_seconds: confloat(gt=0) = 3600.0
+    scope: Literal["user", "global"] = "user"
+    index_version: Optional[str] = None
+    index_version_file: Optional[str] = None
+    index_version_check_seconds: confloat(ge=0) = 1.0
+
+
+class _RequestCoalescingSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="REQUEST_COALESCING_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    scope: Literal["user", "global"] = "global"
+
+
+class _AdmissionSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="ADMISSION_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    enabled: bool = False
+    tokens_per_minute: Optional[conint(ge=1)] = None
+    requests_per_minute: Optional[conint(ge=1)] = None
+    user_tokens_per_minute: Optional[conint(ge=1)] = None
+    user_requests_per_minute: Optional[conint(ge=1)] = None
+    max_queue_size: conint(ge=1) = 100
+    max_wait_seconds: confloat(gt=0) = 10.0
+
+
+class _StreamingSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="STREAMING_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    coalesce: bool = False
+    coalesce_max_delay_ms: confloat(ge=0) = 30.0
+    coalesce_max_chars: conint(ge=1) = 64
+    envelope: Literal["full", "once"] = "full"
+    sse_heartbeat_seconds: confloat(gt=0) = 15.0
+    sse_retry_ms: conint(ge=0) = 3000
+    sse_replay_ttl_seconds: confloat(gt=0) = 300.0
+    sse_max_streams: conint(ge=1) = 1000
+
+
 class _AzureOpenAIFunction(BaseModel):
     name: str = Field(..., min_length=1)
     description: str = Field(..., min_length=1)
@@ -93,15 +258,26 @@ class _AzureOpenAITool(BaseModel):
     function: _AzureOpenAIFunction
     
 
+class _AzureOpenAIDeployment(BaseModel):
+    endpoint: str
+    deployment: str
+    name: Optional[str] = None
+    key: Optional[str] = None
+    weight: confloat(gt=0) = 1.0
+    priority: conint(ge=0) = 0
+
+
 class _AzureOpenAISettings(BaseSettings):
     model_config = SettingsConfigDict(
         env_prefix="AZURE_OPENAI_",
         env_file=DOTENV_PATH,
         extra='ignore',
-        env_ignore_empty=True
+        env_ignore_empty=True,
+        protected_namespaces=()
     )
     
     model: str
+    model_name: Optional[str] = None
     key: Optional[str] = None
     resource: Optional[str] = None
     endpoint: Optional[str] = None
@@ -128,7 +304,17 @@ class _AzureOpenAISettings(BaseSettings):
     function_call_azure_functions_tools_base_url: Optional[str] = None
     function_call_azure_functions_tool_key: Optional[str] = None
     function_call_azure_functions_tool_base_url: Optional[str] = None
-    
+    function_call_azure_functions_tools_refresh_interval: float = 300.0
+    function_call_azure_functions_tool_timeout: confloat(gt=0) = 30.0
+    function_call_azure_functions_max_concurrency: conint(ge=1) = 4
+    max_connections: conint(ge=1) = 100
+    max_keepalive_connections: conint(ge=0) = 20
+    keepalive_expiry: confloat(gt=0) = 30.0
+    deployments: Optional[conlist(_AzureOpenAIDeployment, min_length=1)] = None
+    deployment_failure_threshold: conint(ge=1) = 3
+    deployment_circuit_open_seconds: confloat(ge=0) = 30.0
+    deployment_default_cooldown_seconds: confloat(ge=0) = 10.0
+
     @field_validator('tools', mode='before')
     @classmethod
     def deserialize_tools(cls, tools_json_str: str) -> List[_AzureOpenAITool]:
@@ -144,6 +330,19 @@ class _AzureOpenAISettings(BaseSettings):
             
         return None
     
+    @field_validator('deployments', mode='before')
+    @classmethod
+    def deserialize_deployments(cls, deployments_json_str: str) -> List[_AzureOpenAIDeployment]:
+        if isinstance(deployments_json_str, str):
+            try:
+                return json.loads(deployments_json_str)
+            except json.JSONDecodeError as e:
+                logging.warning(f"An error occurred while deserializing the deployments string -- {str(e)}")
+
+            return None
+
+        return deployments_json_str
+    
     @field_validator('logit_bias', mode='before')
     @classmethod
     def deserialize_logit_bias(cls, logit_bias_json_str: str) -> dict:
@@ -229,18 +428,43 @@ class _SearchCommonSettings(BaseSettings):
 
 class DatasourcePayloadConstructor(BaseModel, ABC):
     _settings: '_AppSettings' = PrivateAttr()
+    _static_parameters: dict = PrivateAttr(default=None)
     
     def __init__(self, settings: '_AppSettings', **data):
         super().__init__(**data)
         self._settings = settings
+        # The settings never change after startup, so the parameters are
+        # serialized once here and shared (read-only) by every request.
+        self._static_parameters = self.construct_static_parameters()
     
+    async def get_request_filter(self, request: Request) -> Optional[str]:
+        return None
+
     @abstractmethod
+    def construct_static_parameters(self) -> dict:
+        pass
+
+    def construct_request_parameters(self, *args, **kwargs) -> dict:
+        return {}
+
+    async def close(self):
+        pass
+
     def construct_payload_configuration(
         self,
         *args,
         **kwargs
     ):
-        pass
+        # Per-request fields are overlaid on a fresh top-level dict, so
+        # concurrent requests never write to shared state. Nested values
+        # come from the shared static parameters and must not be mutated.
+        parameters = dict(self._static_parameters)
+        parameters.update(self.construct_request_parameters(*args, **kwargs))
+        
+        return {
+            "type": self._type,
+            "parameters": parameters
+        }
 
 
 class _AzureSearchSettings(BaseSettings, DatasourcePayloadConstructor):
@@ -275,6 +499,9 @@ class _AzureSearchSettings(BaseSettings, DatasourcePayloadConstructor):
         'vectorSemanticHybrid'
     ] = "simple"
     permitted_groups_column: Optional[str] = Field(default=None, exclude=True)
+    permitted_groups_cache_ttl: confloat(gt=0) = Field(default=300.0, exclude=True)
+    permitted_groups_cache_size: conint(ge=1) = Field(default=10000, exclude=True)
+    _user_groups_client: Optional[GraphUserGroupsClient] = PrivateAttr(default=None)
     
     # Constructed fields
     endpoint: Optional[str] = None
@@ -321,7 +548,7 @@ class _AzureSearchSettings(BaseSettings, DatasourcePayloadConstructor):
         self.query_type = to_snake(self.query_type)
         return self
 
-    def _set_filter_string(self, request: Request) -> str:
+    async def _set_filter_string(self, request: Request) -> str:
         if self.permitted_groups_column:
             user_token = request.headers.get("X-MS-TOKEN-AAD-ACCESS-TOKEN", "")
             logging.debug(f"USER TOKEN is {'present' if user_token else 'not present'}")
@@ -330,30 +557,44 @@ class _AzureSearchSettings(BaseSettings, DatasourcePayloadConstructor):
                     "Document-level access control is enabled, but user access token could not be fetched."
                 )
 
-            filter_string = generateFilterString(user_token)
+            filter_string = await generateFilterString(user_token, self.get_user_groups_client())
             logging.debug(f"FILTER: {filter_string}")
             return filter_string
         
         return None
+
+    async def get_request_filter(self, request: Request) -> Optional[str]:
+        # Resolved before the payload is built since the group lookup is async
+        return await self._set_filter_string(request)
+
+    def get_user_groups_client(self) -> GraphUserGroupsClient:
+        if self._user_groups_client is None:
+            self._user_groups_client = GraphUserGroupsClient(
+                cache_ttl_seconds=self.permitted_groups_cache_ttl,
+                cache_max_size=self.permitted_groups_cache_size
+            )
+
+        return self._user_groups_client
+
+    async def close(self):
+        if self._user_groups_client is not None:
+            await self._user_groups_client.close()
             
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
-        request = kwargs.pop('request', None)
-        if request and self.permitted_groups_column:
-            self.filter = self._set_filter_string(request)
-            
-        self.embedding_dependency = \
-            self._settings.azure_openai.extract_embedding_dependency()
+    def construct_static_parameters(self) -> dict:
         parameters = self.model_dump(exclude_none=True, by_alias=True)
+        embedding_dependency = self._settings.azure_openai.extract_embedding_dependency()
+        if embedding_dependency:
+            parameters["embedding_dependency"] = embedding_dependency
         parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
         
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        return parameters
+
+    def construct_request_parameters(self, *args, **kwargs) -> dict:
+        request_filter = kwargs.get('filter')
+        if request_filter and self.permitted_groups_column:
+            return {"filter": request_filter}
+        
+        return {}
 
 
 class _AzureCosmosDbMongoVcoreSettings(
@@ -413,19 +654,14 @@ class _AzureCosmosDbMongoVcoreSettings(
         }
         return self
     
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
-        self.embedding_dependency = \
-            self._settings.azure_openai.extract_embedding_dependency()
+    def construct_static_parameters(self) -> dict:
         parameters = self.model_dump(exclude_none=True, by_alias=True)
+        embedding_dependency = self._settings.azure_openai.extract_embedding_dependency()
+        if embedding_dependency:
+            parameters["embedding_dependency"] = embedding_dependency
         parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        
+        return parameters
 
 
 class _ElasticsearchSettings(BaseSettings, DatasourcePayloadConstructor):
@@ -483,22 +719,16 @@ class _ElasticsearchSettings(BaseSettings, DatasourcePayloadConstructor):
         }
         return self
     
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
-        self.embedding_dependency = \
+    def construct_static_parameters(self) -> dict:
+        parameters = self.model_dump(exclude_none=True, by_alias=True)
+        embedding_dependency = \
             {"type": "model_id", "model_id": self.embedding_model_id} if self.embedding_model_id else \
             self._settings.azure_openai.extract_embedding_dependency() 
-            
-        parameters = self.model_dump(exclude_none=True, by_alias=True)
+        if embedding_dependency:
+            parameters["embedding_dependency"] = embedding_dependency
         parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
                 
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        return parameters
 
 
 class _PineconeSettings(BaseSettings, DatasourcePayloadConstructor):
@@ -555,20 +785,14 @@ class _PineconeSettings(BaseSettings, DatasourcePayloadConstructor):
         }
         return self
     
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
-        self.embedding_dependency = \
-            self._settings.azure_openai.extract_embedding_dependency()
+    def construct_static_parameters(self) -> dict:
         parameters = self.model_dump(exclude_none=True, by_alias=True)
+        embedding_dependency = self._settings.azure_openai.extract_embedding_dependency()
+        if embedding_dependency:
+            parameters["embedding_dependency"] = embedding_dependency
         parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
         
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        return parameters
 
 
 class _AzureMLIndexSettings(BaseSettings, DatasourcePayloadConstructor):
@@ -613,18 +837,11 @@ class _AzureMLIndexSettings(BaseSettings, DatasourcePayloadConstructor):
         }
         return self
     
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
+    def construct_static_parameters(self) -> dict:
         parameters = self.model_dump(exclude_none=True, by_alias=True)
         parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
         
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        return parameters
 
 
 class _AzureSqlServerSettings(BaseSettings, DatasourcePayloadConstructor):
@@ -660,18 +877,11 @@ class _AzureSqlServerSettings(BaseSettings, DatasourcePayloadConstructor):
             }
         return self
     
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
+    def construct_static_parameters(self) -> dict:
         parameters = self.model_dump(exclude_none=True, by_alias=True)
         #parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
         
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        return parameters
     
 
 class _MongoDbSettings(BaseSettings, DatasourcePayloadConstructor):
@@ -734,21 +944,14 @@ class _MongoDbSettings(BaseSettings, DatasourcePayloadConstructor):
         }
         return self
     
-    def construct_payload_configuration(
-        self,
-        *args,
-        **kwargs
-    ):
-        self.embedding_dependency = \
-            self._settings.azure_openai.extract_embedding_dependency()
-            
+    def construct_static_parameters(self) -> dict:
         parameters = self.model_dump(exclude_none=True, by_alias=True)
+        embedding_dependency = self._settings.azure_openai.extract_embedding_dependency()
+        if embedding_dependency:
+            parameters["embedding_dependency"] = embedding_dependency
         parameters.update(self._settings.search.model_dump(exclude_none=True, by_alias=True))
         
-        return {
-            "type": self._type,
-            "parameters": parameters
-        }
+        return parameters
         
         
 class _BaseSettings(BaseSettings):
@@ -769,6 +972,15 @@ class _AppSettings(BaseModel):
     azure_openai: _AzureOpenAISettings = _AzureOpenAISettings()
     search: _SearchCommonSettings = _SearchCommonSettings()
     ui: Optional[_UiSettings] = _UiSettings()
+    history_window: _HistoryWindowSettings = _HistoryWindowSettings()
+    response_cache: _ResponseCacheSettings = _ResponseCacheSettings()
+    semantic_cache: _SemanticCacheSettings = _SemanticCacheSettings()
+    request_coalescing: _RequestCoalescingSettings = _RequestCoalescingSettings()
+    admission: _AdmissionSettings = _AdmissionSettings()
+    streaming: _StreamingSettings = _StreamingSettings()
+    history_list_cache: _HistoryListCacheSettings = _HistoryListCacheSettings()
+    history_jobs: _HistoryJobsSettings = _HistoryJobsSettings()
+    admin: _AdminSettings = _AdminSettings()
     
     # Constructed properties
     chat_history: Optional[_ChatHistorySettings] = None
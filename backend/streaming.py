@@ -0,0 +1,285 @@
+import asyncio
+import time
+import uuid
+
+from backend.cache.ttl_cache import TTLCache
+from backend.concurrency import StreamBroadcast
+from backend.utils import json_dumps
+
+# Keys of a streamed frame that describe the response rather than the delta
+ENVELOPE_KEYS = ("id", "model", "created", "object", "history_metadata", "apim-request-id")
+
+_NOT_SENT = object()
+
+
+def _envelope(frame: dict) -> dict:
+    return {key: frame[key] for key in ENVELOPE_KEYS if key in frame}
+
+
+def _assistant_content(frame: dict):
+    """Returns the text of a plain assistant content delta, or None."""
+    choices = frame.get("choices")
+    if not choices or len(choices) != 1:
+        return None
+
+    messages = choices[0].get("messages")
+    if not messages or len(messages) != 1:
+        return None
+
+    message = messages[0]
+    if message.keys() != {"role", "content"} or message["role"] != "assistant":
+        return None
+
+    return message["content"] if isinstance(message["content"], str) else None
+
+
+def _with_content(frame: dict, content: str) -> dict:
+    return {
+        **frame,
+        "choices": [{**frame["choices"][0], "messages": [{"role": "assistant", "content": content}]}],
+    }
+
+
+async def coalesce_stream(stream, max_delay_seconds: float = 0.03, max_chars: int = 64):
+    """
+    Merges consecutive assistant content deltas into one frame until
+    max_chars characters are pending or max_delay_seconds has passed since
+    the first pending delta. Other frames (citations, tool calls, errors)
+    are passed through in order, and empty frames are dropped.
+    """
+    iterator = stream.__aiter__()
+    pending = None
+    pending_content = []
+    pending_chars = 0
+    pending_since = 0.0
+    next_frame = None
+
+    def flush():
+        nonlocal pending, pending_content, pending_chars
+        frame = _with_content(pending, "".join(pending_content))
+        pending = None
+        pending_content = []
+        pending_chars = 0
+        return frame
+
+    try:
+        while True:
+            if next_frame is None:
+                next_frame = asyncio.ensure_future(iterator.__anext__())
+
+            if pending is not None:
+                timeout = max(pending_since + max_delay_seconds - time.monotonic(), 0)
+                done, _ = await asyncio.wait({next_frame}, timeout=timeout)
+                if not done:
+                    yield flush()
+                    continue
+
+            try:
+                frame = await next_frame
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # deliver what was already generated before the error
+                if pending is not None:
+                    yield flush()
+                raise
+            next_frame = None
+
+            if not frame:
+                continue
+
+            content = _assistant_content(frame)
+            if pending is not None and (content is None or _envelope(pending) != _envelope(frame)):
+                yield flush()
+
+            if content is None:
+                yield frame
+                continue
+
+            if pending is None:
+                pending = frame
+                pending_since = time.monotonic()
+            pending_content.append(content)
+            pending_chars += len(content)
+            if pending_chars >= max_chars:
+                yield flush()
+
+        if pending is not None:
+            yield flush()
+    finally:
+        if next_frame is not None and not next_frame.done():
+            next_frame.cancel()
+
+
+async def send_envelope_once(stream):
+    """
+    Sends the envelope (id, model, history_metadata, ...) with the first
+    frame only. Later frames carry their choices plus any envelope field
+    whose value changed since it was last sent.
+    """
+    sent = {}
+    async for frame in stream:
+        if not frame:
+            continue
+
+        envelope = _envelope(frame)
+        changed = {key: value for key, value in envelope.items() if sent.get(key, _NOT_SENT) != value}
+        sent.update(changed)
+        yield {
+            **changed,
+            **{key: value for key, value in frame.items() if key not in envelope},
+        }
+
+
+async def hold_last_frame(stream, finalize):
+    """
+    Passes frames through one frame late, so the last non-empty frame can
+    be replaced with `await finalize(frame)` once the stream has ended.
+    Empty frames are passed through immediately.
+    """
+    held = None
+    try:
+        async for frame in stream:
+            if not frame:
+                yield frame
+                continue
+
+            if held is not None:
+                yield held
+            held = frame
+    except Exception:
+        # deliver what was already generated before the error
+        if held is not None:
+            yield held
+        raise
+
+    if held is not None:
+        yield await finalize(held)
+
+
+async def stream_after(wait, stream):
+    """
+    Yields the frames of stream once `await wait()` has returned. If it
+    raises, the exception is raised instead and stream is closed unread.
+    """
+    try:
+        await wait()
+        async for frame in stream:
+            yield frame
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def format_sse_event(data: str, event_id: str = None, event: str = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(last_event_id: str, stream_id: str) -> int:
+    """
+    Returns how many events of the stream the client has already received,
+    given the id of the last event it saw ("<stream id>:<sequence>").
+    """
+    if not last_event_id:
+        return 0
+
+    event_stream_id, _, sequence = last_event_id.rpartition(":")
+    if event_stream_id and event_stream_id != stream_id:
+        return 0
+
+    try:
+        return max(int(sequence), 0)
+    except ValueError:
+        return 0
+
+
+class SSEStreamRegistry():
+    """
+    Keeps the frames of recent SSE streams so a client that lost its
+    connection can resume from the last event it received. The producer
+    keeps running when the client disconnects; streams are forgotten
+    ttl_seconds after they finish (or after the registry is full).
+    """
+
+    def __init__(self, max_streams: int = 1000, ttl_seconds: float = 300):
+        self._streams = TTLCache(max_size=max_streams, ttl_seconds=ttl_seconds)
+
+    def start(self, source, owner: str = None) -> str:
+        stream_id = str(uuid.uuid4())
+        entry = (owner, StreamBroadcast(source, cancel_without_subscribers=False))
+        self._streams.set(stream_id, entry)
+        # the retention period starts when the answer is complete
+        entry[1].add_done_callback(lambda _: self._refresh(stream_id, entry))
+        return stream_id
+
+    def _refresh(self, stream_id: str, entry):
+        if self._streams.get(stream_id) is entry:
+            self._streams.set(stream_id, entry)
+
+    def get(self, stream_id: str, owner: str = None):
+        entry = self._streams.get(stream_id)
+        if entry is None or entry[0] != owner:
+            return None
+
+        return entry[1]
+
+    def stats(self) -> dict:
+        return {"retained_streams": len(self._streams)}
+
+
+async def format_as_sse(
+    broadcast: StreamBroadcast,
+    stream_id: str,
+    start: int = 0,
+    heartbeat_seconds: float = 15,
+    retry_ms: int = 3000
+):
+    """
+    Serializes a broadcast stream as Server-Sent Events from event number
+    start on. Event ids are "<stream id>:<sequence>"; a comment line is sent
+    whenever no frame was produced for heartbeat_seconds so idle proxies
+    keep the connection open. The stream ends with a "done" event, or an
+    "error" event if the answer could not be completed.
+    """
+    yield f"retry: {retry_ms}\n\n"
+
+    sequence = start
+    frames = broadcast.subscribe(start)
+    next_frame = None
+    try:
+        while True:
+            if next_frame is None:
+                next_frame = asyncio.ensure_future(frames.__anext__())
+
+            done, _ = await asyncio.wait({next_frame}, timeout=heartbeat_seconds)
+            if not done:
+                yield ": heartbeat\n\n"
+                continue
+
+            try:
+                frame = next_frame.result()
+            except StopAsyncIteration:
+                break
+            except Exception as error:
+                yield format_sse_event(json_dumps({"error": str(error)}), event="error")
+                return
+            finally:
+                next_frame = None
+
+            sequence += 1
+            if frame:
+                yield format_sse_event(json_dumps(frame), event_id=f"{stream_id}:{sequence}")
+
+        yield format_sse_event("{}", event_id=f"{stream_id}:{sequence}", event="done")
+    finally:
+        if next_frame is not None:
+            next_frame.cancel()
+        else:
+            await frames.aclose()
@@ -0,0 +1,82 @@
+import logging
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context window sizes (prompt + completion) by model name prefix. The
+# longest matching prefix wins, so "gpt-4-32k" is checked before "gpt-4".
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-35-turbo": 4096,
+    "gpt-35-turbo-16k": 16384,
+    "gpt-35-turbo-0125": 16384,
+    "gpt-35-turbo-1106": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Per-message framing overhead used by the chat completions format
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+CHARS_PER_TOKEN = 4
+
+
+def get_context_window(model_name: str) -> int:
+    if not model_name:
+        return DEFAULT_CONTEXT_WINDOW
+
+    model_name = model_name.lower()
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model_name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+@lru_cache(maxsize=16)
+def get_encoding(model_name: str):
+    # tiktoken downloads its BPE files on first use; if that is not possible
+    # (offline, or tiktoken not installed) token counts are estimated instead.
+    if tiktoken is None:
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name or "")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logging.warning(f"Unable to load tiktoken encoding, estimating token counts instead: {e}")
+        return None
+
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    if not text:
+        return 0
+
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: dict, model_name: str = None) -> int:
+    tokens = TOKENS_PER_MESSAGE
+    for key in ("content", "name", "context"):
+        value = message.get(key)
+        if isinstance(value, str):
+            tokens += count_tokens(value, model_name)
+    return tokens
+
+
+def count_messages_tokens(messages: list, model_name: str = None) -> int:
+    return sum(count_message_tokens(message, model_name) for message in messages) + TOKENS_PER_REPLY
@@ -1,10 +1,15 @@
 import os
 import json
 import logging
-import requests
 import dataclasses
 
 from typing import List
+from backend.security.user_groups import GraphUserGroupsClient
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DEBUG = os.environ.get("DEBUG", "false")
 if DEBUG.lower() == "true":
@@ -22,13 +27,102 @@ class JSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 
+def _json_default(o):
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+# datetimes and dataclasses go through the default function so both encoders
+# serialize them the same way
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS |
+    orjson.OPT_PASSTHROUGH_DATETIME |
+    orjson.OPT_PASSTHROUGH_DATACLASS
+) if orjson else 0
+
+
+def json_dumps(value, default=_json_default) -> str:
+    """
+    Serialize value as compact JSON, using orjson when it is installed and
+    the standard library otherwise.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=default, option=ORJSON_OPTIONS).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the standard library handles
+            pass
+
+    return json.dumps(value, default=default, separators=(",", ":"))
+
+
+def json_loads(value):
+    if orjson is not None:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            # let the standard library accept (or report) what orjson rejects
+            pass
+
+    return json.loads(value)
+
+
+SECRET_PARAMS = frozenset([
+    "key",
+    "connection_string",
+    "embedding_key",
+    "encoded_api_key",
+    "api_key",
+    "password",
+])
+REDACTED_VALUE = "*****"
+
+
+def redact_secrets(value, secret_params=SECRET_PARAMS, skip_keys=("messages",)):
+    """
+    Return a view of value with every non-empty secret_params entry masked.
+    Only the dicts and lists on the path to a secret are rebuilt; anything
+    under skip_keys (e.g. the conversation messages) is passed through as
+    is, so message bodies are never copied.
+    """
+    if isinstance(value, dict):
+        return {
+            k: (
+                v if k in skip_keys else
+                REDACTED_VALUE if k in secret_params and v else
+                redact_secrets(v, secret_params, skip_keys)
+            )
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact_secrets(v, secret_params, skip_keys) for v in value]
+
+    return value
+
+
+class RedactedJSON():
+    """
+    Lazily formats value as redacted JSON for logging. Pass it as a logging
+    argument so the redaction and serialization only run when the record
+    is actually emitted.
+    """
+
+    def __init__(self, value, indent=4):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(redact_secrets(self.value), indent=self.indent, cls=JSONEncoder)
+
+
 async def format_as_ndjson(r):
     try:
         async for event in r:
-            yield json.dumps(event, cls=JSONEncoder) + "\n"
+            yield json_dumps(event) + "\n"
     except Exception as error:
         logging.exception("Exception while generating response stream: %s", error)
-        yield json.dumps({"error": str(error)})
+        yield json_dumps({"error": str(error)})
 
 
 def parse_multi_columns(columns: str) -> list:
@@ -38,34 +132,15 @@ def parse_multi_columns(columns: str) -> list:
         return columns.split(",")
 
 
-def fetchUserGroups(userToken, nextLink=None):
-    # Recursively fetch group membership
-    if nextLink:
-        endpoint = nextLink
-    else:
-        endpoint = "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
-
-    headers = {"Authorization": "bearer " + userToken}
-    try:
-        r = requests.get(endpoint, headers=headers)
-        if r.status_code != 200:
-            logging.error(f"Error fetching user groups: {r.status_code} {r.text}")
-            return []
-
-        r = r.json()
-        if "@odata.nextLink" in r:
-            nextLinkData = fetchUserGroups(userToken, r["@odata.nextLink"])
-            r["value"].extend(nextLinkData)
-
-        return r["value"]
-    except Exception as e:
-        logging.error(f"Exception in fetchUserGroups: {e}")
-        return []
+async def fetchUserGroups(userToken, user_groups_client: GraphUserGroupsClient):
+    # Group ids are cached per user and concurrent lookups are coalesced
+    group_ids = await user_groups_client.get_group_ids(userToken)
+    return [{"id": group_id} for group_id in group_ids]
 
 
-def generateFilterString(userToken):
+async def generateFilterString(userToken, user_groups_client: GraphUserGroupsClient):
     # Get list of groups user is a member of
-    userGroups = fetchUserGroups(userToken)
+    userGroups = await fetchUserGroups(userToken, user_groups_client)
 
     # Construct filter string
     if not userGroups:
@@ -107,7 +182,7 @@ def format_non_streaming_response(chatCompletion, history_metadata, apim_request
                 response_obj["choices"][0]["messages"].append(
                     {
                         "role": "tool",
-                        "content": json.dumps(message.context),
+                        "content": json_dumps(message.context),
                     }
                 )
             response_obj["choices"][0]["messages"].append(
@@ -149,7 +224,7 @@ def format_stream_response(chatCompletionChunk, history_metadata, apim_request_i
                         if not citation.get('highlight_text'):
                             citation['highlight_text'] = citation.get('content', '')
                             
-                messageObj = {"role": "tool", "content": json.dumps(delta.context)}
+                messageObj = {"role": "tool", "content": json_dumps(delta.context)}
                 response_obj["choices"][0]["messages"].append(messageObj)
                 return response_obj
             if delta.role == "assistant" and hasattr(delta, "context"):
@@ -172,7 +247,7 @@ def format_stream_response(chatCompletionChunk, history_metadata, apim_request_i
                     }
                 }
                 if hasattr(delta, "context"):
-                    messageObj["context"] = json.dumps(delta.context)
+                    messageObj["context"] = json_dumps(delta.context)
                 response_obj["choices"][0]["messages"].append(messageObj)
                 return response_obj
             else:
@@ -226,7 +301,7 @@ def format_pf_non_streaming_response(
             citation_content= {"citations": citations}
             messages.append({ 
                 "role": "tool",
-                "content": json.dumps(citation_content)
+                "content": json_dumps(citation_content)
             })
 
         response_obj = {
@@ -0,0 +1,13 @@
+import pytest
+
+from tools.fake_cosmos import FakeCosmosContainer, fake_conversation_client
+
+
+@pytest.fixture
+def make_cosmos_client():
+    """Builds CosmosConversationClients backed by an in-memory FakeCosmosContainer."""
+    def make(partition_key_path="/id", **kwargs):
+        container = FakeCosmosContainer(partition_key_path=partition_key_path)
+        return fake_conversation_client(container, **kwargs)
+
+    return make
@@ -0,0 +1,148 @@
+import pytest
+
+import app as app_module
+from app import create_app
+
+
+ADMIN_ID = "00000000-0000-0000-0000-00000000a0a0"
+
+
+@pytest.fixture
+def admin_settings(monkeypatch):
+    settings = app_module.app_settings.admin
+    monkeypatch.setattr(settings, "enabled", True)
+    monkeypatch.setattr(settings, "principal_ids", f"someone-else-entirely, {ADMIN_ID}")
+    return settings
+
+
+@pytest.mark.asyncio
+async def test_admin_routes_are_hidden_unless_enabled(monkeypatch):
+    monkeypatch.setattr(app_module.app_settings.admin, "enabled", False)
+    client = create_app().test_client()
+
+    response = await client.post(
+        "/admin/tools/reload",
+        headers={"X-Ms-Client-Principal-Id": ADMIN_ID}
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_admin_routes_reject_other_principals(admin_settings):
+    client = create_app().test_client()
+
+    response = await client.post("/admin/tools/reload")
+    assert response.status_code == 403
+
+    response = await client.post(
+        "/admin/tools/reload",
+        headers={"X-Ms-Client-Principal-Id": "someone-else"}
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_admin_routes_allow_listed_principal(admin_settings):
+    client = create_app().test_client()
+
+    response = await client.post(
+        "/admin/tools/reload",
+        headers={"X-Ms-Client-Principal-Id": ADMIN_ID}
+    )
+    # Function calling is not configured in the test environment.
+    assert response.status_code == 404
+    assert "not enabled" in (await response.get_json())["error"]
+
+
+@pytest.mark.asyncio
+async def test_debug_metrics_requires_admin(admin_settings):
+    client = create_app().test_client()
+
+    response = await client.get("/debug/metrics")
+    assert response.status_code == 403
+
+    response = await client.get("/debug/metrics", headers={"X-Ms-Client-Principal-Id": ADMIN_ID})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidate_requires_admin(admin_settings):
+    client = create_app().test_client()
+
+    response = await client.post("/admin/cache/invalidate", json={})
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_index_version_needs_shared_file(admin_settings):
+    client = create_app().test_client()
+
+    response = await client.post(
+        "/admin/cache/invalidate",
+        json={"index_version": "v2"},
+        headers={"X-Ms-Client-Principal-Id": ADMIN_ID}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_index_version_reaches_other_workers(admin_settings, monkeypatch, tmp_path):
+    semantic_cache_settings = app_module.app_settings.semantic_cache
+    monkeypatch.setattr(semantic_cache_settings, "enabled", True)
+    monkeypatch.setattr(semantic_cache_settings, "embedder", "hashing")
+    monkeypatch.setattr(semantic_cache_settings, "index_version_file", str(tmp_path / "index_version"))
+    monkeypatch.setattr(semantic_cache_settings, "index_version_check_seconds", 0)
+
+    worker_1 = create_app()
+    worker_2 = create_app()
+    async with worker_1.app_context():
+        app_module.get_semantic_cache()
+    async with worker_2.app_context():
+        semantic_cache = app_module.get_semantic_cache()
+        fingerprint = semantic_cache.fingerprint
+
+    response = await worker_1.test_client().post(
+        "/admin/cache/invalidate",
+        json={"index_version": "v2"},
+        headers={"X-Ms-Client-Principal-Id": ADMIN_ID}
+    )
+    assert response.status_code == 200
+    assert app_module.app_settings.semantic_cache.index_version is None
+
+    async with worker_2.app_context():
+        await app_module.sync_cache_index_version()
+        assert app_module.get_semantic_cache() is semantic_cache
+        assert semantic_cache.fingerprint != fingerprint
+        assert semantic_cache.invalidations == 1
+
+
+@pytest.mark.asyncio
+async def test_plain_invalidation_reaches_other_workers(admin_settings, monkeypatch, tmp_path):
+    semantic_cache_settings = app_module.app_settings.semantic_cache
+    monkeypatch.setattr(semantic_cache_settings, "enabled", True)
+    monkeypatch.setattr(semantic_cache_settings, "embedder", "hashing")
+    monkeypatch.setattr(semantic_cache_settings, "index_version_file", str(tmp_path / "index_version"))
+    monkeypatch.setattr(semantic_cache_settings, "index_version_check_seconds", 0)
+    monkeypatch.setattr(app_module.app_settings.response_cache, "enabled", True)
+
+    worker_1 = create_app()
+    worker_2 = create_app()
+    async with worker_1.app_context():
+        app_module.get_semantic_cache()
+    async with worker_2.app_context():
+        response_cache = app_module.get_response_cache()
+        semantic_cache = app_module.get_semantic_cache()
+        await response_cache.set("key", ["frame"])
+
+    response = await worker_1.test_client().post(
+        "/admin/cache/invalidate",
+        json={},
+        headers={"X-Ms-Client-Principal-Id": ADMIN_ID}
+    )
+    assert response.status_code == 200
+    assert (await response.get_json())["all_workers"] is True
+
+    async with worker_2.app_context():
+        await app_module.sync_cache_index_version()
+        assert await response_cache.get("key") is None
+        assert semantic_cache.invalidations == 1
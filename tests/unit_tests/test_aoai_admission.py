@@ -0,0 +1,86 @@
+import asyncio
+import time
+import pytest
+from backend.aoai.admission import (
+    AdmissionController,
+    AdmissionRejectedError,
+    TokenBucket,
+    estimate_request_tokens
+)
+
+
+def test_estimate_request_tokens_includes_max_tokens():
+    model_args = {"messages": [{"role": "user", "content": "abcdefgh" * 10}], "max_tokens": 100}
+
+    assert estimate_request_tokens(model_args, "not-a-model") > 100
+    assert estimate_request_tokens({"messages": []}) < 10
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate_per_minute=6000)
+    assert bucket.time_until_available(6000) == 0
+
+    bucket.consume(6000)
+    assert bucket.time_until_available(100) == pytest.approx(1.0, abs=0.05)
+    # more than the capacity only has to wait for a full bucket
+    assert bucket.time_until_available(10000) == pytest.approx(60, abs=0.1)
+
+    bucket.refund(6000)
+    assert bucket.time_until_available(6000) == 0
+
+
+@pytest.mark.asyncio
+async def test_requests_queue_until_budget_is_available():
+    controller = AdmissionController(requests_per_minute=600, max_wait_seconds=1)
+
+    started_at = time.monotonic()
+    await asyncio.gather(*[controller.acquire("user", 1) for _ in range(602)])
+
+    # 600 are admitted at once, the rest wait for the bucket to refill
+    assert time.monotonic() - started_at >= 0.1
+    assert controller.stats()["admitted"] == 602
+    assert controller.stats()["max_queue_depth"] == 2
+    assert controller.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_retry_after_when_wait_is_too_long():
+    controller = AdmissionController(tokens_per_minute=600, max_wait_seconds=0.5)
+    await controller.acquire("user", 600)
+
+    with pytest.raises(AdmissionRejectedError) as error:
+        await controller.acquire("user", 100)
+
+    assert error.value.status_code == 429
+    assert error.value.retry_after == pytest.approx(10, abs=0.1)
+    assert controller.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    controller = AdmissionController(requests_per_minute=60, max_queue_size=1, max_wait_seconds=5)
+    for _ in range(60):
+        await controller.acquire("user", 1)
+
+    waiting = asyncio.ensure_future(controller.acquire("user", 1))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire("other", 1)
+
+    waiting.cancel()
+
+
+@pytest.mark.asyncio
+async def test_user_fair_share_does_not_block_other_users():
+    controller = AdmissionController(
+        tokens_per_minute=100000,
+        user_tokens_per_minute=1000,
+        max_wait_seconds=0.5
+    )
+    await controller.acquire("heavy", 1000)
+
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire("heavy", 500)
+
+    await asyncio.wait_for(controller.acquire("light", 500), 0.1)
+    assert controller.stats()["admitted"] == 2
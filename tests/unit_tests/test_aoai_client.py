@@ -0,0 +1,40 @@
+import time
+import pytest
+from azure.core.credentials import AccessToken
+from backend.aoai.client import CachedTokenProvider
+
+
+class DummyCredential:
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.calls = 0
+        self.closed = False
+
+    async def get_token(self, *scopes):
+        self.calls += 1
+        return AccessToken(f"token-{self.calls}", int(time.time()) + self.lifetime)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_cached_token_provider_reuses_token():
+    credential = DummyCredential(lifetime=3600)
+    provider = CachedTokenProvider(credential, "scope")
+
+    assert await provider() == "token-1"
+    assert await provider() == "token-1"
+    assert credential.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_token_provider_refreshes_expiring_token():
+    credential = DummyCredential(lifetime=60)
+    provider = CachedTokenProvider(credential, "scope", refresh_margin_seconds=300)
+
+    assert await provider() == "token-1"
+    assert await provider() == "token-2"
+
+    await provider.close()
+    assert credential.closed
@@ -0,0 +1,183 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from openai import AsyncAzureOpenAI, BadRequestError
+from backend.aoai.load_balancer import (
+    DeploymentBackend,
+    DeploymentPool,
+    NoDeploymentAvailableError,
+    get_retry_after
+)
+
+
+def chat_completion(deployment):
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": deployment,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"answer from {deployment}"}
+            }
+        ]
+    }
+
+
+class FakeAzureOpenAI():
+    """
+    Local stand-in for Azure OpenAI chat completions. Each deployment
+    answers with the queued (status, headers) responses, then with 200.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+        self.delay = 0
+
+    async def chat_completions(self, request):
+        deployment = request.match_info["deployment"]
+        self.calls.append(deployment)
+        await asyncio.sleep(self.delay)
+        queued = self.responses.get(deployment)
+        if queued:
+            status, headers = queued.pop(0)
+            return web.json_response({"error": {"code": str(status), "message": "fake error"}}, status=status, headers=headers)
+
+        return web.json_response(chat_completion(deployment))
+
+
+@pytest_asyncio.fixture
+async def fake_aoai():
+    fake = FakeAzureOpenAI()
+    app = web.Application()
+    app.router.add_post("/openai/deployments/{deployment}/chat/completions", fake.chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    fake.endpoint = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    yield fake
+    await runner.cleanup()
+
+
+def make_pool(fake, deployments, **kwargs):
+    backends = [
+        DeploymentBackend(
+            name,
+            AsyncAzureOpenAI(api_key="test", api_version="2024-05-01-preview", azure_endpoint=fake.endpoint, max_retries=0),
+            name,
+            weight=weight,
+            priority=priority
+        )
+        for name, weight, priority in deployments
+    ]
+    return DeploymentPool(backends, **kwargs)
+
+
+async def ask(pool):
+    response = await pool.call(
+        lambda backend: backend.client.chat.completions.create(
+            model=backend.deployment,
+            messages=[{"role": "user", "content": "hi"}]
+        )
+    )
+    return response.model
+
+
+def test_get_retry_after():
+    assert get_retry_after({"retry-after-ms": "1500"}, 10) == 1.5
+    assert get_retry_after({"retry-after": "7"}, 10) == 7
+    assert get_retry_after({"retry-after": "soon"}, 10) == 10
+    assert get_retry_after({}, 10) == 10
+
+
+@pytest.mark.asyncio
+async def test_fails_over_on_429_and_honours_retry_after(fake_aoai):
+    pool = make_pool(fake_aoai, [("east", 1, 0), ("west", 1, 0)])
+    fake_aoai.responses["east"] = [(429, {"retry-after": "30"})]
+
+    # east is picked first (fewest requests), throttles, and west answers
+    assert await ask(pool) == "west"
+    assert fake_aoai.calls == ["east", "west"]
+
+    east = pool.backends[0]
+    assert east.throttled == 1
+    assert 25 < east.cooldown_until - time.monotonic() <= 30
+    assert await ask(pool) == "west"
+    assert pool.stats()["west"]["successes"] == 2
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_lower_priority_tier_only_used_as_fallback(fake_aoai):
+    pool = make_pool(fake_aoai, [("primary", 1, 0), ("backup", 1, 1)])
+
+    assert [await ask(pool) for _ in range(3)] == ["primary"] * 3
+
+    fake_aoai.responses["primary"] = [(503, {"retry-after-ms": "20000"})]
+    assert await ask(pool) == "backup"
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_routes_to_least_outstanding_requests(fake_aoai):
+    pool = make_pool(fake_aoai, [("a", 1, 0), ("b", 1, 0), ("c", 2, 0)])
+    fake_aoai.delay = 0.05
+
+    results = await asyncio.gather(*[ask(pool) for _ in range(8)])
+
+    assert results.count("c") == 4
+    assert results.count("a") == 2
+    assert results.count("b") == 2
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_recovers(fake_aoai):
+    pool = make_pool(fake_aoai, [("flaky", 1, 0), ("steady", 1, 1)], failure_threshold=2, circuit_open_seconds=0.1)
+    fake_aoai.responses["flaky"] = [(500, {}), (500, {})]
+
+    assert await ask(pool) == "steady"
+    assert await ask(pool) == "steady"
+    flaky = pool.backends[0]
+    assert flaky.circuit_state == DeploymentBackend.OPEN
+
+    assert await ask(pool) == "steady"
+    assert fake_aoai.calls.count("flaky") == 2
+
+    await asyncio.sleep(0.1)
+    # after the open period a trial request closes the circuit again
+    assert await ask(pool) == "flaky"
+    assert flaky.circuit_state == DeploymentBackend.CLOSED
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(fake_aoai):
+    pool = make_pool(fake_aoai, [("east", 1, 0), ("west", 1, 0)])
+    fake_aoai.responses["east"] = [(400, {})]
+
+    with pytest.raises(BadRequestError):
+        await ask(pool)
+
+    assert fake_aoai.calls == ["east"]
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_all_deployments_throttled(fake_aoai):
+    pool = make_pool(fake_aoai, [("east", 1, 0), ("west", 1, 0)])
+    fake_aoai.responses["east"] = [(429, {"retry-after": "5"})]
+    fake_aoai.responses["west"] = [(429, {"retry-after": "3"})]
+
+    with pytest.raises(NoDeploymentAvailableError) as error:
+        await ask(pool)
+
+    assert error.value.status_code == 429
+    assert 2 < error.value.retry_after <= 3
+    await pool.close()
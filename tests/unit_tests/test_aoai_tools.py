@@ -0,0 +1,105 @@
+import asyncio
+import json
+import httpx
+import pytest
+from backend.aoai import tools as tools_module
+from backend.aoai.tools import (
+    AzureFunctionsToolExecutor,
+    AzureFunctionsToolLoader,
+    ToolRegistry
+)
+
+
+TOOLS = [
+    {"type": "function", "function": {"name": "get_weather", "description": "Weather"}},
+    {"type": "function", "function": {"name": "get_time", "description": "Time"}},
+]
+
+
+def use_transport(monkeypatch, handler):
+    real_client = httpx.AsyncClient
+
+    def client_factory(*args, **kwargs):
+        return real_client(transport=httpx.MockTransport(handler))
+
+    monkeypatch.setattr(tools_module.httpx, "AsyncClient", client_factory)
+
+
+def test_tool_registry_lookup():
+    registry = ToolRegistry(TOOLS)
+    assert len(registry) == 2
+    assert "get_weather" in registry
+    assert "delete_everything" not in registry
+
+
+@pytest.mark.asyncio
+async def test_tool_loader_replaces_registry(monkeypatch):
+    use_transport(monkeypatch, lambda request: httpx.Response(200, text=json.dumps(TOOLS)))
+    loader = AzureFunctionsToolLoader("https://tools.example/api/tools")
+
+    await loader.load()
+    await loader.load()
+
+    # reloading swaps the registry instead of appending to it
+    assert len(loader.registry) == 2
+    assert loader.loaded_at is not None
+
+
+@pytest.mark.asyncio
+async def test_tool_loader_keeps_registry_on_error(monkeypatch):
+    use_transport(monkeypatch, lambda request: httpx.Response(200, text=json.dumps(TOOLS)))
+    loader = AzureFunctionsToolLoader("https://tools.example/api/tools")
+    await loader.load()
+
+    use_transport(monkeypatch, lambda request: httpx.Response(500))
+    registry = await loader.load()
+
+    assert registry.names == {"get_weather", "get_time"}
+
+
+@pytest.mark.asyncio
+async def test_tool_executor_runs_calls_concurrently_in_order():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        body = json.loads(request.content)
+        # finish in reverse order to check results are reassembled in order
+        await asyncio.sleep(0.05 / body["tool_arguments"]["n"])
+        in_flight -= 1
+        return httpx.Response(200, text=f"result-{body['tool_arguments']['n']}")
+
+    executor = AzureFunctionsToolExecutor(
+        "https://tools.example/api/tool",
+        max_concurrency=2,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    results = await executor.call_many(
+        [("get_weather", json.dumps({"n": n})) for n in (1, 2, 3)]
+    )
+    await executor.close()
+
+    assert results == ["result-1", "result-2", "result-3"]
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_tool_executor_times_out_single_call():
+    async def handler(request):
+        if json.loads(request.content)["tool_name"] == "slow":
+            await asyncio.sleep(1)
+        return httpx.Response(200, text="ok")
+
+    executor = AzureFunctionsToolExecutor(
+        "https://tools.example/api/tool",
+        timeout_seconds=0.05,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    results = await executor.call_many([("slow", "{}"), ("fast", "{}")])
+    await executor.close()
+
+    assert "timed out" in json.loads(results[0])["error"]
+    assert results[1] == "ok"
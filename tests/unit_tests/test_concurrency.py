@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+from backend.concurrency import RequestCoalescer, StreamBroadcast, StreamCancelledError
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+@pytest.mark.asyncio
+async def test_stream_broadcast_replays_to_late_subscribers():
+    release = asyncio.Event()
+
+    async def source():
+        yield 1
+        await release.wait()
+        yield 2
+
+    broadcast = StreamBroadcast(source())
+    first = asyncio.ensure_future(collect(broadcast.subscribe()))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(collect(broadcast.subscribe()))
+    release.set()
+
+    assert await first == [1, 2]
+    assert await second == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_stream_broadcast_propagates_errors():
+    async def source():
+        yield 1
+        raise RuntimeError("upstream failed")
+
+    broadcast = StreamBroadcast(source())
+    with pytest.raises(RuntimeError):
+        await collect(broadcast.subscribe())
+
+
+@pytest.mark.asyncio
+async def test_stream_broadcast_cancels_source_without_subscribers():
+    cancelled = asyncio.Event()
+
+    async def source():
+        try:
+            yield 1
+            await asyncio.sleep(10)
+            yield 2
+        finally:
+            cancelled.set()
+
+    broadcast = StreamBroadcast(source())
+    stream = broadcast.subscribe()
+    assert await stream.__anext__() == 1
+    await stream.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_stream_broadcast_reports_cancelled_source_as_upstream_error():
+    async def source():
+        yield 1
+        raise asyncio.CancelledError()
+
+    broadcast = StreamBroadcast(source())
+    with pytest.raises(StreamCancelledError):
+        await collect(broadcast.subscribe())
+
+
+@pytest.mark.asyncio
+async def test_coalescer_starts_a_new_stream_after_the_last_subscriber_left():
+    coalescer = RequestCoalescer()
+    opened = 0
+
+    async def open_stream():
+        nonlocal opened
+        opened += 1
+
+        async def frames():
+            yield 0
+            await asyncio.sleep(0.01)
+            yield 1
+
+        return frames()
+
+    stream, is_leader = await coalescer.stream("key", open_stream)
+    assert is_leader
+    assert await stream.__anext__() == 0
+    await stream.aclose()
+
+    # stop and resend at once: the broadcast being cancelled is not joined
+    stream, is_leader = await coalescer.stream("key", open_stream)
+    assert is_leader
+    assert await collect(stream) == [0, 1]
+    assert opened == 2
+
+
+@pytest.mark.asyncio
+async def test_coalescer_shares_stream_between_identical_requests():
+    coalescer = RequestCoalescer()
+    opened = 0
+    release = asyncio.Event()
+
+    async def open_stream(answer):
+        nonlocal opened
+        opened += 1
+        await release.wait()
+
+        async def frames():
+            for part in answer:
+                yield part
+
+        return frames()
+
+    requests = [
+        asyncio.ensure_future(coalescer.stream("key", open_stream, "abc"))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*requests)
+
+    assert opened == 1
+    assert [is_leader for _, is_leader in results] == [True, False, False]
+    for stream, _ in results:
+        assert await collect(stream) == ["a", "b", "c"]
+
+    assert coalescer.stats() == {"leaders": 1, "followers": 2, "in_flight": 0}
+
+    # once the stream has finished a new request opens a new one
+    stream, is_leader = await coalescer.stream("key", open_stream, "d")
+    assert is_leader
+    assert await collect(stream) == ["d"]
+
+
+@pytest.mark.asyncio
+async def test_coalescer_open_errors_reach_every_caller():
+    coalescer = RequestCoalescer()
+
+    async def open_stream():
+        await asyncio.sleep(0)
+        raise RuntimeError("429")
+
+    results = await asyncio.gather(
+        coalescer.stream("key", open_stream),
+        coalescer.stream("key", open_stream),
+        return_exceptions=True
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_coalescer_run_shares_result():
+    coalescer = RequestCoalescer()
+    calls = 0
+
+    async def complete():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return "answer"
+
+    results = await asyncio.gather(coalescer.run("key", complete), coalescer.run("key", complete))
+
+    assert calls == 1
+    assert results == [("answer", True), ("answer", False)]
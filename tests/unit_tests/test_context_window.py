@@ -0,0 +1,98 @@
+import json
+import pytest
+from backend.history.context_window import ConversationHistoryWindow, SUMMARY_PREFIX
+from backend.tokens import count_tokens, get_context_window
+
+
+def word_counter(message):
+    return len(message.get("content", "").split())
+
+
+def conversation(turns):
+    messages = []
+    for index in range(turns):
+        messages.append({"role": "user", "content": f"question {index}"})
+        messages.append({
+            "role": "assistant",
+            "content": f"answer {index}",
+            "context": json.dumps({"citations": [{"content": f"doc {index}"}]})
+        })
+    messages.append({"role": "user", "content": "current question"})
+    return messages
+
+
+def test_context_window_lookup():
+    assert get_context_window("gpt-4o-2024-05-13") == 128000
+    assert get_context_window("gpt-4-32k") == 32768
+    assert get_context_window("unknown-model") == 8192
+
+
+def test_count_tokens_without_encoding():
+    assert count_tokens("", None) == 0
+    assert count_tokens("abcdefgh", "not-a-model") > 0
+
+
+@pytest.mark.asyncio
+async def test_trim_keeps_last_turns():
+    window = ConversationHistoryWindow(max_prompt_tokens=1000, max_turns=2, token_counter=word_counter)
+
+    trimmed = await window.trim(conversation(5))
+
+    assert [message["content"] for message in trimmed] == ["question 4", "answer 4", "current question"]
+
+
+@pytest.mark.asyncio
+async def test_trim_drops_older_citations():
+    window = ConversationHistoryWindow(max_prompt_tokens=1000, citation_turns=2, token_counter=word_counter)
+
+    trimmed = await window.trim(conversation(3))
+
+    with_context = [message["content"] for message in trimmed if "context" in message]
+    assert with_context == ["answer 2"]
+
+
+@pytest.mark.asyncio
+async def test_trim_enforces_token_budget():
+    window = ConversationHistoryWindow(max_prompt_tokens=6, token_counter=word_counter)
+
+    trimmed = await window.trim(conversation(5))
+
+    assert [message["content"] for message in trimmed] == ["question 4", "answer 4", "current question"]
+
+
+@pytest.mark.asyncio
+async def test_trim_always_keeps_current_turn():
+    window = ConversationHistoryWindow(max_prompt_tokens=1, token_counter=word_counter)
+
+    trimmed = await window.trim(conversation(2))
+
+    assert trimmed == [{"role": "user", "content": "current question"}]
+
+
+@pytest.mark.asyncio
+async def test_trim_summarizes_dropped_turns_incrementally():
+    calls = []
+
+    async def summarizer(previous_summary, messages):
+        calls.append((previous_summary, [message["content"] for message in messages]))
+        return f"summary of {len(calls)}"
+
+    window = ConversationHistoryWindow(
+        max_prompt_tokens=1000,
+        max_turns=2,
+        summarizer=summarizer,
+        token_counter=word_counter
+    )
+
+    trimmed = await window.trim(conversation(2))
+    assert trimmed[0] == {"role": "assistant", "content": SUMMARY_PREFIX + "summary of 1"}
+    assert calls == [(None, ["question 0", "answer 0"])]
+
+    # the same prefix is served from the cache
+    await window.trim(conversation(2))
+    assert len(calls) == 1
+
+    # one more dropped turn only summarizes the new turn
+    trimmed = await window.trim(conversation(3))
+    assert calls[-1] == ("summary of 1", ["question 1", "answer 1"])
+    assert trimmed[0]["content"] == SUMMARY_PREFIX + "summary of 2"
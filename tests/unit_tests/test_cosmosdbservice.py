@@ -0,0 +1,152 @@
+import pytest
+
+
+@pytest.fixture
+def cosmos_client(make_cosmos_client):
+    return make_cosmos_client(delete_concurrency=4)
+
+
+@pytest.mark.asyncio
+async def test_create_messages_keeps_order_and_patches_conversation_once(cosmos_client):
+    conversation = await cosmos_client.create_conversation("user-1", "Leave policy", conversation_id="conv-1")
+    assert conversation["id"] == "conv-1"
+
+    await cosmos_client.create_messages("conv-1", "user-1", [
+        ("tool-1", {"role": "tool", "content": "{}"}),
+        ("answer-1", {"role": "assistant", "content": "20 days"}),
+    ])
+
+    items = cosmos_client.container_client.items()
+    assert items["tool-1"]["createdAt"] < items["answer-1"]["createdAt"]
+    assert items["conv-1"]["updatedAt"] == items["answer-1"]["createdAt"]
+    operations = cosmos_client.container_client.operations
+    # the conversation and the two messages are written, then the conversation is patched once
+    assert operations["upsert_item"]["count"] == 3
+    assert operations["patch_item"]["count"] == 1
+    # nothing is read back
+    assert "read_item" not in operations
+
+
+@pytest.mark.asyncio
+async def test_create_message_reports_missing_conversation(cosmos_client):
+    result = await cosmos_client.create_message("msg-1", "missing", "user-1", {"role": "user", "content": "hi"})
+    assert result == "Conversation not found"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("partition_key_path", ["/id", "/userId"])
+async def test_lookups_are_point_reads_scoped_to_the_user(make_cosmos_client, partition_key_path):
+    client = make_cosmos_client(partition_key_path)
+    await client.create_conversation("user-1", "Leave policy", conversation_id="conv-1")
+    await client.create_message("msg-1", "conv-1", "user-1", {"role": "user", "content": "hi"})
+
+    assert (await client.get_conversation("user-1", "conv-1"))["title"] == "Leave policy"
+    assert await client.get_conversation("user-2", "conv-1") is None
+    assert await client.get_message("user-1", "conv-1") is None
+    assert (await client.get_message("user-1", "msg-1"))["content"] == "hi"
+    # each lookup is one point read in the item's partition, none falls back to a query
+    assert client.container_client.operations["read_item"]["count"] == 4
+    assert "query_items" not in client.container_client.operations
+
+    assert [message["id"] for message in await client.get_messages("user-1", "conv-1")] == ["msg-1"]
+
+
+@pytest.mark.asyncio
+async def test_patch_conversation_checks_owner_expected_fields_and_etag(cosmos_client):
+    await cosmos_client.create_conversation("user-1", "Provisional", conversation_id="conv-1")
+
+    assert await cosmos_client.patch_conversation("user-2", "conv-1", {"title": "Stolen"}) is None
+
+    renamed = await cosmos_client.patch_conversation("user-1", "conv-1", {"title": "Renamed"})
+    assert renamed["title"] == "Renamed"
+
+    # a generated title does not replace a title the user chose meanwhile
+    assert await cosmos_client.patch_conversation(
+        "user-1", "conv-1", {"title": "Generated"}, expected={"title": "Provisional"}
+    ) is None
+
+    assert await cosmos_client.patch_conversation("user-1", "conv-1", {"title": "Stale"}, etag='"old"') is None
+    updated = await cosmos_client.patch_conversation("user-1", "conv-1", {"title": "Fresh"}, etag=renamed["_etag"])
+    assert updated["title"] == "Fresh"
+
+
+@pytest.mark.asyncio
+async def test_delete_items_is_concurrent_and_bounded(cosmos_client):
+    await cosmos_client.create_conversation("user-1", "Leave policy", conversation_id="conv-1")
+    await cosmos_client.create_messages("conv-1", "user-1", [
+        (f"msg-{i}", {"role": "user", "content": "hi"}) for i in range(20)
+    ])
+    cosmos_client.container_client.fail("delete_item", "msg-3")
+    await cosmos_client.create_conversation("user-2", "Other", conversation_id="conv-2")
+
+    progress = []
+    conversation_ids, message_ids = await cosmos_client.get_history_item_ids("user-1")
+    assert conversation_ids == ["conv-1"]
+    assert len(message_ids) == 20
+
+    cosmos_client.container_client.reset_stats()
+    results = await cosmos_client.delete_items("user-1", message_ids + ["missing"], lambda *args: progress.append(args))
+
+    assert results.count(False) == 1
+    assert len(progress) == 21
+    assert cosmos_client.container_client.max_in_flight == 4
+    assert set(cosmos_client.container_client.items()) == {"conv-1", "conv-2", "msg-3"}
+
+
+async def list_all_pages(client, user_id, page_size):
+    pages = []
+    token = None
+    while True:
+        page, token = await client.get_conversation_page(user_id, page_size, continuation_token=token)
+        pages.append([conversation["id"] for conversation in page])
+        if not token:
+            return pages
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("partition_key_path", ["/id", "/userId"])
+async def test_conversation_pages_follow_continuation_tokens(make_cosmos_client, partition_key_path):
+    client = make_cosmos_client(partition_key_path)
+    for i in range(5):
+        await client.create_conversation("user-1", f"Conversation {i}", conversation_id=f"conv-{i}")
+        await client.patch_conversation("user-1", f"conv-{i}", {"updatedAt": f"2024-06-0{i + 1}"})
+    await client.create_conversation("user-2", "Other", conversation_id="other")
+    client.container_client.reset_stats()
+
+    page, token = await client.get_conversation_page("user-1", 2)
+    assert [conversation["id"] for conversation in page] == ["conv-4", "conv-3"]
+    assert set(page[0]) == {"id", "title", "createdAt", "updatedAt"}
+
+    page, token = await client.get_conversation_page("user-1", 2, continuation_token=token)
+    assert [conversation["id"] for conversation in page] == ["conv-2", "conv-1"]
+
+    page, token = await client.get_conversation_page("user-1", 2, continuation_token=token)
+    assert [conversation["id"] for conversation in page] == ["conv-0"]
+    assert token is None
+    # one request per page, whether the query is continued or restarted after the last row
+    assert client.container_client.operations["query_items"]["count"] == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("partition_key_path", ["/id", "/userId"])
+async def test_conversation_pages_keep_conversations_updated_at_the_same_time(make_cosmos_client, partition_key_path):
+    client = make_cosmos_client(partition_key_path)
+    updated_at = ["2024-06-01", "2024-06-02", "2024-06-02", "2024-06-02", "2024-06-02", "2024-06-03"]
+    for i, value in enumerate(updated_at):
+        await client.create_conversation("user-1", conversation_id=f"conv-{i}")
+        await client.patch_conversation("user-1", f"conv-{i}", {"updatedAt": value})
+
+    pages = await list_all_pages(client, "user-1", 2)
+    ids = [conversation_id for page in pages for conversation_id in page]
+    assert sorted(ids) == [f"conv-{i}" for i in range(6)]
+    assert ids[0] == "conv-5" and ids[-1] == "conv-0"
+    assert [len(page) for page in pages] == [2, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_conversation_page_rejects_malformed_keyset_token(make_cosmos_client):
+    client = make_cosmos_client("/id")
+
+    for token in ("not json", "[]", '{"updatedAt": 1, "ids": []}', '{"updatedAt": "x", "ids": [1]}'):
+        with pytest.raises(ValueError):
+            await client.get_conversation_page("user-1", 2, continuation_token=token)
@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import pytest
+from azure.cosmos import exceptions
+
+from tools.fake_cosmos import CosmosQuery, FakeCosmosContainer, fake_conversation_client
+
+
+@pytest.fixture(params=["/id", "/userId"])
+def container(request):
+    return FakeCosmosContainer(partition_key_path=request.param)
+
+
+@pytest.fixture
+def client(container):
+    return fake_conversation_client(container, enable_message_feedback=True)
+
+
+@pytest.mark.asyncio
+async def test_history_client_runs_against_the_fake(client):
+    assert await client.ensure() == (True, "CosmosDB client initialized successfully")
+
+    for i in range(5):
+        await client.create_conversation("user-1", title=f"c{i}", conversation_id=f"c{i}")
+    await client.create_conversation("user-2", conversation_id="other")
+    await client.create_messages("c1", "user-1", [
+        ("q1", {"role": "user", "content": "How do I Reset my password?"}),
+        ("a1", {"role": "assistant", "content": "Use the portal."}),
+    ])
+
+    pages = []
+    token = None
+    while True:
+        conversations, token = await client.get_conversation_page("user-1", 2, token)
+        pages.append([conversation["id"] for conversation in conversations])
+        if not token:
+            break
+    assert pages == [["c1", "c4"], ["c3", "c2"], ["c0"]]
+    assert [c["id"] for c in await client.get_conversations("user-1", 2, offset=2)] == ["c3", "c2"]
+
+    assert [message["id"] for message in await client.get_messages("user-1", "c1")] == ["q1", "a1"]
+    assert await client.get_message("user-2", "a1") is None
+    assert await client.patch_conversation("user-1", "c1", {"title": "x"}, expected={"title": "other"}) is None
+    assert (await client.patch_conversation("user-1", "c1", {"title": "Renamed"}))["title"] == "Renamed"
+
+    await client.update_message_feedback("user-1", "a1", "positive")
+    [feedback] = await client.get_feedback_messages("user-1")
+    assert feedback["id"] == "a1" and "userId" not in feedback
+    question = await client.get_previous_user_message("user-1", "c1", feedback["createdAt"])
+    assert question["id"] == "q1"
+    assert (await client.get_next_assistant_message("user-1", "c1", question["createdAt"]))["id"] == "a1"
+    assert await client.find_user_messages("reset MY", 3) == [{"id": "q1", "content": "How do I Reset my password?"}]
+    assert (await client.find_item("a1"))["userId"] == "user-1"
+
+    conversation_ids, message_ids = await client.get_history_item_ids("user-1")
+    assert await client.delete_items("user-1", conversation_ids + message_ids) == [True] * 7
+    assert await client.get_history_item_ids("user-1") == ([], [])
+    assert await client.get_conversation("user-2", "other") is not None
+
+
+@pytest.mark.asyncio
+async def test_request_charges_are_accounted_per_operation_and_label(container, client):
+    with container.charge_to("create"):
+        await client.create_conversation("user-1", conversation_id="c1")
+    with container.charge_to("read"):
+        await client.get_conversation("user-1", "c1")
+        await client.get_messages("user-1", "c1")
+
+    stats = container.stats()
+    assert stats["operations"]["upsert_item"]["count"] == 1
+    assert stats["operations"]["read_item"]["request_charge"] == 1.0
+    assert stats["labels"]["create"]["count"] == 1
+    assert stats["labels"]["read"]["count"] == 2
+    assert stats["request_charge"] == pytest.approx(
+        sum(entry["request_charge"] for entry in stats["labels"].values())
+    )
+    assert float(container.client_connection.last_response_headers["x-ms-request-charge"]) > 0
+
+    # queries that stay in the user's partition skip the fan-out charge
+    cross_partition = container.partition_key_path == "/id"
+    expected = container.charges.query_page + (container.charges.cross_partition_page if cross_partition else 0)
+    assert stats["operations"]["query_items"]["request_charge"] == pytest.approx(expected)
+
+
+async def query_charge(container, query, **kwargs):
+    container.reset_stats()
+    async for page in container.query_items(query=query, **kwargs).by_page():
+        async for _ in page:
+            pass
+    return container.stats()["operations"]["query_items"]["request_charge"]
+
+
+@pytest.mark.asyncio
+async def test_queries_are_charged_for_the_documents_they_examine():
+    container = FakeCosmosContainer(partition_key_path="/userId")
+    for i in range(1000):
+        await container.upsert_item({"id": f"c{i:04}", "userId": "user-1", "content": "hello" if i % 100 == 0 else "bye"})
+    await container.upsert_item({"id": "other", "userId": "user-2", "content": "hello"})
+
+    query = "SELECT * FROM c ORDER BY c.id OFFSET @offset LIMIT 10"
+    first = await query_charge(container, query, parameters=[{"name": "@offset", "value": 0}], partition_key="user-1")
+    deep = await query_charge(container, query, parameters=[{"name": "@offset", "value": 980}], partition_key="user-1")
+    # the skipped rows are read too, so a deep page costs more than the first
+    assert deep - first == pytest.approx(980 * container.charges.query_per_document)
+
+    # CONTAINS cannot use the index: every document is read for 11 matches
+    found = await query_charge(container, "SELECT c.id FROM c WHERE CONTAINS(c.content, 'hello')")
+    assert found > 1001 * container.charges.query_per_document
+
+
+@pytest.mark.asyncio
+async def test_cross_partition_queries_are_charged_per_physical_partition():
+    container = FakeCosmosContainer(partition_key_path="/id", physical_partitions=4)
+    await container.upsert_item({"id": "c1", "userId": "user-1"})
+
+    in_partition = await query_charge(container, "SELECT * FROM c WHERE c.id = 'c1'", partition_key="c1")
+    fan_out = await query_charge(container, "SELECT * FROM c WHERE c.id = 'c1'")
+    assert fan_out - in_partition == pytest.approx(4 * container.charges.cross_partition_page)
+
+
+@pytest.mark.asyncio
+async def test_cross_partition_order_by_cannot_be_continued():
+    container = FakeCosmosContainer(partition_key_path="/id", physical_partitions=4)
+    for i in range(5):
+        await container.upsert_item({"id": f"c{i}", "userId": "user-1"})
+
+    query = "SELECT * FROM c ORDER BY c.id"
+    pages = container.query_items(query=query, max_item_count=2).by_page()
+    ids = []
+    async for page in pages:
+        ids += [item["id"] async for item in page]
+        # like the SDK, every page comes but none can be resumed
+        assert pages.continuation_token is None
+    assert ids == ["c0", "c1", "c2", "c3", "c4"]
+
+    resumed = container.query_items(query=query, max_item_count=2).by_page('{"offset": 2}')
+    with pytest.raises(exceptions.CosmosHttpResponseError) as error:
+        await resumed.__anext__()
+    assert error.value.status_code == 400
+
+    # in one partition, or without ORDER BY, the query continues where it stopped
+    pages = container.query_items(query="SELECT * FROM c", max_item_count=2).by_page()
+    await pages.__anext__()
+    assert pages.continuation_token
+
+
+@pytest.mark.asyncio
+async def test_latency_is_injected_per_call():
+    container = FakeCosmosContainer(latency_ms=30, jitter_ms=5, seed=1)
+    client = fake_conversation_client(container)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client.get_conversation("user-1", f"c{i}") for i in range(10)])
+    elapsed = time.perf_counter() - started
+
+    # concurrent calls overlap like requests to a real account
+    assert 0.025 <= elapsed < 0.25
+
+
+def test_query_semantics():
+    items = [
+        {"id": "1", "n": 2, "tags": {"a": True}},
+        {"id": "2", "n": "2"},
+        {"id": "3"},
+        {"id": "4", "n": 1},
+    ]
+
+    def ids(query, **values):
+        return [item["id"] for item in CosmosQuery.parse(query).execute(items, values)]
+
+    # comparisons of undefined or mismatched types never match, even negated
+    assert ids("SELECT * FROM c WHERE c.n = 2") == ["1"]
+    assert ids("SELECT * FROM c WHERE NOT (c.n = 2)") == ["4"]
+    assert ids("SELECT * FROM c WHERE c.n >= @n OR c.tags.a = true", **{"@n": 1}) == ["1", "4"]
+    assert ids("SELECT * FROM c WHERE IS_DEFINED(c.n) ORDER BY c.n ASC") == ["4", "1", "2"]
+    assert ids("SELECT * FROM c ORDER BY c.id DESC OFFSET 1 LIMIT 2") == ["3", "2"]
+    assert ids("SELECT TOP @top * FROM c", **{"@top": 1}) == ["1"]
+    assert CosmosQuery.parse("SELECT c.id, c.n FROM c WHERE c.id = '3'").execute(items, {}) == [{"id": "3"}]
+    assert CosmosQuery.parse_predicate('FROM c WHERE c.id = "1" AND c.n > 1').matches(items[0], {})
@@ -0,0 +1,31 @@
+import json
+import pytest
+
+from app import create_app, encode_frontend_settings
+
+
+@pytest.mark.asyncio
+async def test_frontend_settings_conditional_request():
+    client = create_app().test_client()
+
+    response = await client.get("/frontend_settings")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag = response.headers["ETag"]
+    settings = json.loads(await response.get_data())
+    assert "ui" in settings
+
+    response = await client.get("/frontend_settings", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert await response.get_data() == b""
+    assert response.headers["ETag"] == etag
+
+    response = await client.get("/frontend_settings", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+
+def test_encode_frontend_settings_etag_tracks_content():
+    body, etag = encode_frontend_settings({"ui": {"title": "Contoso"}})
+    assert json.loads(body) == {"ui": {"title": "Contoso"}}
+    assert encode_frontend_settings({"ui": {"title": "Contoso"}})[1] == etag
+    assert encode_frontend_settings({"ui": {"title": "Fabrikam"}})[1] != etag
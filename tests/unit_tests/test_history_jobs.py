@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+
+from backend.history.jobs import HistoryJobRegistry, SQLiteHistoryJobStore
+
+
+@pytest.mark.asyncio
+async def test_job_reports_progress_and_completes():
+    registry = HistoryJobRegistry()
+    release = asyncio.Event()
+
+    async def operation(job):
+        job.total = 3
+        job.record("a", True)
+        await release.wait()
+        job.record("b", True)
+        job.record("c", False)
+
+    job = await registry.start("delete_all", "user-1", operation)
+    await asyncio.sleep(0)
+    assert (await registry.get(job.id, "user-1")).to_dict()["deleted"] == 1
+    assert await registry.get(job.id, "user-2") is None
+    # one running job per user and kind
+    assert await registry.start("delete_all", "user-1", operation) is job
+
+    release.set()
+    await job.task
+    result = (await registry.get(job.id, "user-1")).to_dict()
+    assert result["status"] == "completed_with_errors"
+    assert (result["total"], result["deleted"], result["failed"]) == (3, 2, 1)
+    assert registry.stats() == {"running": 0}
+    assert (await registry.start("delete_all", "user-1", operation)).id != job.id
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_keeps_error():
+    registry = HistoryJobRegistry()
+
+    async def operation(job):
+        raise RuntimeError("cosmos unavailable")
+
+    job = await registry.start("delete_all", "user-1", operation)
+    await job.task
+    assert job.status == "failed"
+    assert job.error == "cosmos unavailable"
+
+
+@pytest.mark.asyncio
+async def test_job_is_polled_from_another_worker(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker_1 = HistoryJobRegistry(SQLiteHistoryJobStore(path), progress_interval_seconds=0.01)
+    worker_2 = HistoryJobRegistry(SQLiteHistoryJobStore(path))
+    release = asyncio.Event()
+
+    async def operation(job):
+        job.total = 2
+        job.record("a", True)
+        await release.wait()
+        job.record("b", True)
+
+    job = await worker_1.start("delete_all", "user-1", operation)
+    await asyncio.sleep(0.05)
+    polled = await worker_2.get(job.id, "user-1")
+    assert (polled.status, polled.deleted) == ("running", 1)
+    assert await worker_2.get(job.id, "user-2") is None
+    # the running job is shared, so another worker does not start a second one
+    assert (await worker_2.start("delete_all", "user-1", operation)).id == job.id
+
+    release.set()
+    await job.task
+    polled = await worker_2.get(job.id, "user-1")
+    assert (polled.status, polled.deleted, polled.total) == ("completed", 2, 2)
+
+
+@pytest.mark.asyncio
+async def test_job_of_a_stopped_worker_is_reported_as_interrupted(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker_1 = HistoryJobRegistry(SQLiteHistoryJobStore(path))
+
+    async def operation(job):
+        await asyncio.sleep(10)
+
+    job = await worker_1.start("delete_all", "user-1", operation)
+    await asyncio.sleep(0)
+
+    # a worker that was killed never saves the job again
+    later = HistoryJobRegistry(SQLiteHistoryJobStore(path), stale_seconds=0)
+    assert (await later.get(job.id, "user-1")).status == "interrupted"
+
+    # a worker that shuts down records it
+    await worker_1.close()
+    polled = await HistoryJobRegistry(SQLiteHistoryJobStore(path)).get(job.id, "user-1")
+    assert polled.status == "interrupted"
+    assert polled.finished_at is not None
@@ -0,0 +1,130 @@
+import pytest
+
+from backend.history.list_cache import (
+    ConversationListCache,
+    InMemoryConversationListStore,
+    ListCachingConversationClient,
+    SQLiteConversationListStore
+)
+
+
+def conversation(conversation_id, updated_at, title=None):
+    return {
+        "id": conversation_id,
+        "title": title or conversation_id,
+        "createdAt": updated_at,
+        "updatedAt": updated_at,
+        "userId": "user-1",
+        "type": "conversation",
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def list_cache(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteConversationListStore(str(tmp_path / "lists.sqlite3"))
+    else:
+        store = InMemoryConversationListStore()
+    return ConversationListCache(store, page_size=3)
+
+
+def ids(conversations):
+    return [item["id"] for item in conversations]
+
+
+@pytest.mark.asyncio
+async def test_list_is_cached_and_stale_reads_are_not_stored(list_cache):
+    conversations, _, version = await list_cache.get_page("user-1")
+    assert conversations is None
+
+    # a write lands while the list is read from the database
+    await list_cache.invalidate("user-1")
+    await list_cache.set_page("user-1", [conversation("a", "1")], None, version)
+    assert (await list_cache.get_page("user-1"))[0] is None
+
+    _, _, version = await list_cache.get_page("user-1")
+    await list_cache.set_page("user-1", [conversation("a", "1")], None, version)
+    conversations, token, _ = await list_cache.get_page("user-1")
+    assert conversations == [{"id": "a", "title": "a", "createdAt": "1", "updatedAt": "1"}]
+    assert token is None
+    assert list_cache.stats() == {"hits": 1, "misses": 3}
+
+
+@pytest.mark.asyncio
+async def test_writes_update_the_cached_page_in_place(list_cache):
+    _, _, version = await list_cache.get_page("user-1")
+    await list_cache.set_page("user-1", [conversation("b", "2"), conversation("a", "1")], None, version)
+
+    await list_cache.add("user-1", conversation("c", "3"))
+    await list_cache.update("user-1", "a", {"updatedAt": "4", "title": "Renamed"})
+    conversations, _, _ = await list_cache.get_page("user-1")
+    assert ids(conversations) == ["a", "c", "b"]
+    assert conversations[0]["title"] == "Renamed"
+
+    await list_cache.remove("user-1", "c")
+    assert ids((await list_cache.get_page("user-1"))[0]) == ["a", "b"]
+
+    # past the page size the page would disagree with the next page's token
+    await list_cache.add("user-1", conversation("d", "5"))
+    await list_cache.add("user-1", conversation("e", "6"))
+    assert (await list_cache.get_page("user-1"))[0] is None
+
+
+@pytest.mark.asyncio
+async def test_changes_involving_later_pages_drop_the_page(list_cache):
+    _, _, version = await list_cache.get_page("user-1")
+    await list_cache.set_page("user-1", [conversation("c", "3"), conversation("b", "2"), conversation("a", "1")], "page-2", version)
+
+    # renaming a conversation on a later page does not affect the first page
+    await list_cache.update("user-1", "z", {"title": "Renamed"})
+    assert ids((await list_cache.get_page("user-1"))[0]) == ["c", "b", "a"]
+
+    # a conversation from a later page moves to the top
+    await list_cache.update("user-1", "z", {"updatedAt": "9"})
+    assert (await list_cache.get_page("user-1"))[0] is None
+
+    _, _, version = await list_cache.get_page("user-1")
+    await list_cache.set_page("user-1", [conversation("c", "3"), conversation("b", "2"), conversation("a", "1")], "page-2", version)
+    await list_cache.remove("user-1", "b")
+    assert (await list_cache.get_page("user-1"))[0] is None
+
+
+class FakeConversationClient():
+    def __init__(self):
+        self.conversations = [conversation("a", "1")]
+        self.page_reads = 0
+        self.container_client = "container"
+
+    async def get_conversation_page(self, user_id, page_size, continuation_token=None, sort_order='DESC'):
+        self.page_reads += 1
+        return sorted(self.conversations, key=lambda item: item["updatedAt"], reverse=True)[:page_size], None
+
+    async def create_conversation(self, user_id, title='', conversation_id=None):
+        created = conversation(conversation_id, "2", title)
+        self.conversations.append(created)
+        return created
+
+    async def create_messages(self, conversation_id, user_id, input_messages):
+        for item in self.conversations:
+            if item["id"] == conversation_id:
+                item["updatedAt"] = "3"
+        return [{"id": message_id, "createdAt": "3"} for message_id, _ in input_messages]
+
+
+@pytest.mark.asyncio
+async def test_caching_client_serves_lists_and_writes_through():
+    client = ListCachingConversationClient(
+        FakeConversationClient(), ConversationListCache(InMemoryConversationListStore(), page_size=3)
+    )
+
+    await client.get_conversation_page("user-1", 3)
+    await client.create_conversation("user-1", "New chat", conversation_id="b")
+    await client.create_message("msg-1", "a", "user-1", {"role": "user", "content": "hi"})
+    conversations, _ = await client.get_conversation_page("user-1", 3)
+
+    assert ids(conversations) == ["a", "b"]
+    assert client.client.page_reads == 1
+    # other pages and attributes go to the wrapped client
+    await client.get_conversation_page("user-1", 3, continuation_token="page-2")
+    assert client.client.page_reads == 2
+    assert client.container_client == "container"
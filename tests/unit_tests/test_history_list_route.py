@@ -0,0 +1,47 @@
+import base64
+
+import pytest
+
+import app as app_module
+from app import create_app
+from backend.history.sqliteservice import SQLiteConversationStore
+from backend.settings import _ChatHistorySettings
+
+
+def encode(token: str) -> str:
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii")
+
+
+@pytest.fixture
+def history_app(monkeypatch):
+    monkeypatch.setattr(app_module.app_settings, "chat_history", _ChatHistorySettings(CHAT_HISTORY_BACKEND="sqlite"))
+
+    def make(store):
+        app = create_app()
+        app.cosmos_conversation_client = store
+        app_module.cosmos_db_ready.set()
+        return app
+
+    return make
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["sqlite", "cosmos-id", "cosmos-userId"])
+async def test_list_rejects_malformed_continuation_tokens(history_app, tmp_path, make_cosmos_client, backend):
+    if backend == "sqlite":
+        store = SQLiteConversationStore(str(tmp_path / "history.sqlite3"))
+    else:
+        store = make_cosmos_client("/" + backend.partition("-")[2])
+    await store.create_conversation("00000000-0000-0000-0000-000000000000", "First")
+    client = history_app(store).test_client()
+
+    response = await client.get("/history/list")
+    assert response.status_code == 200
+
+    for token in ("not json", '["only one"]', '{"updatedAt": 1}', "[1, 2]"):
+        response = await client.get(f"/history/list?continuation_token={encode(token)}")
+        assert response.status_code == 400, token
+
+    not_utf8 = base64.urlsafe_b64encode(b"\xff\xfe").decode("ascii")
+    response = await client.get(f"/history/list?continuation_token={not_utf8}")
+    assert response.status_code == 400
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+
+from backend.history.pipeline import HistoryWriteStats, PipelinedWrite
+
+
+@pytest.mark.asyncio
+async def test_write_overlaps_with_other_work():
+    stats = HistoryWriteStats()
+
+    async def write():
+        await asyncio.sleep(0.05)
+        return "saved"
+
+    pipelined = PipelinedWrite(write(), stats=stats)
+    # the completion takes longer than the write
+    await asyncio.sleep(0.1)
+
+    assert await pipelined.wait() == "saved"
+    result = stats.stats()
+    assert result["writes"] == 1
+    assert result["failures"] == 0
+    assert result["avg_write_ms"] >= 50
+    assert result["avg_wait_ms"] < 10
+    assert result["hidden_ratio"] > 0.8
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_raised_by_wait():
+    stats = HistoryWriteStats()
+
+    async def write():
+        raise RuntimeError("cosmos unavailable")
+
+    pipelined = PipelinedWrite(write(), stats=stats)
+    with pytest.raises(RuntimeError):
+        await pipelined.wait()
+
+    assert stats.stats()["failures"] == 1
@@ -0,0 +1,127 @@
+import pytest
+from backend.cache.response_cache import (
+    FileResponseCacheStore,
+    InMemoryResponseCacheStore,
+    ResponseCache,
+    make_cache_key,
+    record_stream,
+    replay_stream
+)
+
+
+MODEL_ARGS = {
+    "messages": [
+        {"role": "system", "content": "You are helpful."},
+        {"role": "user", "content": "What is the  leave policy?"}
+    ],
+    "temperature": 0,
+    "stream": True,
+    "user": '{"conversation_id": "1"}',
+    "extra_body": {"data_sources": [{"type": "azure_search", "parameters": {"index_name": "handbook"}}]}
+}
+
+
+def with_changes(**changes):
+    return {**MODEL_ARGS, **changes}
+
+
+def test_cache_key_normalizes_request():
+    key = make_cache_key(MODEL_ARGS)
+
+    same_question = with_changes(
+        messages=[
+            {"role": "system", "content": "You are helpful."},
+            {"role": "user", "content": " What is the leave policy? "}
+        ],
+        user='{"conversation_id": "2"}'
+    )
+    assert make_cache_key(same_question) == key
+    assert make_cache_key(with_changes(temperature=1)) != key
+    assert make_cache_key(with_changes(extra_body={"data_sources": []})) != key
+    assert make_cache_key(MODEL_ARGS, scope="user-1") != key
+
+
+def test_cache_scope():
+    per_user = ResponseCache(InMemoryResponseCacheStore(), per_user=True)
+    shared = ResponseCache(InMemoryResponseCacheStore(), per_user=False)
+
+    assert per_user.key_for(MODEL_ARGS, "a") != per_user.key_for(MODEL_ARGS, "b")
+    assert shared.key_for(MODEL_ARGS, "a") == shared.key_for(MODEL_ARGS, "b")
+    assert shared.key_for(MODEL_ARGS, stream=True) != shared.key_for(MODEL_ARGS, stream=False)
+
+
+@pytest.mark.asyncio
+async def test_memory_store_lru():
+    store = InMemoryResponseCacheStore(max_size=2)
+    await store.set("a", 1)
+    await store.set("b", 2)
+    await store.get("a")
+    await store.set("c", 3)
+
+    assert await store.get("a") == 1
+    assert await store.get("b") is None
+
+
+@pytest.mark.asyncio
+async def test_file_store_round_trip_and_expiry(tmp_path):
+    store = FileResponseCacheStore(str(tmp_path), max_size=2)
+    await store.set("a", [{"id": "x"}])
+    assert await store.get("a") == [{"id": "x"}]
+
+    expired = FileResponseCacheStore(str(tmp_path), ttl_seconds=0)
+    await expired.set("b", {"id": "y"})
+    assert await expired.get("b") is None
+    assert await store.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_file_store_evicts_oldest(tmp_path):
+    store = FileResponseCacheStore(str(tmp_path), max_size=2)
+    for key in ("a", "b", "c"):
+        await store.set(key, key)
+
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay_stream():
+    cache = ResponseCache(InMemoryResponseCacheStore())
+
+    async def stream():
+        yield {"id": "chatcmpl-1", "choices": [{"messages": [{"role": "assistant", "content": "Hel"}]}], "history_metadata": {"conversation_id": "c1"}, "apim-request-id": "r1"}
+        yield {}
+        yield {"id": "chatcmpl-1", "choices": [{"messages": [{"role": "assistant", "content": "lo"}]}], "history_metadata": {"conversation_id": "c1"}, "apim-request-id": "r1"}
+
+    async def on_complete(frames):
+        await cache.set("key", frames)
+
+    passed_through = [frame async for frame in record_stream(stream(), on_complete)]
+    assert len(passed_through) == 3
+
+    frames = await cache.get("key")
+    assert len(frames) == 2
+    assert all("history_metadata" not in frame for frame in frames)
+
+    replayed = [frame async for frame in replay_stream(frames, {"conversation_id": "c2"})]
+    assert [frame["choices"][0]["messages"][0]["content"] for frame in replayed] == ["Hel", "lo"]
+    assert all(frame["history_metadata"] == {"conversation_id": "c2"} for frame in replayed)
+    assert replayed[0]["id"] == replayed[1]["id"] != "chatcmpl-1"
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_stream_is_not_cached():
+    cache = ResponseCache(InMemoryResponseCacheStore())
+
+    async def stream():
+        yield {"id": "chatcmpl-1"}
+        raise RuntimeError("stream broke")
+
+    async def on_complete(frames):
+        await cache.set("key", frames)
+
+    with pytest.raises(RuntimeError):
+        async for _ in record_stream(stream(), on_complete):
+            pass
+
+    assert await cache.get("key") is None
@@ -0,0 +1,161 @@
+import os
+import numpy as np
+import pytest
+from backend.cache.semantic_cache import (
+    HashingEmbedder,
+    IndexVersionFile,
+    SemanticResponseCache,
+    VectorIndex
+)
+
+
+def model_args(question, history=None, data_sources=None):
+    messages = [{"role": "system", "content": "You are helpful."}]
+    messages.extend(history or [])
+    messages.append({"role": "user", "content": question})
+    return {
+        "messages": messages,
+        "temperature": 0,
+        "extra_body": {"data_sources": data_sources or [{"type": "azure_search"}]}
+    }
+
+
+class WordEmbedder():
+    """Maps each question to a fixed vector so similarities are exact."""
+
+    VECTORS = {
+        "how many vacation days do i get": [1.0, 0.0, 0.0],
+        "how many vacation days do i have": [0.99, 0.1, 0.0],
+        "who is my manager": [0.0, 1.0, 0.0],
+    }
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, text):
+        self.calls += 1
+        return np.array(self.VECTORS[text.lower().rstrip("?")])
+
+
+def test_vector_index_search_and_overwrite():
+    index = VectorIndex(max_size=2)
+    index.add("p", [1.0, 0.0], "a", ttl_seconds=60)
+    index.add("p", [0.0, 1.0], "b", ttl_seconds=60)
+
+    similarity, value = index.search("p", [0.9, 0.1])
+    assert value == "a"
+    assert similarity == pytest.approx(0.9 / np.linalg.norm([0.9, 0.1]))
+    assert index.search("other", [1.0, 0.0]) == (None, None)
+
+    index.add("p", [0.7, 0.7], "c", ttl_seconds=60)
+    assert len(index) == 2
+    assert index.search("p", [1.0, 0.0])[1] == "c"
+
+
+def test_vector_index_skips_expired_entries():
+    index = VectorIndex()
+    index.add("p", [1.0, 0.0], "a", ttl_seconds=0)
+
+    assert index.search("p", [1.0, 0.0]) == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_hashing_embedder_is_deterministic():
+    embedder = HashingEmbedder(dimensions=64)
+
+    first = await embedder("What is the leave policy?")
+    second = await embedder("what is the LEAVE policy")
+
+    assert np.array_equal(first, second)
+    assert first.shape == (64,)
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_serves_similar_question():
+    embedder = WordEmbedder()
+    cache = SemanticResponseCache(embedder, similarity_threshold=0.95)
+
+    assert await cache.get(model_args("How many vacation days do I get?"), "u1") is None
+    await cache.set(model_args("How many vacation days do I get?"), ["frame"], "u1")
+
+    assert await cache.get(model_args("How many vacation days do I have?"), "u1") == ["frame"]
+    assert await cache.get(model_args("Who is my manager?"), "u1") is None
+    # the embedding from the miss is reused when the answer is stored
+    assert embedder.calls == 3
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_is_partitioned_by_context():
+    cache = SemanticResponseCache(WordEmbedder(), similarity_threshold=0.95)
+    await cache.set(model_args("How many vacation days do I get?"), ["frame"], "u1")
+
+    assert await cache.get(model_args("How many vacation days do I get?"), "u2") is None
+    assert await cache.get(model_args("How many vacation days do I get?"), "u1", stream=False) is None
+    assert await cache.get(
+        model_args("How many vacation days do I get?", data_sources=[{"type": "elasticsearch"}]), "u1"
+    ) is None
+    assert await cache.get(
+        model_args("How many vacation days do I get?", history=[
+            {"role": "user", "content": "Who is my manager?"},
+            {"role": "assistant", "content": "Alex."}
+        ]),
+        "u1"
+    ) is None
+
+    shared = SemanticResponseCache(WordEmbedder(), per_user=False)
+    await shared.set(model_args("How many vacation days do I get?"), ["frame"], "u1")
+    assert await shared.get(model_args("How many vacation days do I get?"), "u2") == ["frame"]
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_invalidates_on_fingerprint_change():
+    cache = SemanticResponseCache(WordEmbedder(), fingerprint="v1")
+    await cache.set(model_args("How many vacation days do I get?"), ["frame"])
+
+    assert cache.update_fingerprint("v1") is False
+    assert await cache.get(model_args("How many vacation days do I get?")) == ["frame"]
+
+    assert cache.update_fingerprint("v2") is True
+    assert await cache.get(model_args("How many vacation days do I get?")) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_index_version_file_is_shared(tmp_path):
+    path = str(tmp_path / "versions" / "index_version")
+    writer = IndexVersionFile(path)
+    reader = IndexVersionFile(path, check_interval_seconds=0)
+    assert reader.read() is None
+
+    first = writer.write("v1")
+    assert reader.read() == first
+    assert first["index_version"] == "v1"
+
+    writer.write("v2")
+    os.utime(path, ns=(0, 123456789))
+    assert reader.read()["index_version"] == "v2"
+
+    # invalidating without a version keeps the label and starts a new generation
+    second = reader.write()
+    assert second["index_version"] == "v2"
+    assert second["generation"] != first["generation"]
+
+
+def test_index_version_file_checks_at_most_once_per_interval(tmp_path):
+    path = str(tmp_path / "index_version")
+    reader = IndexVersionFile(path, check_interval_seconds=60)
+    assert reader.read() is None
+
+    IndexVersionFile(path).write("v1")
+    assert reader.read() is None
+
+    reader.check_interval_seconds = 0
+    assert reader.read()["index_version"] == "v1"
+
+
+def test_index_version_file_accepts_a_bare_label(tmp_path):
+    path = tmp_path / "index_version"
+    path.write_text("2024-06-01\n", encoding="utf-8")
+
+    assert IndexVersionFile(str(path)).read() == {"index_version": "2024-06-01", "generation": None}
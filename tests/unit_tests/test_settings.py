@@ -1,6 +1,7 @@
 import os
 import pytest
 from importlib import import_module, reload
+from pydantic import ValidationError
 
 
 @pytest.fixture(scope="function")
@@ -36,6 +37,18 @@ def test_dotenv_no_datasource_2(app_settings):
     assert app_settings.azure_openai is not None
 
     
+def test_dotenv_with_azure_openai_deployments(app_settings):
+    deployments = app_settings.azure_openai.deployments
+    assert len(deployments) == 2
+    assert deployments[0].endpoint == "https://east.openai.azure.com/"
+    assert deployments[0].weight == 1.0
+    assert deployments[0].priority == 0
+    assert deployments[1].name == "west"
+    assert deployments[1].key is None
+    assert deployments[1].weight == 2.0
+    assert deployments[1].priority == 1
+
+
 def test_dotenv_with_azure_search_success(app_settings):
     # Validate model object
     assert app_settings.search is not None
@@ -52,6 +65,29 @@ def test_dotenv_with_azure_search_success(app_settings):
     print(payload)
 
 
+def test_dotenv_with_azure_search_permitted_groups(app_settings):
+    assert app_settings.datasource.permitted_groups_column == "group_ids"
+    user_groups_client = app_settings.datasource.get_user_groups_client()
+    assert user_groups_client.cache.ttl_seconds == 60
+    assert user_groups_client.cache.max_size == 50
+    assert app_settings.datasource.get_user_groups_client() is user_groups_client
+    assert "permitted_groups_cache_ttl" not in app_settings.datasource.construct_payload_configuration()["parameters"]
+
+    # Each request gets its own payload; the security filter of one request
+    # must not leak into the static parameters or into another request
+    payload_1 = app_settings.datasource.construct_payload_configuration(filter="filter-1")
+    payload_2 = app_settings.datasource.construct_payload_configuration(filter="filter-2")
+    payload_3 = app_settings.datasource.construct_payload_configuration()
+    assert payload_1["parameters"]["filter"] == "filter-1"
+    assert payload_2["parameters"]["filter"] == "filter-2"
+    assert "filter" not in payload_3["parameters"]
+    assert payload_1["parameters"] is not payload_2["parameters"]
+    assert payload_1["parameters"]["embedding_dependency"] == {
+        "type": "deployment_name",
+        "deployment_name": "embedding_model"
+    }
+
+
 def test_dotenv_with_elasticsearch_success(app_settings):
     # Validate model object
     assert app_settings.search is not None
@@ -70,3 +106,71 @@ def test_dotenv_with_elasticsearch_success(app_settings):
     
     
 
+
+
+def test_admission_max_queue_size_must_be_positive():
+    from backend.settings import _AdmissionSettings
+
+    with pytest.raises(ValidationError):
+        _AdmissionSettings(max_queue_size=0)
+
+    assert _AdmissionSettings(max_queue_size=1).max_queue_size == 1
+
+
+def test_admission_max_wait_seconds_must_be_positive():
+    from backend.settings import _AdmissionSettings
+
+    with pytest.raises(ValidationError):
+        _AdmissionSettings(max_wait_seconds=0)
+
+
+def test_keepalive_expiry_must_be_positive():
+    from backend.settings import _AzureOpenAISettings
+
+    with pytest.raises(ValidationError):
+        _AzureOpenAISettings(model="my_model", endpoint="https://example.openai.azure.com", keepalive_expiry=0)
+
+
+def test_deployment_cooldowns_must_not_be_negative():
+    from backend.settings import _AzureOpenAISettings
+
+    for name in ("deployment_circuit_open_seconds", "deployment_default_cooldown_seconds"):
+        with pytest.raises(ValidationError):
+            _AzureOpenAISettings(model="my_model", endpoint="https://example.openai.azure.com", **{name: -1})
+
+
+def test_tool_timeout_must_be_positive():
+    from backend.settings import _AzureOpenAISettings
+
+    for timeout in (0, -1):
+        with pytest.raises(ValidationError):
+            _AzureOpenAISettings(model="my_model", endpoint="https://example.openai.azure.com", function_call_azure_functions_tool_timeout=timeout)
+
+
+def test_response_cache_ttl_must_be_positive():
+    from backend.settings import _ResponseCacheSettings
+
+    with pytest.raises(ValidationError):
+        _ResponseCacheSettings(ttl_seconds=0)
+
+
+def test_semantic_cache_ttl_must_be_positive():
+    from backend.settings import _SemanticCacheSettings
+
+    with pytest.raises(ValidationError):
+        _SemanticCacheSettings(ttl_seconds=-1)
+
+
+def test_sse_replay_ttl_must_be_positive():
+    from backend.settings import _StreamingSettings
+
+    with pytest.raises(ValidationError):
+        _StreamingSettings(sse_replay_ttl_seconds=0)
+
+
+def test_history_list_cache_ttl_must_be_positive():
+    from backend.settings import _HistoryListCacheSettings
+
+    for ttl_seconds in (0, -1):
+        with pytest.raises(ValidationError):
+            _HistoryListCacheSettings(ttl_seconds=ttl_seconds)
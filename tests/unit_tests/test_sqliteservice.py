@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+from backend.history.sqliteservice import SQLiteConversationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteConversationStore(str(tmp_path / "history.sqlite3"), enable_message_feedback=True)
+
+
+@pytest.mark.asyncio
+async def test_database_uses_wal_and_indexes(store):
+    success, _ = await store.ensure()
+    assert success
+
+    with sqlite3.connect(store.path) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        indexes = {row[1] for row in connection.execute("PRAGMA index_list(items)")}
+    assert {"items_user_updated", "items_conversation_created"} <= indexes
+
+
+@pytest.mark.asyncio
+async def test_messages_are_saved_in_order_and_scoped_to_the_user(store):
+    conversation = await store.create_conversation("user-1", title="first", conversation_id="c1")
+
+    messages = await store.create_messages("c1", "user-1", [
+        ("m1", {"role": "user", "content": "Question"}),
+        ("m2", {"role": "assistant", "content": "Answer"}),
+    ])
+    assert [message["id"] for message in messages] == ["m1", "m2"]
+    assert await store.create_message("m3", "c1", "user-2", {"role": "user", "content": "x"}) == "Conversation not found"
+
+    assert [message["id"] for message in await store.get_messages("user-1", "c1")] == ["m1", "m2"]
+    assert await store.get_messages("user-2", "c1") == []
+    assert (await store.get_conversation("user-1", "c1"))["updatedAt"] == messages[-1]["createdAt"]
+    assert (await store.get_conversation("user-1", "c1"))["updatedAt"] > conversation["updatedAt"]
+    assert await store.get_conversation("user-2", "c1") is None
+    assert await store.get_message("user-1", "c1") is None
+    assert (await store.get_message("user-1", "m2"))["feedback"] == ""
+
+
+@pytest.mark.asyncio
+async def test_patch_conversation_checks_owner_expected_fields_and_etag(store):
+    conversation = await store.create_conversation("user-1", title="Provisional", conversation_id="c1")
+
+    assert await store.patch_conversation("user-2", "c1", {"title": "x"}) is None
+    assert await store.patch_conversation("user-1", "c1", {"title": "x"}, expected={"title": "Other"}) is None
+
+    renamed = await store.patch_conversation("user-1", "c1", {"title": "Renamed"}, etag=conversation["_etag"])
+    assert renamed["title"] == "Renamed"
+    assert renamed["_etag"] != conversation["_etag"]
+    assert await store.patch_conversation("user-1", "c1", {"title": "Late"}, etag=conversation["_etag"]) is None
+
+
+@pytest.mark.asyncio
+async def test_conversation_pages_follow_continuation_tokens(store):
+    for i in range(5):
+        await store.upsert_conversation({
+            "id": f"c{i}",
+            "type": "conversation",
+            "userId": "user-1",
+            "title": f"c{i}",
+            "createdAt": f"2024-01-0{i + 1}T00:00:00",
+            # two conversations with the same updatedAt
+            "updatedAt": f"2024-01-0{min(i, 3) + 1}T00:00:00",
+        })
+    await store.create_conversation("user-2", conversation_id="other")
+
+    pages = []
+    token = None
+    while True:
+        conversations, token = await store.get_conversation_page("user-1", 2, token)
+        pages.append([conversation["id"] for conversation in conversations])
+        if not token:
+            break
+
+    assert pages == [["c4", "c3"], ["c2", "c1"], ["c0"]]
+    assert set((await store.get_conversation_page("user-1", 2))[0][0]) == {"id", "title", "createdAt", "updatedAt"}
+    assert [c["id"] for c in await store.get_conversations("user-1", 2, offset=2)] == ["c2", "c1"]
+    assert len(await store.get_conversations("user-1", None)) == 5
+
+
+@pytest.mark.asyncio
+async def test_deletes_only_touch_the_users_items(store):
+    await store.create_conversation("user-1", conversation_id="c1")
+    await store.create_messages("c1", "user-1", [("m1", {"role": "user", "content": "q"})])
+    await store.create_conversation("user-2", conversation_id="c2")
+
+    assert await store.get_history_item_ids("user-1") == (["c1"], ["m1"])
+
+    deleted = []
+    assert await store.delete_messages("c1", "user-1", on_deleted=lambda item_id, ok: deleted.append(item_id)) == [True]
+    assert deleted == ["m1"]
+    assert await store.delete_items("user-1", ["c1", "c2", "missing"]) == [True, True, True]
+
+    assert await store.get_history_item_ids("user-1") == ([], [])
+    assert await store.get_conversation("user-2", "c2") is not None
+
+
+@pytest.mark.asyncio
+async def test_feedback_and_answer_lookups(store):
+    await store.create_conversation("user-1", conversation_id="c1")
+    await store.create_messages("c1", "user-1", [
+        ("q1", {"role": "user", "content": "How do I reset my PASSWORD?"}),
+        ("a1", {"role": "assistant", "content": "Use the portal."}),
+    ])
+
+    assert await store.update_message_feedback("user-2", "a1", "positive") is False
+    await store.update_message_feedback("user-1", "a1", "positive")
+
+    [feedback] = await store.get_feedback_messages("user-1")
+    assert (feedback["id"], feedback["feedback"]) == ("a1", "positive")
+
+    question = await store.get_previous_user_message("user-1", "c1", feedback["createdAt"])
+    assert question["id"] == "q1"
+    answer = await store.get_next_assistant_message("user-1", "c1", question["createdAt"])
+    assert answer["id"] == "a1"
+
+    assert (await store.find_item("a1"))["userId"] == "user-1"
+    assert await store.find_item("missing") is None
+    assert await store.find_user_messages("reset my password", 3) == [
+        {"id": "q1", "content": "How do I reset my PASSWORD?"}
+    ]
+    assert await store.find_user_messages("portal", 3) == []
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import pytest
+from backend.streaming import (
+    SSEStreamRegistry,
+    coalesce_stream,
+    format_as_sse,
+    format_sse_event,
+    hold_last_frame,
+    parse_last_event_id,
+    send_envelope_once,
+    stream_after
+)
+
+
+def delta(content, **envelope):
+    return {
+        "id": "chatcmpl-1",
+        "model": "gpt-4o",
+        "history_metadata": {},
+        **envelope,
+        "choices": [{"messages": [{"role": "assistant", "content": content}]}],
+    }
+
+
+CITATIONS = {
+    "id": "chatcmpl-1",
+    "model": "gpt-4o",
+    "history_metadata": {},
+    "choices": [{"messages": [{"role": "tool", "content": "{\"citations\": []}"}]}],
+}
+
+
+async def frames(items, delay=0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+def contents(result):
+    return [frame["choices"][0]["messages"][0]["content"] for frame in result]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_merges_deltas_up_to_max_chars():
+    result = await collect(coalesce_stream(
+        frames([CITATIONS, {}, delta("Hel"), delta("lo "), delta("wor"), delta("ld")]),
+        max_delay_seconds=10,
+        max_chars=6
+    ))
+
+    assert result[0] == CITATIONS
+    assert contents(result[1:]) == ["Hello ", "world"]
+    assert result[1]["id"] == "chatcmpl-1"
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_after_max_delay():
+    result = await collect(coalesce_stream(
+        frames([delta("a"), delta("b"), delta("c")], delay=0.05),
+        max_delay_seconds=0.01,
+        max_chars=1000
+    ))
+
+    assert contents(result) == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_keeps_frames_with_other_envelopes_apart():
+    result = await collect(coalesce_stream(
+        frames([delta("a"), delta("b", id="chatcmpl-2"), CITATIONS, delta("c")]),
+        max_delay_seconds=10
+    ))
+
+    assert [frame["id"] for frame in result] == ["chatcmpl-1", "chatcmpl-2", "chatcmpl-1", "chatcmpl-1"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_pending_content_before_errors():
+    async def failing():
+        yield delta("partial")
+        raise RuntimeError("upstream failed")
+
+    received = []
+    with pytest.raises(RuntimeError):
+        async for frame in coalesce_stream(failing(), max_delay_seconds=10):
+            received.append(frame)
+
+    assert contents(received) == ["partial"]
+
+
+@pytest.mark.asyncio
+async def test_envelope_is_sent_once_and_on_change():
+    result = await collect(send_envelope_once(frames([
+        delta("a"),
+        {},
+        delta("b"),
+        delta("c", history_metadata={"title": "Leave policy"}),
+    ])))
+
+    assert result[0] == delta("a")
+    assert result[1] == {"choices": [{"messages": [{"role": "assistant", "content": "b"}]}]}
+    assert result[2] == {
+        "history_metadata": {"title": "Leave policy"},
+        "choices": [{"messages": [{"role": "assistant", "content": "c"}]}],
+    }
+
+
+@pytest.mark.asyncio
+async def test_hold_last_frame_finalizes_only_the_last_frame():
+    finalized = []
+
+    async def finalize(frame):
+        finalized.append(frame)
+        return delta(frame["choices"][0]["messages"][0]["content"], history_metadata={"title": "Leave policy"})
+
+    result = await collect(hold_last_frame(frames([delta("a"), delta("b"), {}]), finalize))
+
+    assert result == [delta("a"), {}, delta("b", history_metadata={"title": "Leave policy"})]
+    assert finalized == [delta("b")]
+
+
+@pytest.mark.asyncio
+async def test_hold_last_frame_delivers_held_frame_before_errors():
+    async def failing():
+        yield delta("partial")
+        raise RuntimeError("upstream failed")
+
+    async def finalize(frame):
+        raise AssertionError("not called when the stream fails")
+
+    received = []
+    with pytest.raises(RuntimeError):
+        async for frame in hold_last_frame(failing(), finalize):
+            received.append(frame)
+
+    assert received == [delta("partial")]
+
+
+@pytest.mark.asyncio
+async def test_stream_after_waits_then_streams():
+    order = []
+
+    async def wait():
+        order.append("ready")
+
+    async def source():
+        order.append("streaming")
+        yield delta("a")
+
+    assert await collect(stream_after(wait, source())) == [delta("a")]
+    assert order == ["ready", "streaming"]
+
+
+@pytest.mark.asyncio
+async def test_stream_after_closes_stream_when_wait_fails():
+    closed = asyncio.Event()
+
+    async def wait():
+        raise RuntimeError("history write failed")
+
+    async def source():
+        try:
+            yield delta("a")
+        finally:
+            closed.set()
+
+    stream = source()
+    # start the source so closing it runs its cleanup
+    first = await stream.__anext__()
+    assert first == delta("a")
+
+    with pytest.raises(RuntimeError):
+        await collect(stream_after(wait, stream))
+    assert closed.is_set()
+
+
+def test_format_sse_event():
+    assert format_sse_event("a\nb", event_id="s:1", event="message") == "id: s:1\nevent: message\ndata: a\ndata: b\n\n"
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("s:4", "s") == 4
+    assert parse_last_event_id("4", "s") == 4
+    assert parse_last_event_id("other:4", "s") == 0
+    assert parse_last_event_id("s:x", "s") == 0
+    assert parse_last_event_id(None, "s") == 0
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_sends_heartbeats_and_resumes():
+    registry = SSEStreamRegistry()
+    stream_id = registry.start(frames([delta("a"), {}, delta("b")], delay=0.05), owner="user")
+    broadcast = registry.get(stream_id, "user")
+    assert registry.get(stream_id, "someone else") is None
+
+    events = await collect(format_as_sse(broadcast, stream_id, heartbeat_seconds=0.03))
+    assert events[0] == "retry: 3000\n\n"
+    assert ": heartbeat\n\n" in events
+    data_events = [event for event in events if event.startswith("id:")]
+    assert data_events[0].startswith(f"id: {stream_id}:1\n")
+    assert data_events[1].startswith(f"id: {stream_id}:3\n")
+    assert data_events[2] == f"id: {stream_id}:3\nevent: done\ndata: {{}}\n\n"
+
+    # a reconnecting client only receives the events it missed
+    resumed = await collect(format_as_sse(broadcast, stream_id, start=parse_last_event_id(f"{stream_id}:1", stream_id)))
+    assert [event.split("\n")[0] for event in resumed[1:]] == [f"id: {stream_id}:3", f"id: {stream_id}:3"]
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_keeps_producing_after_disconnect():
+    registry = SSEStreamRegistry()
+    stream_id = registry.start(frames([delta("a"), delta("b")], delay=0.02))
+    broadcast = registry.get(stream_id)
+
+    events = format_as_sse(broadcast, stream_id)
+    await events.__anext__()
+    await events.__anext__()
+    await events.aclose()
+
+    resumed = await collect(format_as_sse(broadcast, stream_id, start=1))
+    assert json.loads(resumed[1].split("data: ")[1]) == delta("b")
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_reports_errors():
+    async def failing():
+        yield delta("a")
+        raise RuntimeError("upstream failed")
+
+    registry = SSEStreamRegistry()
+    stream_id = registry.start(failing())
+
+    events = await collect(format_as_sse(registry.get(stream_id), stream_id))
+    assert events[-1].startswith("event: error\ndata: ")
+    assert json.loads(events[-1].split("data: ")[1]) == {"error": "upstream failed"}
@@ -0,0 +1,79 @@
+import asyncio
+import base64
+import json
+import httpx
+import pytest
+from backend.concurrency import SingleFlight
+from backend.security.user_groups import GraphUserGroupsClient, get_token_subject
+
+
+def make_token(oid):
+    payload = base64.urlsafe_b64encode(json.dumps({"oid": oid}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def test_get_token_subject():
+    assert get_token_subject(make_token("user-1")) == "user-1"
+    assert get_token_subject("not-a-jwt") == ""
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_calls():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    single_flight = SingleFlight()
+    results = await asyncio.gather(*(single_flight.run("key", work) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert "key" not in single_flight
+
+
+@pytest.mark.asyncio
+async def test_group_lookup_follows_pages_and_caches():
+    requests_seen = []
+
+    async def handler(request):
+        requests_seen.append(str(request.url))
+        await asyncio.sleep(0.01)
+        if "page2" in str(request.url):
+            return httpx.Response(200, json={"value": [{"id": "g3"}]})
+        return httpx.Response(
+            200,
+            json={
+                "value": [{"id": "g1"}, {"id": "g2"}],
+                "@odata.nextLink": "https://graph.microsoft.com/v1.0/page2"
+            }
+        )
+
+    client = GraphUserGroupsClient(http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    token = make_token("user-1")
+
+    results = await asyncio.gather(*(client.get_group_ids(token) for _ in range(3)))
+    assert results == [("g1", "g2", "g3")] * 3
+    assert len(requests_seen) == 2
+
+    assert await client.get_group_ids(token) == ("g1", "g2", "g3")
+    assert len(requests_seen) == 2
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_group_lookup_errors_are_not_cached():
+    status = 500
+
+    async def handler(request):
+        return httpx.Response(status, json={"value": [{"id": "g1"}]})
+
+    client = GraphUserGroupsClient(http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    token = make_token("user-1")
+
+    assert await client.get_group_ids(token) == ()
+    status = 200
+    assert await client.get_group_ids(token) == ("g1",)
+    await client.close()
@@ -1,5 +1,9 @@
 import pytest
-from backend.utils import format_as_ndjson, parse_multi_columns
+import json
+import logging
+import dataclasses
+from backend import utils
+from backend.utils import format_as_ndjson, json_dumps, json_loads, parse_multi_columns, redact_secrets, RedactedJSON
 
 
 @pytest.mark.asyncio
@@ -8,7 +12,8 @@ async def test_format_as_ndjson():
         yield {"message": "test message\n"}
 
     async for event in format_as_ndjson(dummy_generator()):
-        assert event == '{"message": "test message\\n"}\n'
+        assert event.endswith("\n")
+        assert json.loads(event) == {"message": "test message\n"}
 
 
 @pytest.mark.asyncio
@@ -18,7 +23,7 @@ async def test_format_as_ndjson_exception():
         yield {"message": "test message\n"}
     
     async for event in format_as_ndjson(dummy_generator()):
-        assert event == '{"error": "test exception"}'
+        assert json.loads(event) == {"error": "test exception"}
 
 def test_parse_multi_columns():
     test_pipes = "col1|col2|col3"
@@ -27,3 +32,75 @@ def test_parse_multi_columns():
     assert parse_multi_columns(test_pipes) == ["col1", "col2", "col3"]
     assert parse_multi_columns(test_commas) == ["col1", "col2", "col3"]
     assert parse_multi_columns(test_single) == ["col1"]
+
+
+def test_redact_secrets():
+    messages = [{"role": "user", "content": "my key is abc"}]
+    model_args = {
+        "messages": messages,
+        "extra_body": {
+            "data_sources": [
+                {
+                    "type": "azure_search",
+                    "parameters": {
+                        "index_name": "index",
+                        "authentication": {"type": "api_key", "key": "secret"},
+                        "embedding_dependency": {
+                            "type": "endpoint",
+                            "authentication": {"type": "api_key", "key": "secret"}
+                        },
+                        "encoded_api_key": ""
+                    }
+                }
+            ]
+        }
+    }
+
+    redacted = redact_secrets(model_args)
+    parameters = redacted["extra_body"]["data_sources"][0]["parameters"]
+    assert parameters["authentication"] == {"type": "api_key", "key": "*****"}
+    assert parameters["embedding_dependency"]["authentication"]["key"] == "*****"
+    assert parameters["encoded_api_key"] == ""
+    assert parameters["index_name"] == "index"
+    # the original is untouched and messages are passed through, not copied
+    assert model_args["extra_body"]["data_sources"][0]["parameters"]["authentication"]["key"] == "secret"
+    assert redacted["messages"] is messages
+
+
+def test_redacted_json_is_lazy(caplog):
+    class Unserializable:
+        pass
+
+    # formatting would fail, so this only passes if the debug record is skipped
+    with caplog.at_level(logging.INFO):
+        logging.debug("REQUEST BODY: %s", RedactedJSON({"value": Unserializable()}))
+
+    assert json.loads(str(RedactedJSON({"api_key": "secret"}))) == {"api_key": "*****"}
+
+
+@dataclasses.dataclass
+class _Citation:
+    title: str
+    chunk_id: int
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_json_dumps_matches_stdlib(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(utils, "orjson", None)
+
+    value = {
+        "id": "1",
+        "choices": [{"messages": [{"role": "assistant", "content": "caf\u00e9 \u2603\n"}]}],
+        "citation": _Citation("doc", 3),
+        "count": 2 ** 70,
+        1: None,
+    }
+    encoded = json_dumps(value)
+
+    assert json_loads(encoded) == json.loads(json.dumps(value, cls=utils.JSONEncoder))
+
+
+def test_json_dumps_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        json_dumps({"value": object()})
@@ -0,0 +1,810 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import zlib
+import random
+import asyncio
+import contextvars
+from contextlib import contextmanager
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from backend.history.cosmosdbservice import CosmosConversationClient
+
+#in-memory stand-in for the part of the azure.cosmos.aio container API that
+#backend/history/cosmosdbservice.py uses, with injected latency and an estimate
+#of the request units every call would cost, for load testing the /history routes
+
+# Page size of queries that do not set max_item_count
+DEFAULT_PAGE_SIZE = 100
+
+# Functions that a WHERE clause cannot serve from the index, so every document is read
+SCAN_FUNCTIONS = {"CONTAINS", "ENDSWITH", "LOWER", "UPPER"}
+
+# Label of the request units charged outside of charge_to()
+UNLABELLED = "unlabelled"
+
+_charge_label = contextvars.ContextVar("fake_cosmos_charge_label", default=UNLABELLED)
+
+
+class RequestCharges():
+    """
+    Request units charged per call. The defaults are rough figures for
+    documents of a few KB with the default indexing policy; measure a real
+    account to calibrate them.
+    """
+
+    def __init__(
+        self,
+        read_per_kb: float = 1.0,
+        write_per_kb: float = 5.5,
+        patch_per_kb: float = 6.0,
+        delete_per_kb: float = 5.5,
+        query_page: float = 2.8,
+        query_per_kb: float = 0.4,
+        query_per_document: float = 0.1,
+        cross_partition_page: float = 1.0,
+        failed: float = 1.0,
+    ):
+        self.read_per_kb = read_per_kb
+        self.write_per_kb = write_per_kb
+        self.patch_per_kb = patch_per_kb
+        self.delete_per_kb = delete_per_kb
+        self.query_page = query_page
+        self.query_per_kb = query_per_kb
+        self.query_per_document = query_per_document
+        self.cross_partition_page = cross_partition_page
+        self.failed = failed
+
+
+def _kb(item) -> float:
+    return max(len(json.dumps(item)) / 1024, 1.0)
+
+
+class FakeCosmosContainer():
+    """
+    Keeps the items of one container in memory, keyed by partition key value
+    and id like Cosmos DB does. Every call sleeps latency_ms plus up to
+    jitter_ms either way, and queries sleep once per page. The request
+    charge of each call is added to the operation and to the label set with
+    charge_to(), and is reported in client_connection.last_response_headers
+    like the SDK does.
+
+    Partition key values are hashed onto physical_partitions partitions.
+    Queries are charged for the documents they examine, including the rows
+    an OFFSET skips and every document a CONTAINS scan reads, and queries
+    without a partition key for every physical partition they fan out to.
+    """
+
+    def __init__(
+        self,
+        id: str = "conversations",
+        partition_key_path: str = "/id",
+        physical_partitions: int = 1,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        charges: RequestCharges = None,
+        seed: int = None,
+    ):
+        self.id = id
+        self.partition_key_path = partition_key_path
+        self.physical_partitions = physical_partitions
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.charges = charges or RequestCharges()
+        self._random = random.Random(seed)
+        self._partitions = {}
+        self._failures = {}
+        self.in_flight = 0
+        self.client_connection = _ClientConnection()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.operations = {}
+        self.labels = {}
+        self.max_in_flight = 0
+
+    @contextmanager
+    def charge_to(self, label: str):
+        """Charges the calls made in this context, and in tasks started from it, to label."""
+        token = _charge_label.set(label)
+        try:
+            yield
+        finally:
+            _charge_label.reset(token)
+
+    def fail(self, operation: str, item_id: str, status_code: int = 503):
+        """Makes every later operation (e.g. "delete_item") on item_id fail with status_code."""
+        self._failures[(operation, item_id)] = status_code
+
+    def items(self) -> dict:
+        """All items by id, whatever their partition."""
+        return {item["id"]: item for items in self._partitions.values() for item in items.values()}
+
+    def stats(self) -> dict:
+        return {
+            "items": sum(len(items) for items in self._partitions.values()),
+            "request_charge": round(sum(entry["request_charge"] for entry in self.operations.values()), 2),
+            "max_in_flight": self.max_in_flight,
+            "operations": self.operations,
+            "labels": self.labels,
+        }
+
+    def _charge(self, operation: str, request_charge: float):
+        for entries, key in ((self.operations, operation), (self.labels, _charge_label.get())):
+            entry = entries.setdefault(key, {"count": 0, "request_charge": 0.0})
+            entry["count"] += 1
+            entry["request_charge"] = round(entry["request_charge"] + request_charge, 2)
+        self.client_connection.last_response_headers = {"x-ms-request-charge": str(round(request_charge, 2))}
+
+    async def _delay(self):
+        delay_ms = self.latency_ms
+        if self.jitter_ms:
+            delay_ms += self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(delay_ms, 0.0) / 1000)
+        finally:
+            self.in_flight -= 1
+
+    def _check_failure(self, operation: str, item_id):
+        status_code = self._failures.get((operation, item_id))
+        if status_code:
+            self._charge(operation, self.charges.failed)
+            raise exceptions.CosmosHttpResponseError(status_code=status_code, message=f"Injected failure of {operation} on {item_id}")
+
+    def _partition_key_of(self, item: dict):
+        value = item
+        for name in self.partition_key_path.strip("/").split("/"):
+            value = value.get(name) if isinstance(value, dict) else None
+        return value
+
+    def _find(self, item_id, partition_key):
+        return self._partitions.get(partition_key, {}).get(item_id)
+
+    def _store(self, body: dict) -> dict:
+        if "id" not in body:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message="The input content is invalid because the required properties - 'id; ' - are missing")
+        item = {
+            **json.loads(json.dumps(body)),
+            "_rid": uuid.uuid4().hex[:16],
+            "_self": f"dbs/db/colls/{self.id}/docs/{body['id']}",
+            "_etag": f'"{uuid.uuid4()}"',
+            "_attachments": "attachments/",
+            "_ts": int(time.time()),
+        }
+        self._partitions.setdefault(self._partition_key_of(item), {})[item["id"]] = item
+        return dict(item)
+
+    def _not_found(self, operation: str):
+        self._charge(operation, self.charges.failed)
+        return exceptions.CosmosResourceNotFoundError(status_code=404, message="Entity with the specified id does not exist in the system.")
+
+    async def read(self, **kwargs) -> dict:
+        await self._delay()
+        self._charge("read_container", self.charges.failed)
+        return {"id": self.id, "partitionKey": {"paths": [self.partition_key_path], "kind": "Hash"}}
+
+    async def read_item(self, item, partition_key, **kwargs) -> dict:
+        await self._delay()
+        self._check_failure("read_item", item)
+        found = self._find(item, partition_key)
+        if found is None:
+            raise self._not_found("read_item")
+        self._charge("read_item", self.charges.read_per_kb * _kb(found))
+        return dict(found)
+
+    async def create_item(self, body: dict, **kwargs) -> dict:
+        await self._delay()
+        self._check_failure("create_item", body.get("id"))
+        if self._find(body.get("id"), self._partition_key_of(body)) is not None:
+            self._charge("create_item", self.charges.failed)
+            raise exceptions.CosmosResourceExistsError(status_code=409, message="Entity with the specified id already exists in the system.")
+        item = self._store(body)
+        self._charge("create_item", self.charges.write_per_kb * _kb(item))
+        return item
+
+    async def upsert_item(self, body: dict, **kwargs) -> dict:
+        await self._delay()
+        self._check_failure("upsert_item", body.get("id"))
+        item = self._store(body)
+        self._charge("upsert_item", self.charges.write_per_kb * _kb(item))
+        return item
+
+    async def replace_item(self, item, body: dict, etag: str = None, match_condition: MatchConditions = None, **kwargs) -> dict:
+        await self._delay()
+        self._check_failure("replace_item", item)
+        found = self._find(item, self._partition_key_of(body))
+        if found is None:
+            raise self._not_found("replace_item")
+        self._check_etag("replace_item", found, etag, match_condition)
+        stored = self._store(body)
+        self._charge("replace_item", self.charges.write_per_kb * _kb(stored))
+        return stored
+
+    async def delete_item(self, item, partition_key, **kwargs):
+        await self._delay()
+        self._check_failure("delete_item", item)
+        found = self._find(item, partition_key)
+        if found is None:
+            raise self._not_found("delete_item")
+        del self._partitions[partition_key][item]
+        self._charge("delete_item", self.charges.delete_per_kb * _kb(found))
+
+    async def patch_item(self, item, partition_key, patch_operations: list, filter_predicate: str = None, etag: str = None, match_condition: MatchConditions = None, **kwargs) -> dict:
+        await self._delay()
+        self._check_failure("patch_item", item)
+        found = self._find(item, partition_key)
+        if found is None:
+            raise self._not_found("patch_item")
+        self._check_etag("patch_item", found, etag, match_condition)
+        if filter_predicate and not CosmosQuery.parse_predicate(filter_predicate).matches(found, {}):
+            self._charge("patch_item", self.charges.failed)
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="One of the specified pre-condition is not met.")
+
+        patched = json.loads(json.dumps(found))
+        for operation in patch_operations:
+            _apply_patch(patched, operation)
+        stored = self._store(patched)
+        self._charge("patch_item", self.charges.patch_per_kb * _kb(stored))
+        return stored
+
+    def _check_etag(self, operation, found, etag, match_condition):
+        if etag and match_condition == MatchConditions.IfNotModified and found["_etag"] != etag:
+            self._charge(operation, self.charges.failed)
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="One of the specified pre-condition is not met.")
+
+    def query_items(self, query: str, parameters: list = None, partition_key=None, max_item_count: int = None, **kwargs):
+        values = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+        return FakeQueryIterable(self, CosmosQuery.parse(query), values, partition_key, max_item_count)
+
+    def _physical_partition_of(self, partition_key) -> int:
+        return zlib.crc32(json.dumps(partition_key).encode("utf-8")) % self.physical_partitions
+
+    async def _run_query(self, query, values, partition_key):
+        if partition_key is not None:
+            return _QueryResults(query, values, [list(self._partitions.get(partition_key, {}).values())], fan_out=0)
+
+        partitions = [[] for _ in range(self.physical_partitions)]
+        for key, items in self._partitions.items():
+            partitions[self._physical_partition_of(key)] += items.values()
+        return _QueryResults(query, values, partitions, fan_out=self.physical_partitions)
+
+    def _charge_query_page(self, page: list, examined: int, fan_out: int):
+        request_charge = (
+            self.charges.query_page
+            + self.charges.cross_partition_page * fan_out
+            + self.charges.query_per_document * examined
+            + self.charges.query_per_kb * sum(len(json.dumps(item)) for item in page) / 1024
+        )
+        self._charge("query_items", request_charge)
+
+
+class _QueryResults():
+    """The results of a query, and how many documents each physical partition it ran on matched."""
+
+    def __init__(self, query, values, partitions: list, fan_out: int):
+        matches = [query.match(items, values) for items in partitions]
+        self.fan_out = fan_out
+        self.ordered = bool(query.order_by)
+        self.matched = [len(items) for items in matches]
+        self.scanned = sum(len(items) for items in partitions) if query.scans() else None
+        self.skip, limit = query.window(values)
+        results = query.order([item for items in matches for item in items], values)
+        results = results[self.skip:] if limit is None else results[self.skip:self.skip + limit]
+        self.items = [query.project(item, values) for item in results]
+
+    def examined(self, start: int, returned: int) -> int:
+        """Documents read to return the results from start to start + returned."""
+        if self.scanned is not None:
+            # the first page scans every document of the partitions
+            return self.scanned if start == 0 else 0
+        previous = self._read_for(start) if start else 0
+        return self._read_for(start + returned) - previous
+
+    def _read_for(self, count: int) -> int:
+        needed = self.skip + count
+        if self.fan_out and self.ordered:
+            # each partition reads its own first rows before they are merged
+            return sum(min(matched, needed) for matched in self.matched)
+        return min(sum(self.matched), needed)
+
+
+class _ClientConnection():
+    def __init__(self):
+        self.last_response_headers = {}
+
+
+class FakeQueryIterable():
+    """What query_items returns: iterates the results, or pages of them with by_page()."""
+
+    def __init__(self, container, query, values, partition_key, max_item_count):
+        self.container = container
+        self.query = query
+        self.values = values
+        self.partition_key = partition_key
+        self.page_size = max_item_count if max_item_count and max_item_count > 0 else DEFAULT_PAGE_SIZE
+
+    @property
+    def resumable(self) -> bool:
+        # the SDK cannot continue an ORDER BY query that fans out across partitions
+        return self.partition_key is not None or not self.query.order_by
+
+    def by_page(self, continuation_token: str = None):
+        return FakePageIterator(self, continuation_token)
+
+    async def __aiter__(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+
+class FakePageIterator():
+    def __init__(self, iterable, continuation_token):
+        self.iterable = iterable
+        self.offset = None
+        self._start_token = continuation_token
+        self.results = None
+        self.continuation_token = None
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+
+        iterable = self.iterable
+        container = iterable.container
+        await container._delay()
+        if self.offset is None:
+            # like the service, a bad token fails the first page request
+            if self._start_token and not iterable.resumable:
+                container._charge("query_items", container.charges.failed)
+                raise exceptions.CosmosHttpResponseError(status_code=400, message="Continuation tokens are not supported for cross-partition ORDER BY queries")
+            self.offset = _decode_continuation_token(self._start_token)
+        if self.results is None:
+            self.results = await container._run_query(iterable.query, iterable.values, iterable.partition_key)
+
+        start = self.offset
+        page = self.results.items[start:start + iterable.page_size]
+        self.offset += len(page)
+        self._done = self.offset >= len(self.results.items)
+        # later pages of a query that cannot be resumed still come, just without a token
+        self.continuation_token = json.dumps({"offset": self.offset}) if not self._done and iterable.resumable else None
+
+        container._charge_query_page(page, self.results.examined(start, len(page)), self.results.fan_out)
+        return _FakePage(page)
+
+
+def _decode_continuation_token(continuation_token: str) -> int:
+    if not continuation_token:
+        return 0
+    try:
+        offset = json.loads(continuation_token)["offset"]
+    except (ValueError, TypeError, KeyError):
+        offset = None
+    if not isinstance(offset, int) or offset < 0:
+        raise exceptions.CosmosHttpResponseError(status_code=400, message="Invalid Continuation Token")
+    return offset
+
+
+class _FakePage():
+    def __init__(self, items):
+        self.items = items
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+def _apply_patch(item: dict, operation: dict):
+    *parents, name = operation["path"].strip("/").split("/")
+    target = item
+    for parent in parents:
+        target = target.setdefault(parent, {})
+
+    op = operation["op"]
+    if op in ("set", "add", "replace"):
+        if op == "replace" and name not in target:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Path {operation['path']} does not exist")
+        target[name] = operation["value"]
+    elif op == "remove":
+        target.pop(name, None)
+    elif op == "incr":
+        target[name] = target.get(name, 0) + operation["value"]
+    else:
+        raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Unsupported patch operation {op}")
+
+
+class FakeCosmosDatabase():
+    def __init__(self, id: str):
+        self.id = id
+        self.containers = {}
+
+    async def read(self, **kwargs) -> dict:
+        return {"id": self.id}
+
+    def get_container_client(self, container, **kwargs) -> FakeCosmosContainer:
+        if container not in self.containers:
+            self.containers[container] = FakeCosmosContainer(container)
+        return self.containers[container]
+
+
+class FakeCosmosClient():
+    def __init__(self):
+        self.databases = {}
+
+    def get_database_client(self, database) -> FakeCosmosDatabase:
+        if database not in self.databases:
+            self.databases[database] = FakeCosmosDatabase(database)
+        return self.databases[database]
+
+    async def close(self):
+        pass
+
+
+def fake_conversation_client(container: FakeCosmosContainer = None, database_name: str = "db", enable_message_feedback: bool = False, delete_concurrency: int = 16) -> CosmosConversationClient:
+    """A CosmosConversationClient that talks to container instead of a Cosmos DB account."""
+    container = container or FakeCosmosContainer()
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.cosmosdb_endpoint = "https://fake.documents.azure.com:443/"
+    client.credential = None
+    client.database_name = database_name
+    client.container_name = container.id
+    client.enable_message_feedback = enable_message_feedback
+    client.delete_concurrency = delete_concurrency
+    client.partition_key_path = container.partition_key_path
+    client.cosmosdb_client = FakeCosmosClient()
+    client.database_client = client.cosmosdb_client.get_database_client(database_name)
+    client.database_client.containers[container.id] = container
+    client.container_client = container
+    return client
+
+
+# Cosmos DB SQL: the SELECT statements and filter predicates the client sends
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+        |(?P<number>-?\d+(?:\.\d+)?)
+        |(?P<parameter>@\w+)
+        |(?P<operator><>|!=|<=|>=|=|<|>|\(|\)|,|\.|\*)
+        |(?P<name>[A-Za-z_]\w*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {
+    "SELECT", "TOP", "VALUE", "FROM", "WHERE", "AND", "OR", "NOT", "ORDER", "BY",
+    "ASC", "DESC", "OFFSET", "LIMIT", "TRUE", "FALSE", "NULL", "UNDEFINED",
+}
+
+
+class _Undefined():
+    def __repr__(self):
+        return "undefined"
+
+
+UNDEFINED = _Undefined()
+
+
+def _tokenize(text: str) -> list:
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Syntax error near {text[position:position + 20]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        value = raw = match.group(kind)
+        if kind == "name" and value.upper() in _KEYWORDS:
+            kind, value = "keyword", value.upper()
+        # the raw text keeps the case of property names that are keywords
+        tokens.append((kind, value, raw))
+    return tokens
+
+
+class CosmosQuery():
+    """
+    Parses and runs the Cosmos DB SQL the history client uses: SELECT [TOP n]
+    with * or a list of properties, a WHERE clause of comparisons, AND, OR,
+    NOT, IS_DEFINED, IS_NULL, ARRAY_CONTAINS, CONTAINS, STARTSWITH, ENDSWITH, LOWER and
+    UPPER, ORDER BY, and OFFSET ... LIMIT. Comparisons of undefined values
+    or of values of different types are undefined, as in Cosmos DB, and only
+    items for which the WHERE clause is true are returned.
+    """
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.position = 0
+        self.top = None
+        self.projection = None
+        self.value = False
+        self.alias = "c"
+        self.where = None
+        self.order_by = []
+        self.offset = None
+        self.limit = None
+
+    @classmethod
+    def parse(cls, text: str) -> "CosmosQuery":
+        query = cls(_tokenize(text))
+        query._parse_select()
+        return query
+
+    @classmethod
+    def parse_predicate(cls, text: str) -> "CosmosQuery":
+        """Parses a filter predicate, "FROM c WHERE ..."."""
+        query = cls(_tokenize(text))
+        query._parse_from()
+        query._expect_end()
+        return query
+
+    def _peek(self, offset: int = 0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None, None)
+
+    def _next(self):
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def _accept(self, value) -> bool:
+        if self._peek()[1] == value and self._peek()[0] in ("keyword", "operator"):
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, value):
+        if not self._accept(value):
+            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Syntax error, expected {value} but found {self._peek()[1]}")
+
+    def _expect_end(self):
+        if self.position != len(self.tokens):
+            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Syntax error near {self._peek()[1]}")
+
+    def _parse_select(self):
+        self._expect("SELECT")
+        if self._accept("TOP"):
+            self.top = self._parse_primary()
+        if self._accept("VALUE"):
+            self.value = True
+            self.projection = [self._parse_expression()]
+        elif self._accept("*"):
+            self.projection = None
+        else:
+            self.projection = [self._parse_expression()]
+            while self._accept(","):
+                self.projection.append(self._parse_expression())
+
+        self._parse_from()
+        if self._accept("ORDER"):
+            self._expect("BY")
+            while True:
+                expression = self._parse_expression()
+                descending = self._accept("DESC")
+                if not descending:
+                    self._accept("ASC")
+                self.order_by.append((expression, descending))
+                if not self._accept(","):
+                    break
+        if self._accept("OFFSET"):
+            self.offset = self._parse_primary()
+            self._expect("LIMIT")
+            self.limit = self._parse_primary()
+        self._expect_end()
+
+    def _parse_from(self):
+        self._expect("FROM")
+        kind, _, self.alias = self._next()
+        if kind != "name":
+            raise exceptions.CosmosHttpResponseError(status_code=400, message="Syntax error, expected a collection alias")
+        if self._accept("WHERE"):
+            self.where = self._parse_expression()
+
+    def _parse_expression(self):
+        left = self._parse_and()
+        while self._accept("OR"):
+            left = ("or", left, self._parse_and())
+        return left
+
+    def _parse_and(self):
+        left = self._parse_not()
+        while self._accept("AND"):
+            left = ("and", left, self._parse_not())
+        return left
+
+    def _parse_not(self):
+        if self._accept("NOT"):
+            return ("not", self._parse_not())
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        left = self._parse_primary()
+        kind, value, _ = self._peek()
+        if kind == "operator" and value in ("=", "<>", "!=", "<", ">", "<=", ">="):
+            self.position += 1
+            return ("compare", "<>" if value == "!=" else value, left, self._parse_primary())
+        return left
+
+    def _parse_primary(self):
+        kind, value, _ = self._next()
+        if kind == "operator" and value == "(":
+            expression = self._parse_expression()
+            self._expect(")")
+            return expression
+        if kind == "string":
+            if value.startswith('"'):
+                return ("literal", json.loads(value))
+            return ("literal", re.sub(r"\\(.)", r"\1", value[1:-1]))
+        if kind == "number":
+            return ("literal", float(value) if "." in value else int(value))
+        if kind == "parameter":
+            return ("parameter", value)
+        if kind == "keyword" and value in ("TRUE", "FALSE", "NULL", "UNDEFINED"):
+            return ("literal", {"TRUE": True, "FALSE": False, "NULL": None, "UNDEFINED": UNDEFINED}[value])
+        if kind == "name" and self._peek()[:2] == ("operator", "("):
+            self.position += 1
+            arguments = []
+            if not self._accept(")"):
+                arguments.append(self._parse_expression())
+                while self._accept(","):
+                    arguments.append(self._parse_expression())
+                self._expect(")")
+            return ("function", value.upper(), arguments)
+        if kind == "name" and value == self.alias:
+            path = []
+            while self._accept("."):
+                kind, _, name = self._next()
+                if kind not in ("name", "keyword"):
+                    raise exceptions.CosmosHttpResponseError(status_code=400, message="Syntax error, expected a property name")
+                path.append(name)
+            return ("path", path)
+        raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Syntax error near {value}")
+
+    def evaluate(self, expression, item: dict, values: dict):
+        kind = expression[0]
+        if kind == "literal":
+            return expression[1]
+        if kind == "parameter":
+            return values.get(expression[1], UNDEFINED)
+        if kind == "path":
+            value = item
+            for name in expression[1]:
+                value = value.get(name, UNDEFINED) if isinstance(value, dict) else UNDEFINED
+            return value
+        if kind == "and":
+            results = [self.evaluate(expression[1], item, values), self.evaluate(expression[2], item, values)]
+            if False in results:
+                return False
+            return True if results == [True, True] else UNDEFINED
+        if kind == "or":
+            results = [self.evaluate(expression[1], item, values), self.evaluate(expression[2], item, values)]
+            if True in results:
+                return True
+            return False if results == [False, False] else UNDEFINED
+        if kind == "not":
+            result = self.evaluate(expression[1], item, values)
+            return not result if isinstance(result, bool) else UNDEFINED
+        if kind == "compare":
+            return _compare(expression[1], self.evaluate(expression[2], item, values), self.evaluate(expression[3], item, values))
+        if kind == "function":
+            return _call(expression[1], [self.evaluate(argument, item, values) for argument in expression[2]])
+        raise ValueError(f"Unknown expression {kind}")
+
+    def matches(self, item: dict, values: dict) -> bool:
+        return self.where is None or self.evaluate(self.where, item, values) is True
+
+    def scans(self) -> bool:
+        """Whether the WHERE clause calls a function the index cannot serve."""
+        def calls_scan_function(expression) -> bool:
+            if expression[0] == "function":
+                return expression[1] in SCAN_FUNCTIONS or any(calls_scan_function(argument) for argument in expression[2])
+            return any(isinstance(part, tuple) and calls_scan_function(part) for part in expression[1:])
+        return self.where is not None and calls_scan_function(self.where)
+
+    def match(self, items: list, values: dict) -> list:
+        return [item for item in items if self.matches(item, values)]
+
+    def order(self, items: list, values: dict) -> list:
+        results = list(items)
+        for expression, descending in reversed(self.order_by):
+            results.sort(key=lambda item: _sort_key(self.evaluate(expression, item, values)), reverse=descending)
+        return results
+
+    def window(self, values: dict) -> tuple:
+        """The number of results OFFSET skips, and the most TOP or LIMIT returns (None for no limit)."""
+        skip, limit = 0, None
+        if self.offset is not None:
+            skip, limit = self.evaluate(self.offset, {}, values), self.evaluate(self.limit, {}, values)
+        if self.top is not None:
+            top = self.evaluate(self.top, {}, values)
+            limit = top if limit is None else min(limit, top)
+        return skip, limit
+
+    def execute(self, items: list, values: dict) -> list:
+        skip, limit = self.window(values)
+        results = self.order(self.match(items, values), values)
+        results = results[skip:] if limit is None else results[skip:skip + limit]
+        return [self.project(item, values) for item in results]
+
+    def project(self, item: dict, values: dict):
+        if self.projection is None:
+            return dict(item)
+        if self.value:
+            return self.evaluate(self.projection[0], item, values)
+
+        projected = {}
+        for index, expression in enumerate(self.projection):
+            value = self.evaluate(expression, item, values)
+            if value is not UNDEFINED:
+                name = expression[1][-1] if expression[0] == "path" and expression[1] else f"${index + 1}"
+                projected[name] = value
+        return projected
+
+
+def _type_rank(value) -> int:
+    if value is UNDEFINED:
+        return 0
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, (int, float)):
+        return 3
+    if isinstance(value, str):
+        return 4
+    return 5
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    return (rank, value if rank in (2, 3, 4) else 0)
+
+
+def _compare(operator: str, left, right):
+    if left is UNDEFINED or right is UNDEFINED:
+        return UNDEFINED
+    if _type_rank(left) != _type_rank(right):
+        return UNDEFINED
+    if operator == "=":
+        return left == right
+    if operator == "<>":
+        return left != right
+    if _type_rank(left) not in (2, 3, 4):
+        return UNDEFINED
+    return {"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[operator]
+
+
+def _call(name: str, arguments: list):
+    if name == "IS_DEFINED":
+        return arguments[0] is not UNDEFINED
+    if name == "IS_NULL":
+        return arguments[0] is None
+    if name == "ARRAY_CONTAINS":
+        if not isinstance(arguments[0], list):
+            return UNDEFINED
+        return arguments[1] in arguments[0]
+    if name in ("LOWER", "UPPER"):
+        if not isinstance(arguments[0], str):
+            return UNDEFINED
+        return arguments[0].lower() if name == "LOWER" else arguments[0].upper()
+    if name in ("CONTAINS", "STARTSWITH", "ENDSWITH"):
+        text, fragment = arguments[0], arguments[1]
+        if not isinstance(text, str) or not isinstance(fragment, str):
+            return UNDEFINED
+        if len(arguments) > 2 and arguments[2] is True:
+            text, fragment = text.lower(), fragment.lower()
+        if name == "CONTAINS":
+            return fragment in text
+        return text.startswith(fragment) if name == "STARTSWITH" else text.endswith(fragment)
+    raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Unknown function {name}")
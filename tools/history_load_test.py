@@ -0,0 +1,248 @@
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_cosmos import FakeCosmosContainer, fake_conversation_client
+
+#load generator for the /history routes: runs the app in-process against an
+#in-memory Cosmos DB container and reports throughput, latency and estimated
+#request units per endpoint. No Azure account or network access is needed.
+
+# Relative frequency of each request in the generated load
+DEFAULT_MIX = "list=30,list_deep=5,list_walk=5,read=30,update=15,rename=10,feedback=5"
+
+
+def configure_environment():
+    # the app reads its settings when it is imported; the account is never contacted
+    os.environ.update({
+        "CHAT_HISTORY_BACKEND": "cosmos",
+        "AZURE_COSMOSDB_ACCOUNT": "fake",
+        "AZURE_COSMOSDB_DATABASE": "db",
+        "AZURE_COSMOSDB_CONVERSATIONS_CONTAINER": "conversations",
+        "AZURE_COSMOSDB_ENABLE_FEEDBACK": "true",
+    })
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.partition("=")
+        if name.strip() not in HANDLERS:
+            raise argparse.ArgumentTypeError(f"unknown request {name!r}, expected one of {', '.join(HANDLERS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class Workload():
+    """The seeded users, conversations and assistant messages requests pick from."""
+
+    def __init__(self, users: int, page_size: int):
+        self.page_size = page_size
+        self.user_ids = [str(uuid.uuid4()) for _ in range(users)]
+        self.conversations = {user_id: [] for user_id in self.user_ids}
+        self.answers = {user_id: [] for user_id in self.user_ids}
+
+    async def seed(self, client, conversations: int, messages: int):
+        async def seed_user(user_id):
+            for i in range(conversations):
+                conversation = await client.create_conversation(user_id, title=f"Conversation {i}")
+                input_messages = []
+                for n in range(messages):
+                    role = "user" if n % 2 == 0 else "assistant"
+                    input_messages.append((str(uuid.uuid4()), {"role": role, "content": f"{role} message {n} " * 20}))
+                if input_messages:
+                    await client.create_messages(conversation["id"], user_id, input_messages)
+                self.conversations[user_id].append(conversation["id"])
+                self.answers[user_id] += [message_id for message_id, message in input_messages if message["role"] == "assistant"]
+
+        await asyncio.gather(*[seed_user(user_id) for user_id in self.user_ids])
+
+
+async def list_conversations(client, workload, user_id, rng):
+    return await client.get("/history/list", query_string={"offset": 0}, headers=headers(user_id))
+
+
+async def list_deep_page(client, workload, user_id, rng):
+    # a page past the first, as when the list is opened at a saved offset
+    pages = max((len(workload.conversations[user_id]) - 1) // workload.page_size, 1)
+    offset = rng.randint(1, pages) * workload.page_size
+    return await client.get("/history/list", query_string={"offset": offset}, headers=headers(user_id))
+
+
+async def list_all_pages(client, workload, user_id, rng):
+    # scrolls to the end of the list, following the continuation token of every page
+    query_string = {"offset": 0}
+    while True:
+        response = await client.get("/history/list", query_string=query_string, headers=headers(user_id))
+        token = response.headers.get("X-Continuation-Token")
+        if response.status_code >= 400 or not token:
+            return response
+        await response.get_data()
+        query_string = {"offset": query_string["offset"] + workload.page_size, "continuation_token": token}
+
+
+async def read_conversation(client, workload, user_id, rng):
+    conversation_id = rng.choice(workload.conversations[user_id])
+    return await client.post("/history/read", json={"conversation_id": conversation_id}, headers=headers(user_id))
+
+
+async def update_conversation(client, workload, user_id, rng):
+    conversation_id = rng.choice(workload.conversations[user_id])
+    answer_id = str(uuid.uuid4())
+    response = await client.post("/history/update", json={
+        "conversation_id": conversation_id,
+        "messages": [
+            {"role": "user", "content": "Follow-up question"},
+            {"id": answer_id, "role": "assistant", "content": "Follow-up answer " * 20},
+        ],
+    }, headers=headers(user_id))
+    workload.answers[user_id].append(answer_id)
+    return response
+
+
+async def rename_conversation(client, workload, user_id, rng):
+    conversation_id = rng.choice(workload.conversations[user_id])
+    return await client.post("/history/rename", json={
+        "conversation_id": conversation_id, "title": f"Renamed {rng.randint(0, 999)}"
+    }, headers=headers(user_id))
+
+
+async def message_feedback(client, workload, user_id, rng):
+    message_id = rng.choice(workload.answers[user_id])
+    return await client.post("/history/message_feedback", json={
+        "message_id": message_id, "message_feedback": rng.choice(["positive", "negative"])
+    }, headers=headers(user_id))
+
+
+HANDLERS = {
+    "list": list_conversations,
+    "list_deep": list_deep_page,
+    "list_walk": list_all_pages,
+    "read": read_conversation,
+    "update": update_conversation,
+    "rename": rename_conversation,
+    "feedback": message_feedback,
+}
+
+
+def headers(user_id: str) -> dict:
+    return {"X-Ms-Client-Principal-Id": user_id}
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run(args):
+    configure_environment()
+    import app as app_module
+    from backend.history.list_cache import ListCachingConversationClient
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    container = FakeCosmosContainer(
+        partition_key_path=args.partition_key,
+        physical_partitions=args.physical_partitions,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        seed=args.seed,
+    )
+    conversation_client = fake_conversation_client(container, enable_message_feedback=True)
+    await conversation_client.ensure()
+    if args.list_cache:
+        conversation_client = ListCachingConversationClient(conversation_client, app_module.init_history_list_cache())
+
+    workload = Workload(args.users, app_module.app_settings.chat_history.list_page_size)
+    print(f"Seeding {args.users} users x {args.conversations} conversations x {args.messages} messages...")
+    await workload.seed(conversation_client, args.conversations, args.messages)
+    container.reset_stats()
+
+    # the app's startup would connect to Azure, so the client is installed directly
+    quart_app = app_module.create_app()
+    quart_app.cosmos_conversation_client = conversation_client
+    quart_app.history_list_cache = getattr(conversation_client, "list_cache", None)
+    app_module.cosmos_db_ready.set()
+    test_client = quart_app.test_client()
+
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    remaining = [args.requests]
+
+    async def worker(seed):
+        rng = random.Random(seed)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name = rng.choices(names, weights=[weights[name] for name in names])[0]
+            user_id = rng.choice(workload.user_ids)
+            started = time.perf_counter()
+            with container.charge_to(name):
+                response = await HANDLERS[name](test_client, workload, user_id, rng)
+                await response.get_data()
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors[name] += 1
+
+    print(f"Sending {args.requests} requests with concurrency {args.concurrency}...")
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(args.seed + i if args.seed is not None else None) for i in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    labels = container.stats()["labels"]
+    print()
+    print(f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RU/req':>8} {'RU total':>10}")
+    for name in names:
+        count = len(latencies[name])
+        if not count:
+            continue
+        request_charge = labels.get(name, {}).get("request_charge", 0.0)
+        print(
+            f"{name:<10} {count:>8} {errors[name]:>6} {count / elapsed:>8.1f} "
+            f"{percentile(latencies[name], 0.5):>8.1f} {percentile(latencies[name], 0.95):>8.1f} "
+            f"{percentile(latencies[name], 0.99):>8.1f} {request_charge / count:>8.2f} {request_charge:>10.1f}"
+        )
+
+    total_request_charge = sum(entry["request_charge"] for entry in labels.values())
+    print()
+    print(f"{args.requests} requests in {elapsed:.2f} s: {args.requests / elapsed:.1f} req/s, {total_request_charge / elapsed:.1f} RU/s")
+    print("Cosmos DB calls:")
+    for operation, entry in sorted(container.stats()["operations"].items()):
+        print(f"  {operation:<16} {entry['count']:>8} calls {entry['request_charge']:>10.1f} RU")
+    if quart_app.history_list_cache:
+        print(f"List cache: {quart_app.history_list_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /history routes against an in-memory Cosmos DB container")
+    parser.add_argument("--users", type=int, default=50, help="number of users")
+    parser.add_argument("--conversations", type=int, default=30, help="conversations per user")
+    parser.add_argument("--messages", type=int, default=6, help="messages per conversation")
+    parser.add_argument("--requests", type=int, default=2000, help="total number of requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weights of the requests, default {DEFAULT_MIX}")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="latency of every Cosmos DB call")
+    parser.add_argument("--jitter-ms", type=float, default=2.0, help="random variation of the latency, either way")
+    parser.add_argument("--partition-key", choices=["/id", "/userId"], default="/id", help="partition key path of the container")
+    parser.add_argument("--physical-partitions", type=int, default=4, help="physical partitions cross-partition queries fan out to")
+    parser.add_argument("--list-cache", action="store_true", help="serve the first list page from the in-memory list cache")
+    parser.add_argument("--seed", type=int, default=None, help="seed for repeatable runs")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
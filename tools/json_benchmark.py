@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import timeit
+import argparse
+import uuid
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend import utils
+from backend.utils import JSONEncoder, json_dumps
+
+#micro-benchmark comparing the standard library encoder the app used before with
+#json_dumps, on payloads shaped like a streamed chunk and a /history/read response
+
+def stream_chunk():
+    return {
+        "id": str(uuid.uuid4()),
+        "model": "gpt-4o",
+        "created": 1718000000,
+        "object": "chat.completion.chunk",
+        "choices": [{
+            "messages": [{"role": "assistant", "content": "The quarterly report shows "}]
+        }],
+        "history_metadata": {"conversation_id": str(uuid.uuid4())},
+        "apim-request-id": str(uuid.uuid4()),
+    }
+
+
+def history_read(message_count):
+    messages = []
+    for i in range(message_count):
+        messages.append({
+            "id": str(uuid.uuid4()),
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": "Summarize the onboarding policy for contractors. " * 8,
+            "createdAt": "2024-06-10T12:00:00.000000",
+            "feedback": None,
+        })
+        if i % 2:
+            messages.append({
+                "id": str(uuid.uuid4()),
+                "role": "tool",
+                "content": json.dumps({
+                    "citations": [
+                        {"content": "Policy text " * 60, "title": f"policy-{n}.pdf", "url": None, "chunk_id": str(n)}
+                        for n in range(5)
+                    ],
+                    "intent": "[\"onboarding policy contractors\"]",
+                }),
+                "createdAt": "2024-06-10T12:00:01.000000",
+            })
+    return {"conversation_id": str(uuid.uuid4()), "messages": messages}
+
+
+def bench(label, payload, number):
+    stdlib = timeit.timeit(lambda: json.dumps(payload, cls=JSONEncoder), number=number)
+    fast = timeit.timeit(lambda: json_dumps(payload), number=number)
+    print(f"{label:<24} stdlib {stdlib / number * 1e6:9.1f} us   json_dumps {fast / number * 1e6:9.1f} us   x{stdlib / fast:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON encoding speed for chat payloads")
+    parser.add_argument("--number", type=int, default=2000, help="iterations per payload")
+    parser.add_argument("--messages", type=int, default=50, help="messages in the history payload")
+    args = parser.parse_args()
+
+    print(f"json_dumps backend: {'orjson' if utils.orjson else 'stdlib (orjson not installed)'}")
+    bench("stream chunk", stream_chunk(), args.number)
+    bench(f"history ({args.messages} msgs)", history_read(args.messages), max(1, args.number // 10))
+
+
+if __name__ == "__main__":
+    main()